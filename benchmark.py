@@ -0,0 +1,330 @@
+"""
+Description: A simulation environment for car traffic with cellular automata
+The program encapsules four files: main.py, controller.py, model.py, view.py
+Author: Christian Tognazza
+Datum: 13.04.2023
+"""
+
+import argparse
+import itertools
+import json
+import platform
+import statistics
+import sys
+import time
+
+from model import *
+from view import View
+
+# benchmarks of the hot paths of the model and the view, all runs are seeded
+# usage: python -m benchmark --out bench.json
+#        python -m benchmark --out new.json --baseline bench.json
+# rates are operations per second (ticks, car updates, renders ...), mean and stdev over the repeats,
+# a benchmark is flagged as regression if it is slower than the baseline by more than the threshold
+
+SIZES = [50, 200]
+ROADS = ["2x2", "10x10"]
+# generator delays, a lower delay gives more cars on the roads
+DELAYS = [3, 10]
+SEED = 0
+# ticks run before measuring so the roads are filled with cars
+WARMUP_TICKS = 300
+REPEATS = 5
+# relative slowdown against the baseline that is reported as regression
+REGRESSION_THRESHOLD = 0.1
+
+
+class MockCanvas:
+    # offscreen stand-in for the tkinter canvas of the View, only counts the calls
+    def __init__(self):
+        self.items = 0
+        self.calls = 0
+
+    def delete(self, *items):
+        self.items = 0
+
+    def create_rectangle(self, *coordinates, **options):
+        self.items += 1
+        return self.items
+
+    def itemconfig(self, item, **options):
+        self.calls += 1
+
+
+def build_case_model(case, engine="object"):
+    # seeded model of a benchmark case, warmed up
+    model = Model(case["size"], engine=engine, seed=SEED)
+    num_vertical_roads, num_horizontal_roads = (
+        int(num_roads) for num_roads in case["roads"].split("x"))
+    model.set_num_roads(num_horizontal_roads, "horizontal")
+    model.set_num_roads(num_vertical_roads, "vertical")
+    model.update_generators_delay(case["delay"])
+    for _ in range(WARMUP_TICKS):
+        model.do_tick()
+
+    return model
+
+
+def mock_view(size):
+    # View drawing on a MockCanvas, without a tkinter window
+    view = View.__new__(View)
+    view.size = size
+    view.cell_size = 1
+    view.cells = None
+    view.drawn = None
+    view.raster = MockCanvas()
+
+    return view
+
+
+# every benchmark prepares a case and returns a function that runs one repeat
+# and returns the number of operations and car updates it did
+
+def bench_model_do_tick(case, engine):
+    model = build_case_model(case, engine)
+
+    def repeat():
+        car_updates = 0
+        for _ in range(100):
+            car_updates += model.count_cars()
+            model.do_tick()
+        return 100, car_updates
+
+    return repeat
+
+
+def bench_road_do_tick(case, engine):
+    # the road with the most cars, the other roads stand still and the light signals
+    # are not switched, so this is the car loop of one road and not part of a model tick
+    model = build_case_model(case)
+    road = max(model.roads, key=lambda road: len(road.cars))
+
+    def repeat():
+        car_updates = 0
+        for _ in range(100):
+            car_updates += len(road.cars)
+            road.do_tick()
+        return 100, car_updates
+
+    return repeat
+
+
+def bench_car_do_tick(case, engine):
+    # all cars of the model with a mix of free and blocked distances
+    model = build_case_model(case)
+    cars = [car for road in model.roads for car in road.cars]
+    distances = [NO_OBSTACLE_DISTANCE, 8, 3, 1]
+
+    def repeat():
+        for distance in distances * 25:
+            for car in cars:
+                car.do_tick(distance)
+        return len(cars) * 100, len(cars) * 100
+
+    return repeat
+
+
+def bench_render_road(case, engine):
+    model = build_case_model(case, engine)
+    model.store_engine_cars()
+
+    def repeat():
+        for _ in range(100):
+            model.dynamic_cells = set()
+            for road in model.roads:
+                model.render_road(road)
+        return 100 * len(model.roads), 0
+
+    return repeat
+
+
+def bench_calculate_intersection_light_signals(case, engine):
+    model = build_case_model(case, engine)
+
+    def repeat():
+        for _ in range(10):
+            model.calculate_intersection_light_signals()
+        return 10, 0
+
+    return repeat
+
+
+def bench_set_num_roads(case, engine):
+    # one road added and removed again per operation, the other roads keep running
+    model = build_case_model(case, engine)
+    num_vertical_roads = sum(
+        road.direction == "vertical" for road in model.roads)
+
+    def repeat():
+        for _ in range(10):
+            model.set_num_roads(num_vertical_roads + 1, "vertical")
+            model.set_num_roads(num_vertical_roads, "vertical")
+        return 20, 0
+
+    return repeat
+
+
+def bench_view_draw_grid(case, engine):
+    # one model tick and one drawn frame per operation, the ticks are not part of the timing
+    model = build_case_model(case, engine)
+    view = mock_view(case["size"])
+    view.draw_grid(model.grid, model.border_grid)
+    frames = []
+    for _ in range(20):
+        model.do_tick()
+        frames.append((bytes(model.grid), bytes(
+            model.border_grid), model.changed_cells))
+
+    def repeat():
+        for grid, border_grid, changed_cells in frames:
+            view.draw_grid(grid, border_grid, changed_cells)
+        # full redraws compare every cell
+        for grid, border_grid, _ in frames:
+            view.draw_grid(grid, border_grid)
+        return 2 * len(frames), 0
+
+    return repeat
+
+
+BENCHMARKS = {
+    "Model.do_tick": bench_model_do_tick,
+    "Road.do_tick": bench_road_do_tick,
+    "Car.do_tick": bench_car_do_tick,
+    "Model.render_road": bench_render_road,
+    "Model.calculate_intersection_light_signals": bench_calculate_intersection_light_signals,
+    "Model.set_num_roads": bench_set_num_roads,
+    "View.draw_grid": bench_view_draw_grid,
+}
+# benchmarks of the Road and Car objects, they are only run with the object engine
+OBJECT_ENGINE_BENCHMARKS = ["Road.do_tick", "Car.do_tick"]
+
+
+def measure(repeat, repeats):
+    # run the repeats and return the rates of operations and car updates per second
+    operation_rates, car_update_rates = [], []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        operations, car_updates = repeat()
+        elapsed = time.perf_counter() - start
+        operation_rates.append(operations / elapsed)
+        car_update_rates.append(car_updates / elapsed)
+
+    return {
+        "ops_per_second": summarize(operation_rates),
+        "car_updates_per_second": summarize(car_update_rates),
+    }
+
+
+def summarize(rates):
+    return {
+        "mean": statistics.mean(rates),
+        "stdev": statistics.stdev(rates) if len(rates) > 1 else 0.0,
+        "min": min(rates),
+        "max": max(rates),
+    }
+
+
+def result_key(result):
+    return (result["benchmark"], result["engine"], result["size"], result["roads"], result["delay"])
+
+
+def run_benchmarks(names, sizes, roads, delays, engine="object", repeats=REPEATS):
+    results = []
+    if engine != "object":
+        for name in names:
+            if name in OBJECT_ENGINE_BENCHMARKS:
+                print(f"{name}: skipped, only run with the object engine")
+        names = [name for name in names if name not in OBJECT_ENGINE_BENCHMARKS]
+    for name, size, road_counts, delay in itertools.product(names, sizes, roads, delays):
+        case = {"size": size, "roads": road_counts, "delay": delay}
+        rates = measure(BENCHMARKS[name](case, engine), repeats)
+        result = {"benchmark": name, "engine": engine,
+                  **case, "repeats": repeats, **rates}
+        results.append(result)
+        print_result(result)
+
+    return results
+
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    # benchmarks slower than the baseline by more than the threshold and more than the noise
+    baseline_results = {result_key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        old = baseline_results.get(result_key(result))
+        if old is None:
+            continue
+
+        new_rate = result["ops_per_second"]
+        old_rate = old["ops_per_second"]
+        change = new_rate["mean"] / old_rate["mean"] - 1
+        noise = (new_rate["stdev"] + old_rate["stdev"]) / old_rate["mean"]
+        print(f"{format_case(result)}: {change:+.1%} (noise {noise:.1%})")
+        if change < -threshold and -change > noise:
+            regressions.append((result, change))
+
+    return regressions
+
+
+def format_case(result):
+    return f"{result['benchmark']} [{result['engine']} size={result['size']} roads={result['roads']} delay={result['delay']}]"
+
+
+def print_result(result):
+    rate = result["ops_per_second"]
+    car_rate = result["car_updates_per_second"]
+    line = f"{format_case(result)}: {rate['mean']:.0f} ops/s ± {rate['stdev']:.0f}"
+    if car_rate["mean"] > 0:
+        line += f", {car_rate['mean']:.0f} car updates/s ± {car_rate['stdev']:.0f}"
+    print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="benchmark", description="benchmark the hot paths of the model and the view")
+    parser.add_argument("--benchmark", nargs="+", choices=list(BENCHMARKS),
+                        default=list(BENCHMARKS))
+    parser.add_argument("--size", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--roads", nargs="+", default=ROADS,
+                        help="<vertical>x<horizontal> number of roads")
+    parser.add_argument("--delay", type=int, nargs="+", default=DELAYS,
+                        help="car generator delays, lower = more cars")
+    parser.add_argument("--engine", choices=["object", "numpy", "event"],
+                        default="object")
+    parser.add_argument("--repeats", type=int, default=REPEATS)
+    parser.add_argument("--out", default=None,
+                        help="write the results as JSON")
+    parser.add_argument("--baseline", default=None,
+                        help="JSON results of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help="relative slowdown reported as regression")
+
+    args = parser.parse_args(argv)
+
+    if args.repeats < 2:
+        parser.error("repeats must be at least 2")
+
+    results = run_benchmarks(args.benchmark, args.size, args.roads, args.delay,
+                             engine=args.engine, repeats=args.repeats)
+
+    if args.out is not None:
+        with open(args.out, "w") as out:
+            json.dump({
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "seed": SEED,
+                "results": results,
+            }, out, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as baseline:
+            regressions = compare(results, json.load(baseline)["results"],
+                                  threshold=args.threshold)
+        for result, change in regressions:
+            print(f"REGRESSION {format_case(result)}: {change:+.1%}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,25 +5,59 @@ Author: Christian Tognazza
 Datum: 13.04.2023
 """
 
+import contextlib
+import time
 from tkinter import *
 
 from view import *
 from model import *
+from simulation import *
+from instrumentation import Instrumentation, Timer
+from metrics import TrafficMetrics
+from events import EventLog
+from replay import Replay
 
 # tick delay in ms
 # TICK DELAY 50 --> approx. 1000/50 = 20 FPS
 TICK_DELAY = 50
 
+# frames per second of the view when the model runs on its own thread
+RENDER_FPS = 20
+
+# the instrumentation overlay is updated every x frames
+OVERLAY_INTERVAL = 10
+# file the instrumentation is exported to when the window is closed
+INSTRUMENTATION_FILE = "instrumentation.json"
+
+# ticks per frame a replay can be played with
+REPLAY_SPEEDS = [1, 2, 5, 10, 50]
+
 # Controller class that handles the interaction between the Model and View
 
 
 class Controller:
-    def __init__(self, root, size=50):
+    def __init__(self, root, size=50, engine="object", ticks_per_second=None, instrument=False,
+                 view_backend="cells", metrics=False, log_events=False, replay=None):
         self.root = root
         self.size = size
 
+        # replay = path of a recording (see replay.py), its ticks are shown instead of simulated
+        self.replay = None
+        if replay is not None:
+            if ticks_per_second is not None:
+                raise Exception("a replay is not played on a simulation thread")
+            self.replay = Replay(replay)
+            self.size = self.replay.size
+            self.replay_speed = REPLAY_SPEEDS[0]
+            self.replay_direction = 1
+
+        # "cells" draws a canvas item per cell, "raster" draws the grid as one image
+        if view_backend not in ["cells", "raster"]:
+            raise Exception("view backend must be cells or raster")
+        view_class = View if view_backend == "cells" else RasterView
+
         # initialize the view and model
-        self.view = View(
+        self.view = view_class(
             self.root,
             size=self.size,
             handle_tick=self.handle_tick,
@@ -33,10 +67,52 @@ class Controller:
             handle_set_generator_avg_speed=self.handle_set_generator_avg_speed,
             handle_set_generator_delay=self.handle_set_generator_delay
         )
-        self.model = Model(size=self.size)
+        self.model = Model(size=self.size, engine=engine)
 
         self.is_running = False
 
+        # opt-in timings of the model phases and the drawing, shown as overlay
+        self.instrumentation = None
+        self.frames = 0
+        if instrument:
+            self.instrumentation = Instrumentation()
+            self.model.instrumentation = self.instrumentation
+
+        # opt-in traffic statistics, shown as overlay
+        if metrics and self.replay is None:
+            self.model.set_metrics(TrafficMetrics())
+
+        # print a few of the traffic jams per second to the console
+        if log_events:
+            self.model.set_events(EventLog(kinds=["spawn_blocked"], sink=print))
+
+        # None = one tick per frame on the tkinter thread,
+        # otherwise the model runs on a simulation thread with the given ticks per second
+        # (AS_FAST_AS_POSSIBLE = no limit) and the view draws the newest frame RENDER_FPS times per second
+        self.simulation = None
+        self.next_frame_time = 0
+        if ticks_per_second is not None:
+            self.simulation = SimulationThread(
+                self.model, ticks_per_second=ticks_per_second)
+
+        # slider changes are queued, only the latest value per slider is applied at the next tick
+        # the simulation thread applies its queue itself
+        self.changes = ChangeQueue() if self.simulation is None else self.simulation.changes
+        self.changes_scheduled = False
+
+        if self.replay is not None:
+            self.view.disable_model_controls()
+            self.view.add_replay_controls(
+                self.replay.first_tick,
+                self.replay.last_tick,
+                REPLAY_SPEEDS,
+                handle_seek=self.handle_seek,
+                handle_reverse=self.handle_reverse,
+                handle_replay_speed=self.handle_replay_speed
+            )
+            self.draw_replay()
+            return
+
         self.handle_set_num_roads(1, "horizontal")
         self.handle_set_num_roads(1, "vertical")
 
@@ -55,6 +131,12 @@ class Controller:
 
         self.is_running = True
 
+        if self.simulation is not None:
+            self.simulation.start_simulation()
+            self.next_frame_time = time.perf_counter()
+            self.render_loop()
+            return
+
         self.tick_loop()
 
     # method to stop the simulation
@@ -66,38 +148,72 @@ class Controller:
 
         self.is_running = False
 
+        if self.simulation is not None:
+            self.simulation.stop_simulation()
+
+    # method to jump to a tick of the replay
+    def handle_seek(self, tick):
+        if tick == self.replay.tick:
+            # the slider was moved by draw_replay
+            return
+        self.replay.seek(tick)
+        self.draw_replay()
+
+    # method to switch the direction the replay plays in
+    def handle_reverse(self):
+        self.replay_direction = -self.replay_direction
+        self.draw_replay()
+
+    # method to set the number of ticks the replay moves per frame
+    def handle_replay_speed(self, speed):
+        self.replay_speed = speed
+
     # method to handle the number of roads in the simulation
     def handle_set_num_roads(self, num_roads, direction):
-        self.model.clear_roads(direction)
-        for _ in range(num_roads):
-            while True:
-                try:
-                    self.model.add_road(
-                        Road(
-                            offset=random.randint(1, self.size-2),
-                            direction=direction,
-                            length=self.size,
-                            generator=CarGenerator()
-                        )
-                    )
-                    break
-                except:
-                    # exception arises if offset is already used
-                    # try again with new random value
-                    pass
-
-        self.do_tick()
+        self.queue_change(("num_roads", direction),
+                          lambda: self.model.set_num_roads(num_roads, direction))
 
     # method to handle the average speed of car generators
     def handle_set_generator_avg_speed(self, avg_speed):
-        min_speed = int(avg_speed - (avg_speed / 4))
-        max_speed = int(avg_speed + (avg_speed / 4))
-
-        self.model.update_generators_speed(min_speed, max_speed)
+        self.queue_change("avg_speed",
+                          lambda: self.model.set_generator_avg_speed(avg_speed))
 
     # method to handle the delay of car generators
     def handle_set_generator_delay(self, delay):
-        self.model.update_generators_delay(delay)
+        self.queue_change(
+            "delay", lambda: self.model.update_generators_delay(delay))
+
+    # queue a change of the model, a running simulation applies it before its next tick
+    def queue_change(self, key, change):
+        self.changes.put(key, change)
+        if not self.is_running and not self.changes_scheduled:
+            # no tick is coming, apply the changes once tkinter handled the pending slider events
+            self.changes_scheduled = True
+            self.root.after_idle(self.apply_changes)
+
+    # apply the queued changes without a tick and show them, while the simulation is stopped
+    def apply_changes(self):
+        self.changes_scheduled = False
+        if self.is_running:
+            return
+
+        if self.simulation is not None:
+            if self.simulation.apply_changes():
+                self.draw_frame()
+            return
+
+        if not self.changes.apply():
+            return
+        self.model.render_dynamic_cells()
+        with Timer(self.instrumentation, "View.draw_grid"):
+            self.view.draw_grid(self.model.grid, self.model.border_grid,
+                                self.model.changed_cells)
+
+    # lock that keeps the simulation thread from ticking while the model is read
+    def model_lock(self):
+        if self.simulation is None:
+            return contextlib.nullcontext()
+        return self.simulation.lock
 
     # main loop for ticks when the simulation is running
     def tick_loop(self):
@@ -108,11 +224,93 @@ class Controller:
         self.do_tick()
         self.root.after(TICK_DELAY, self.tick_loop)
 
+    # main loop for frames when the model runs on the simulation thread
+    # frames are drawn at a fixed rate, ticks done in between are not drawn
+    def render_loop(self):
+        if not self.is_running:
+            return
+
+        self.draw_frame()
+
+        # schedule by the frame clock so the frame rate does not drift with the drawing time
+        self.next_frame_time += 1 / RENDER_FPS
+        delay = self.next_frame_time - time.perf_counter()
+        if delay < 0:
+            self.next_frame_time = time.perf_counter()
+            delay = 0
+        self.root.after(int(delay * 1000), self.render_loop)
+
+    # draw the newest frame of the simulation thread, if there is one
+    def draw_frame(self):
+        frame = self.simulation.take_frame()
+        if frame is None:
+            return
+
+        # frames skip ticks, the view compares every cell to what it shows
+        _, grid, border_grid = frame
+        with Timer(self.instrumentation, "View.draw_grid"):
+            self.view.draw_grid(grid, border_grid)
+        self.draw_overlay()
+
     # nethod to perform a single tick, updating the model and view
     def do_tick(self):
-        self.model.do_tick()
-        self.view.draw_grid(self.model.grid, self.model.border_grid)
+        if self.replay is not None:
+            self.do_replay_tick()
+            return
+
+        if self.simulation is not None:
+            self.simulation.step(render=True)
+            self.draw_frame()
+            return
+
+        with Timer(self.instrumentation, "Controller.do_tick"):
+            self.changes.apply()
+            self.model.do_tick()
+            with Timer(self.instrumentation, "View.draw_grid"):
+                self.view.draw_grid(self.model.grid, self.model.border_grid,
+                                    self.model.changed_cells)
+        self.draw_overlay()
+
+    # move the replay by one frame without running the model, it stops at the start or end
+    def do_replay_tick(self):
+        speed = self.replay_speed if self.is_running else 1
+        moving = self.replay.step(self.replay_direction * speed)
+        self.draw_replay()
+        if not moving and self.is_running:
+            self.handle_stop()
+
+    def draw_replay(self):
+        with Timer(self.instrumentation, "View.draw_grid"):
+            self.view.draw_grid(self.replay.grid, self.replay.border_grid,
+                                self.replay.changed_cells)
+        self.view.set_replay_tick(self.replay.tick, self.replay_direction < 0)
+        self.draw_overlay()
+
+    # show the instrumentation and the traffic statistics of the last ticks on the canvas
+    def draw_overlay(self):
+        if self.instrumentation is None and self.model.metrics is None:
+            return
+
+        self.frames += 1
+        if self.frames % OVERLAY_INTERVAL != 0:
+            return
+
+        lines = []
+        if self.model.metrics is not None:
+            with self.model_lock():
+                lines += self.model.metrics.summary_lines(self.model.roads)
+        if self.instrumentation is not None:
+            lines += self.instrumentation.summary_lines()
+        self.view.draw_overlay(lines)
 
     # start the main loop of the tkinter application
     def mainloop(self):
         self.root.mainloop()
+
+        if self.simulation is not None:
+            self.simulation.close()
+        if self.replay is not None:
+            self.replay.close()
+
+        if self.instrumentation is not None:
+            self.instrumentation.export(INSTRUMENTATION_FILE)
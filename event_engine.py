@@ -0,0 +1,977 @@
+"""
+Description: A simulation environment for car traffic with cellular automata
+The program encapsules four files: main.py, controller.py, model.py, view.py
+Author: Christian Tognazza
+Datum: 13.04.2023
+"""
+
+import bisect
+import heapq
+import itertools
+
+from model import *
+
+# EventEngine only updates the cars of a Model that can interact with something in the tick,
+# all other cars sleep until the tick of their next possible interaction:
+#   cruising cars: at or above max_speed with no obstacle closer than DESIRED_CAR_OBSTACLE_DISTANCE,
+#     they wake before they can come close to the car in front or to a light signal that is red then,
+#     or they leave the road in the tick they drive over its end
+#   resting cars: stopped in front of a red light signal or a car,
+#     they wake when the light signal changes or the car in front can have moved
+#   braking cars: slowed down too much to reach the next cell before they stop, their obstacle
+#     stays at the same distance until a light signal in front changes or the car in front moves
+#   accelerating cars: below max_speed with no obstacle closer than DESIRED_CAR_OBSTACLE_DISTANCE
+#     until they reach max_speed, from then on they sleep as cruising cars
+# the cars stay in Road.cars, a sleeping car keeps the state of the tick it fell asleep in
+# the horizon of a car behind another sleeping car is bound by the horizon of that car,
+# so followers wake with the car in front of them
+#
+# every tick only the awake cars are stepped (the same steps as Road.do_tick and Car.do_tick),
+# a sleeping car is only looked at when an awake car behind it needs its position
+# an awake car tries to fall asleep when its state allows it, for at least MIN_SLEEP_TICKS
+#
+# a cruising car adds its speed to its progress every tick, which rounds, so its exact state
+# can only be found by repeating the additions (see materialize), unless speed and progress are
+# coarse enough binary fractions that no addition rounds (then it is one multiplication)
+# positions of other cars are taken from bounds of the summed rounding errors, which decide the
+# cell in almost every tick, only undecided ticks repeat the additions
+# braking cars keep their cell, their speed and progress are found by repeating Car.do_tick
+# accelerating cars reach max_speed within a few ticks, their plan keeps the state of every tick
+# and the plan of the cruise that follows
+# a cruising car behind a sleeping car that cruises at least as fast sleeps until it could come close
+# to that car, so a platoon that keeps its gaps sleeps until its front car wakes
+# cars that follow another car closely brake and accelerate in turns, they stay awake, doing their
+# steps ahead costs as much as doing them
+# runs give exactly the same cars as the object engine
+#
+# rendering, traffic statistics and the trajectory export take the sleeping cars from their plans:
+# the rendered positions are only found when the grid is drawn (see update_car_positions),
+# the export brings the cars up to the sampled tick (see update_cars),
+# while statistics are collected the light signals a cruising car passes are counted at its
+# events and braking and accelerating cars stay awake, the statistics equal the ones of the object engine
+# up to the rounding of the speed sums (like with the numpy engine)
+
+# kinds of sleeping cars
+CRUISING = 0
+RESTING = 1
+BRAKING = 2
+ACCELERATING = 3
+
+# the rounding error of one addition to the progress is at most 2^-45 for sums below 512,
+# 2^-44 leaves some room
+PROGRESS_ERROR_BITS = 44
+# faster cars can pass the car in front within a tick, they never sleep
+MAX_CRUISING_SPEED = 300
+# a braking car adds less than the largest deceleration divisor times its speed to its progress
+MAX_BRAKING_DIVISOR = DECELERATION_SLOWER + MAX_DECELERATION_STRENGTH - 2
+# planning a car costs about as much as stepping it a few ticks, shorter sleeps are not planned
+MIN_SLEEP_TICKS = 8
+# awake cars that cannot sleep are planned again after 2, 4, ... up to this many ticks
+MAX_RETRY_TICKS = 8
+
+
+class Plan:
+    # sleep of a car
+    __slots__ = ["kind", "road_index", "tick", "position", "progress", "speed", "unit", "error",
+                 "distance", "steps", "first", "cruise", "horizon", "exits", "counted"]
+
+    def __init__(self, kind, road_index, tick):
+        self.kind = kind
+        self.road_index = road_index
+        # tick of the state the car object holds
+        self.tick = tick
+        # cruising: position, progress and speed of that tick, progress and speed as
+        # integers in 1 / unit, error = bound of the rounding error of one tick in 1 / unit
+        self.position = 0
+        self.progress = 0
+        self.speed = 0
+        self.unit = 1
+        self.error = 0
+        # braking: distance to the obstacle in every tick of the sleep
+        self.distance = 0
+        # accelerating: (position, progress, speed) at the start of every tick from first up to the horizon
+        self.steps = None
+        self.first = tick
+        # accelerating: plan of the cruise from the horizon on
+        self.cruise = None
+        # first tick in which the car has to be updated
+        self.horizon = tick
+        # cruising car that leaves the road in the horizon tick without meeting anything
+        self.exits = False
+        # cruising car with statistics: light signals before this position are counted
+        self.counted = 0
+
+
+class EventEngine:
+    # the cars stay on the roads, sleeping cars are brought up to the tick by update_cars
+    cars_on_roads = True
+
+    def __init__(self, model):
+        self.model = model
+        # Road.car_positions of the last tick are not filled yet, see update_car_positions
+        self.positions_pending = False
+        self.load_roads()
+
+    def load_roads(self):
+        # every car starts awake and tries to fall asleep at the end of the next tick
+        roads = self.model.roads
+        self.awake = [set(road.cars) for road in roads]
+        # awake cars of a road in road order and their ranks, None = sort them again
+        self.awake_order = [None] * len(roads)
+        self.awake_ranks = [None] * len(roads)
+        # car --> plan of the sleeping cars
+        self.plans = {}
+        # heap of (horizon, order, car, plan), plans that were replaced are dropped when they come up
+        self.wakes = []
+        self.order = itertools.count()
+        # (road index, car) of the awake cars that try to sleep at the end of the tick
+        self.candidates = [(road_index, car) for road_index, road in enumerate(roads)
+                           for car in road.cars]
+        # car --> tick an awake car that could not sleep tries again and the ticks it waited last
+        self.retry_at = {}
+        self.retry_waits = {}
+        # car --> next car in road order (the car in front), None = none
+        self.ahead = {}
+        # car --> rank in road order, the rear car has the lowest rank
+        self.rank = {}
+        for road_index in range(len(roads)):
+            self.link_cars(road_index)
+
+    def link_cars(self, road_index):
+        previous = None
+        for rank, car in enumerate(self.model.roads[road_index].cars):
+            self.rank[car] = rank
+            if previous is not None:
+                self.ahead[previous] = car
+            previous = car
+        if previous is not None:
+            self.ahead[previous] = None
+        self.awake_order[road_index] = None
+
+    def add_awake(self, road_index, car):
+        self.awake[road_index].add(car)
+        order = self.awake_order[road_index]
+        if order is not None:
+            rank = self.rank[car]
+            ranks = self.awake_ranks[road_index]
+            i = bisect.bisect(ranks, rank)
+            order.insert(i, car)
+            ranks.insert(i, rank)
+
+    def remove_awake(self, road_index, car):
+        self.awake[road_index].remove(car)
+        order = self.awake_order[road_index]
+        if order is not None:
+            ranks = self.awake_ranks[road_index]
+            i = bisect.bisect_left(ranks, self.rank[car])
+            del order[i]
+            del ranks[i]
+
+    def store_roads(self):
+        # bring every sleeping car to the current tick, all cars are awake afterwards
+        self.update_car_positions()
+        tick = self.model.tick
+        for car, plan in list(self.plans.items()):
+            self.wake(car, plan, tick)
+        self.wakes = []
+
+    def count_cars(self):
+        return sum(len(road.cars) for road in self.model.roads)
+
+    def refresh_car_positions(self):
+        # the sleeping cars stay asleep
+        tick = self.model.tick
+        for road in self.model.roads:
+            road.car_positions = [self.position_at(
+                car, tick) for car in road.cars]
+        self.positions_pending = False
+
+    def update_car_positions(self):
+        # fill Road.car_positions with the positions at the start of the last tick,
+        # only done for ticks that are rendered
+        if not self.positions_pending:
+            return
+        self.positions_pending = False
+        tick = self.tick_start
+        starts = self.starts
+        for road_index, road in enumerate(self.model.roads):
+            cars = self.start_cars.get(road_index)
+            if cars is None:
+                # the leaving cars were the front ones, a generated car is the rearmost one
+                cars = list(road.cars)
+                if road_index in self.spawned_roads:
+                    del cars[0]
+                cars.extend(self.exited_cars.get(road_index, []))
+            road.car_positions = [starts[car] if car in starts else self.position_at(car, tick)
+                                  for car in cars]
+
+    def update_cars(self):
+        # bring the sleeping cars up to the current tick without waking them
+        tick = self.model.tick
+        for car, plan in self.plans.items():
+            if plan.kind != RESTING:
+                self.materialize(car, plan, tick)
+
+    def do_tick(self):
+        model = self.model
+        tick = model.tick
+        self.tick_start = tick
+        if model.render_grid or model.sparse:
+            # start positions of the cars that are updated in the tick, for update_car_positions
+            self.starts = {}
+            # road index --> cars that left the road, road order at the start of the tick
+            # when cars were not only taken from the front or added at the rear
+            self.exited_cars = {}
+            self.start_cars = {}
+            self.spawned_roads = set()
+            self.positions_pending = True
+        else:
+            self.starts = None
+            self.positions_pending = False
+
+        exiting = self.wake_due(tick)
+        for road_index, road in enumerate(model.roads):
+            self.tick_road(road_index, road, tick, exiting.get(road_index))
+        self.plan_awake(tick + 1)
+
+    def is_idle(self):
+        # cruising and braking cars change, resting and awake cars are checked like by Road
+        if any(plan.kind != RESTING for plan in self.plans.values()):
+            return False
+        return all(road.is_idle() for road in self.model.roads)
+
+    def is_spawn_blocked(self, road_index):
+        # only asked while the model is idle, every sleeping car is resting
+        return self.model.roads[road_index].is_spawn_blocked()
+
+    def wake_due(self, tick):
+        # plan again or wake the cars whose horizon came up,
+        # returns road index --> cruising cars that leave their road in this tick
+        exiting = {}
+        wakes = self.wakes
+        counting = self.model.metrics is not None
+        while wakes and wakes[0][0] <= tick:
+            _, _, car, plan = heapq.heappop(wakes)
+            if self.plans.get(car) is not plan:
+                continue
+
+            if plan.kind == CRUISING:
+                plan.horizon, plan.exits = self.cruising_horizon(
+                    car, plan, tick)
+                if counting and not (plan.exits and plan.horizon == tick):
+                    # wake before the next light signal the car could pass
+                    lowest, _ = self.position_bounds(plan, tick + 1)
+                    crossing = self.crossing_tick(plan, lowest)
+                    if crossing is not None and crossing < plan.horizon:
+                        plan.horizon = max(crossing, tick)
+                        plan.exits = False
+            elif plan.kind == RESTING:
+                plan.horizon = self.resting_horizon(
+                    car, plan.road_index, tick)
+            elif plan.kind == ACCELERATING:
+                # at max_speed, the car goes on with the cruise planned with the acceleration
+                self.materialize(car, plan, tick)
+                plan = plan.cruise
+                self.plans[car] = plan
+            else:
+                distance, horizon = self.braking_horizon(
+                    car, plan.road_index, tick)
+                plan.horizon = horizon if distance == plan.distance else tick
+
+            if plan.exits and plan.horizon == tick:
+                exiting.setdefault(plan.road_index, []).append(car)
+            elif plan.horizon >= tick + MIN_SLEEP_TICKS or plan.exits:
+                if counting and plan.kind == CRUISING:
+                    # the car sleeps through the tick, count the light signals it passes
+                    self.count_passed(plan, self.position_at(car, tick + 1))
+                heapq.heappush(
+                    wakes, (plan.horizon, next(self.order), car, plan))
+            else:
+                self.wake(car, plan, tick)
+
+        return exiting
+
+    def tick_road(self, road_index, road, tick, exiting_sleepers):
+        # same as Road.do_tick for the awake cars and the sleeping cars that leave the road
+        cars_sorted = road.cars_sorted
+        exiting = 0
+        if exiting_sleepers is not None:
+            exiting = len(exiting_sleepers)
+            self.exit_sleepers(road, exiting_sleepers, tick)
+
+        awake = self.awake[road_index]
+        if awake:
+            if road.light_signals_changed:
+                road.index_light_signals()
+            order = self.awake_order[road_index]
+            if order is None:
+                rank = self.rank
+                order = sorted(awake, key=rank.__getitem__)
+                self.awake_order[road_index] = order
+                self.awake_ranks[road_index] = [rank[car] for car in order]
+
+            plans = self.plans
+            ahead_of = self.ahead
+            starts = self.starts
+            metrics = road.metrics
+            candidates = self.candidates
+            retry_at = self.retry_at
+            light_signals = road.light_signals
+            next_light_signal = road.next_light_signal
+            next_red_light_signal = road.next_red_light_signal
+            last = road.length - 1
+            can_plan = metrics is None
+            # front to rear, the car in front is either the awake car before or a sleeping car,
+            # the start position of an awake car in front is kept when it moves
+            previous = None
+            previous_start = 0
+            for car in reversed(order):
+                start = car.position
+                red = next_red_light_signal[next_light_signal[start]]
+                distance = NO_OBSTACLE_DISTANCE if red is None else light_signals[red].position - start
+                ahead = ahead_of[car]
+                ahead_sleeps = ahead is not previous
+                if ahead is None:
+                    ahead_sleeps = False
+                elif not ahead_sleeps:
+                    ahead_start = previous_start
+                    if ahead_start - start < distance:
+                        distance = ahead_start - start
+                else:
+                    # position of the sleeping car like position_at, exact right away for most cruising cars
+                    plan = plans[ahead]
+                    if plan.kind == ACCELERATING:
+                        ahead_start = plan.steps[tick - plan.first][0]
+                    elif plan.kind != CRUISING:
+                        ahead_start = ahead.position
+                    elif plan.error == 0:
+                        ahead_start = plan.position + \
+                            (plan.progress + (tick - plan.tick) * plan.speed) // (100 * plan.unit)
+                    else:
+                        ahead_start = self.position_at(ahead, tick)
+                    if ahead_start - start < distance:
+                        distance = ahead_start - start
+
+                # same as Car.do_tick
+                speed = old_speed = car.speed
+                if distance < DESIRED_CAR_OBSTACLE_DISTANCE:
+                    strength = 1 + DESIRED_CAR_OBSTACLE_DISTANCE - distance
+                    if strength == MAX_DECELERATION_STRENGTH:
+                        speed -= speed
+                    else:
+                        divisor = DECELERATION_SLOWER + MAX_DECELERATION_STRENGTH - strength
+                        if divisor <= 0:
+                            divisor = 1
+                        speed -= speed / divisor
+                    if speed < 0:
+                        speed = 0
+                    car.speed = speed
+                elif speed < car.max_speed:
+                    speed += car.max_speed / ACCELERATION_DIVIDER
+                    car.speed = speed
+                progress = car.progress + speed
+                position = start
+                if progress >= 100:
+                    position += int(progress // 100)
+                    progress = progress % 100
+                    car.position = position
+                car.progress = progress
+                previous = car
+                previous_start = start
+
+                if starts is not None:
+                    starts[car] = start
+                if metrics is not None:
+                    metrics.update_car(start, old_speed,
+                                       position, speed)
+                if position > last:
+                    exiting += 1
+                # only a car that moved beyond the start position of the car in front can have passed it
+                if ahead is not None and position > ahead_start:
+                    if position > (self.position_at(ahead, tick + 1) if ahead_sleeps else ahead.position):
+                        cars_sorted = False
+                    continue
+                if position > last:
+                    continue
+
+                # cheap checks whether the car could sleep, plan_car does the exact ones:
+                # an awake car close in front can move in the next tick,
+                # a slower car has to brake without moving or to accelerate without an obstacle,
+                # a car that accelerates or cruises needs room for MIN_SLEEP_TICKS in front of it,
+                # unless it cruises behind a sleeping car that cruises at least as fast
+                if ahead is not None and not ahead_sleeps and \
+                        ahead_start - position < DESIRED_CAR_OBSTACLE_DISTANCE:
+                    continue
+                if speed == 0:
+                    pass
+                elif speed < car.max_speed:
+                    if not can_plan:
+                        continue
+                    if distance < DESIRED_CAR_OBSTACLE_DISTANCE:
+                        if progress + speed * MAX_BRAKING_DIVISOR >= 100:
+                            continue
+                    elif (start + distance - DESIRED_CAR_OBSTACLE_DISTANCE - position) * 100 - progress < \
+                            car.max_speed * MIN_SLEEP_TICKS:
+                        continue
+                elif speed >= MAX_CRUISING_SPEED:
+                    continue
+                elif ahead is not None and \
+                        (ahead_start - DESIRED_CAR_OBSTACLE_DISTANCE - position) * 100 - progress < \
+                        speed * MIN_SLEEP_TICKS and \
+                        not (ahead_sleeps and plan.kind == CRUISING and plan.speed - plan.error >= speed * plan.unit):
+                    continue
+                if retry_at.get(car, 0) <= tick:
+                    candidates.append((road_index, car))
+
+        if not cars_sorted:
+            road.cars_sorted = False
+            if exiting:
+                self.exit_unsorted(road_index, road, tick)
+        elif exiting:
+            self.exit_front(road_index, road, tick, exiting)
+
+        # generate new car if wanted
+        car = road.generator.do_tick()
+        if car is not None:
+            self.spawn(road_index, road, car, tick + 1)
+
+    def exit_sleepers(self, road, cars, tick):
+        # cruising cars that drive over the end of the road in the tick
+        starts = self.starts
+        metrics = road.metrics
+        for car in cars:
+            if starts is not None:
+                starts[car] = self.position_at(car, tick)
+            if metrics is not None:
+                metrics.update_car(self.position_at(car, tick), car.speed,
+                                   self.position_at(car, tick + 1), car.speed)
+
+    def exit_front(self, road_index, road, tick, exiting):
+        # cars in order --> the leaving cars are the front ones
+        cars = road.cars
+        leaving = [cars[i] for i in range(len(cars) - exiting, len(cars))]
+        if road.events is not None:
+            for car in leaving:
+                road.events.emit("car_exit", road, self.position_at(
+                    car, tick + 1), car.number)
+
+        for _ in range(exiting):
+            cars.pop()
+        for car in leaving:
+            self.remove_car(road_index, car)
+        if cars:
+            self.ahead[cars[-1]] = None
+        road.exited += exiting
+        if self.starts is not None:
+            self.exited_cars[road_index] = leaving
+
+    def exit_unsorted(self, road_index, road, tick):
+        # a car passed the car in front of it, find the leaving cars like Road.do_tick
+        if self.starts is not None:
+            self.start_cars[road_index] = list(road.cars)
+        self.materialize_road(road_index, tick + 1)
+        leaving = [car for car in road.cars if car.position > road.length - 1]
+        if road.events is not None:
+            for car in leaving:
+                road.events.emit("car_exit", road, car.position, car.number)
+        for car in leaving:
+            self.remove_car(road_index, car)
+        road.set_cars(
+            car for car in road.cars if car.position <= road.length - 1)
+        road.cars_sorted = False
+        road.exited += len(leaving)
+        self.link_cars(road_index)
+
+    def remove_car(self, road_index, car):
+        if car in self.awake[road_index]:
+            self.remove_awake(road_index, car)
+        self.plans.pop(car, None)
+        self.retry_at.pop(car, None)
+        self.retry_waits.pop(car, None)
+        del self.ahead[car]
+        del self.rank[car]
+
+    def spawn(self, road_index, road, car, tick):
+        # add a generated car like Road.do_tick, with the exact position of the rearmost car
+        cars = road.cars
+        rear = self.position_at(cars[0], tick) if cars else None
+        if road.cars_sorted and (rear is None or rear >= car.position):
+            taken = rear == car.position
+        else:
+            self.materialize_road(road_index, tick)
+            taken = road.is_position_taken(car.position)
+        if taken:
+            road.block_spawn()
+            return
+
+        car.number = road.spawned
+        if road.cars_sorted and (rear is None or rear > car.position):
+            self.ahead[car] = cars[0] if cars else None
+            self.rank[car] = self.rank[cars[0]] - 1 if cars else 0
+            cars.appendleft(car)
+            if self.starts is not None:
+                self.spawned_roads.add(road_index)
+        else:
+            if self.starts is not None and road_index not in self.start_cars:
+                self.start_cars[road_index] = list(
+                    cars) + self.exited_cars.get(road_index, [])
+            self.materialize_road(road_index, tick)
+            road.add_car(car)
+            self.link_cars(road_index)
+        self.add_awake(road_index, car)
+        self.candidates.append((road_index, car))
+        road.spawned += 1
+        if road.metrics is not None:
+            road.metrics.add_car(car.position, car.speed)
+
+    def plan_awake(self, tick):
+        # let the awake cars that could sleep fall asleep, front to rear,
+        # so a car can be planned behind the plan of the car in front of it
+        candidates = self.candidates
+        self.candidates = []
+        for road_index, car in candidates:
+            if car not in self.awake[road_index]:
+                continue
+            plan = self.plan_car(car, road_index, tick)
+            if plan is None:
+                wait = min(2 * self.retry_waits.get(car, 1), MAX_RETRY_TICKS)
+                self.retry_waits[car] = wait
+                self.retry_at[car] = tick + wait
+                continue
+
+            self.remove_awake(road_index, car)
+            self.retry_at.pop(car, None)
+            self.retry_waits.pop(car, None)
+            self.plans[car] = plan
+            heapq.heappush(
+                self.wakes, (plan.horizon, next(self.order), car, plan))
+
+    def plan_car(self, car, road_index, tick):
+        # plan of an awake car, None if it would sleep for less than MIN_SLEEP_TICKS
+        plan = None
+        if car.speed == 0:
+            plan = Plan(RESTING, road_index, tick)
+            plan.horizon = self.resting_horizon(car, road_index, tick)
+        elif car.max_speed <= car.speed < MAX_CRUISING_SPEED:
+            # a car that can reach the one ahead in the next tick stays awake, no need to plan it
+            ahead = self.ahead[car]
+            if ahead is not None and ahead not in self.plans and \
+                    car.position + (car.progress + car.speed) / 100 > ahead.position - DESIRED_CAR_OBSTACLE_DISTANCE:
+                return None
+            plan = Plan(CRUISING, road_index, tick)
+            self.anchor(plan, car, tick)
+            plan.horizon, plan.exits = self.cruising_horizon(car, plan, tick)
+            if self.model.metrics is not None:
+                plan.counted = car.position
+                crossing = self.crossing_tick(plan, car.position)
+                if crossing is not None and crossing < plan.horizon:
+                    plan.horizon = max(crossing, tick)
+                    plan.exits = False
+        elif self.model.metrics is None and car.progress + car.speed * MAX_BRAKING_DIVISOR < 100:
+            plan = Plan(BRAKING, road_index, tick)
+            plan.distance, plan.horizon = self.braking_horizon(
+                car, road_index, tick)
+            if plan.distance >= DESIRED_CAR_OBSTACLE_DISTANCE:
+                plan = None
+
+        if plan is not None and plan.horizon >= tick + MIN_SLEEP_TICKS:
+            return plan
+        if car.speed < car.max_speed and self.model.metrics is None:
+            return self.accelerating_plan(car, road_index, tick)
+        return None
+
+    def accelerating_plan(self, car, road_index, tick):
+        # plan of a car that accelerates up to max_speed without meeting an obstacle and cruises on,
+        # None if it cannot or would sleep for less than MIN_SLEEP_TICKS,
+        # the steps are the ones of Car.do_tick without an obstacle
+        road = self.model.roads[road_index]
+        if road.light_signals_changed:
+            road.index_light_signals()
+        light_signals = road.light_signals
+        next_light_signal = road.next_light_signal
+        last = road.length - 1
+        max_speed = car.max_speed
+        ahead = self.ahead[car]
+        if ahead is not None:
+            ahead_position, _ = self.known_position(ahead, tick)
+
+        position, progress, speed = car.position, car.progress, car.speed
+        steps = [(position, progress, speed)]
+        while speed < max_speed:
+            t = tick + len(steps) - 1
+            # no red light signal and no car in front closer than DESIRED_CAR_OBSTACLE_DISTANCE
+            i = next_light_signal[position]
+            while i < len(light_signals) and \
+                    light_signals[i].position - position < DESIRED_CAR_OBSTACLE_DISTANCE:
+                if light_signals[i].state_at(t) == 0:
+                    return None
+                i += 1
+            if ahead is not None and ahead_position - position < DESIRED_CAR_OBSTACLE_DISTANCE:
+                ahead_position, _ = self.known_position(ahead, t)
+                if ahead_position - position < DESIRED_CAR_OBSTACLE_DISTANCE:
+                    return None
+
+            speed += max_speed / ACCELERATION_DIVIDER
+            progress += speed
+            if progress >= 100:
+                position += int(progress // 100)
+                progress = progress % 100
+            # the car leaves the road or passes the car in front awake
+            if position > last:
+                return None
+            if ahead is not None and position > ahead_position:
+                ahead_position, _ = self.known_position(ahead, t + 1)
+                if position > ahead_position:
+                    return None
+            steps.append((position, progress, speed))
+        if speed >= MAX_CRUISING_SPEED:
+            return None
+
+        # the cruise from the state at max_speed
+        horizon = tick + len(steps) - 1
+        state = Car(speed=speed, max_speed=max_speed, position=position)
+        state.progress = progress
+        cruise = Plan(CRUISING, road_index, horizon)
+        self.anchor(cruise, state, horizon)
+        cruise.horizon, cruise.exits = self.cruising_horizon(
+            car, cruise, horizon)
+        if cruise.horizon < tick + MIN_SLEEP_TICKS and not cruise.exits:
+            return None
+
+        plan = Plan(ACCELERATING, road_index, tick)
+        plan.steps = steps
+        plan.horizon = horizon
+        plan.cruise = cruise
+        return plan
+
+    def known_position(self, car, tick):
+        # lowest position of a car at the start of the tick and whether it is exact,
+        # an awake car or a car after the horizon of its plan is at least where it is known to be
+        plan = self.plans.get(car)
+        if plan is None:
+            return car.position, False
+        exact = tick <= plan.horizon
+        if not exact:
+            tick = plan.horizon
+        if plan.kind == ACCELERATING:
+            return plan.steps[tick - plan.first][0], exact
+        if plan.kind == CRUISING:
+            lowest, highest = self.position_bounds(plan, tick)
+            return lowest, exact and lowest == highest
+        return car.position, exact
+
+    def anchor(self, plan, car, tick):
+        # take the state of the car object as the state of the tick
+        progress, progress_unit = float(car.progress).as_integer_ratio()
+        speed, speed_unit = float(car.speed).as_integer_ratio()
+        unit = max(progress_unit, speed_unit)
+        if (100 + car.speed) * unit <= 1 << 53:
+            # no sum below 100 + speed rounds, the progress is exact
+            error = 0
+        else:
+            unit = max(unit, 1 << PROGRESS_ERROR_BITS)
+            error = unit >> PROGRESS_ERROR_BITS
+
+        plan.tick = tick
+        plan.position = car.position
+        plan.progress = progress * (unit // progress_unit)
+        plan.speed = speed * (unit // speed_unit)
+        plan.unit = unit
+        plan.error = error
+
+    def wake(self, car, plan, tick):
+        if plan.kind != RESTING:
+            self.materialize(car, plan, tick)
+        del self.plans[car]
+        self.add_awake(plan.road_index, car)
+
+    def materialize(self, car, plan, tick):
+        # bring the state of a cruising, braking or accelerating car to the tick
+        if tick <= plan.tick:
+            return
+        if self.positions_pending and plan.tick <= self.tick_start < tick and car not in self.starts:
+            # the rendered position is the one at the start of the last tick
+            self.starts[car] = self.position_at(car, self.tick_start)
+        ticks = tick - plan.tick
+
+        if plan.kind == ACCELERATING:
+            car.position, car.progress, car.speed = plan.steps[tick - plan.first]
+            plan.tick = tick
+            return
+        if plan.kind == BRAKING:
+            # the obstacle was at the same distance in every tick in between
+            for _ in range(ticks):
+                car.do_tick(plan.distance)
+            plan.tick = tick
+            return
+
+        # every tick in between was a free move
+        if plan.error == 0:
+            total = plan.progress + ticks * plan.speed
+            cells, progress = divmod(total, 100 * plan.unit)
+            car.position = plan.position + cells
+            car.progress = progress / plan.unit
+        else:
+            # same additions as Car.do_tick
+            position, progress, speed = car.position, car.progress, car.speed
+            for _ in range(ticks):
+                progress += speed
+                if progress >= 100:
+                    position += int(progress // 100)
+                    progress = progress % 100
+            car.position = position
+            car.progress = progress
+        self.anchor(plan, car, tick)
+
+    def materialize_road(self, road_index, tick):
+        # wake all cars of a road
+        for car in self.model.roads[road_index].cars:
+            plan = self.plans.get(car)
+            if plan is not None:
+                self.wake(car, plan, tick)
+
+    def position_at(self, car, tick):
+        # exact position of a car at the start of a tick it is free in
+        plan = self.plans.get(car)
+        if plan is None:
+            return car.position
+        if plan.kind != CRUISING:
+            if plan.kind == ACCELERATING:
+                return plan.steps[tick - plan.first][0]
+            return car.position
+
+        ticks = tick - plan.tick
+        scale = 100 * plan.unit
+        lowest = plan.position + \
+            (plan.progress + ticks * (plan.speed - plan.error)) // scale
+        if plan.error == 0 or \
+                lowest == plan.position + (plan.progress + ticks * (plan.speed + plan.error)) // scale:
+            return lowest
+        self.materialize(car, plan, tick)
+        return car.position
+
+    def position_bounds(self, plan, tick):
+        ticks = tick - plan.tick
+        scale = 100 * plan.unit
+        return (plan.position + (plan.progress + ticks * (plan.speed - plan.error)) // scale,
+                plan.position + (plan.progress + ticks * (plan.speed + plan.error)) // scale)
+
+    def first_tick_at(self, plan, position, could):
+        # first tick the cruising car could (or surely does) start at the position or beyond
+        needed = (position - plan.position) * 100 * plan.unit - plan.progress
+        if needed <= 0:
+            return plan.tick
+        speed = plan.speed + plan.error if could else plan.speed - plan.error
+        return plan.tick - (-needed // speed)
+
+    def reach_tick(self, car, cells, tick):
+        # first tick the awake car could start cells cells further, accelerating as much as it can
+        needed = 100 * cells - car.progress
+        acceleration = car.max_speed / ACCELERATION_DIVIDER
+        top_speed = max(car.speed, car.max_speed + acceleration)
+        speed = car.speed
+        moved = 0
+        while moved < needed:
+            # some room for the rounding of the additions
+            speed = min(speed + acceleration, top_speed) + 1e-9
+            moved += speed
+            tick += 1
+        return tick
+
+    def crossing_tick(self, plan, position):
+        # last tick before the cruising car could pass the first light signal at or after the position,
+        # None if there is none, the statistics count the light signal in the tick it is passed
+        road = self.model.roads[plan.road_index]
+        if position >= road.length:
+            return None
+        i = road.next_light_signal[position]
+        if i == len(road.light_signals):
+            return None
+        return self.first_tick_at(plan, road.light_signals[i].position + 1, True) - 1
+
+    def count_passed(self, plan, position):
+        # count the light signals the sleeping car passed up to the position
+        metrics = self.model.roads[plan.road_index].metrics
+        light_signals = metrics.light_signals
+        i = metrics.segment(plan.counted)
+        while i < len(light_signals) and light_signals[i].position < position:
+            light_signals[i].flow.add(1)
+            i += 1
+        plan.counted = position
+
+    def cruising_horizon(self, car, plan, tick):
+        # first tick at or after tick the cruising car could meet an obstacle or leaves the road,
+        # and if it leaves the road then without meeting anything
+        road = self.model.roads[plan.road_index]
+        if road.light_signals_changed:
+            road.index_light_signals()
+
+        # the car drives over the end of the road in the tick before it is beyond it
+        horizon = self.first_tick_at(plan, road.length, True) - 1
+        exits = horizon == self.first_tick_at(plan, road.length, False) - 1
+
+        # a light signal that is red while the car can be up to 3 cells in front of it
+        lowest, _ = self.position_bounds(plan, tick)
+        light_signals = road.light_signals
+        i = road.next_light_signal[lowest] if lowest < road.length else len(
+            light_signals)
+        while i < len(light_signals):
+            light_signal = light_signals[i]
+            first = max(tick, self.first_tick_at(
+                plan, light_signal.position - DESIRED_CAR_OBSTACLE_DISTANCE + 1, True))
+            if first > horizon:
+                break
+            last = self.first_tick_at(
+                plan, light_signal.position + 1, False) - 1
+            if last >= first and (light_signal.state_at(first) == 0 or
+                                  light_signal.next_change_tick(first) <= last):
+                horizon = first
+                exits = False
+                break
+            i += 1
+
+        ahead = self.ahead[car]
+        if ahead is not None:
+            close = self.closing_tick(plan, ahead, tick)
+            if close <= horizon:
+                horizon = close
+                exits = False
+
+        return max(horizon, tick), exits
+
+    def closing_tick(self, plan, ahead, tick):
+        # first tick the cruising car could be closer than DESIRED_CAR_OBSTACLE_DISTANCE to the car ahead,
+        # positions of cars never go down
+        ahead_plan = self.plans.get(ahead)
+        if ahead_plan is not None and ahead_plan.kind == ACCELERATING:
+            # compare the upper bound with every step of the car ahead
+            steps, first = ahead_plan.steps, ahead_plan.first
+            for t in range(tick, ahead_plan.horizon + 1):
+                _, highest = self.position_bounds(plan, t)
+                if highest > steps[t - first][0] - DESIRED_CAR_OBSTACLE_DISTANCE:
+                    return t
+            return max(ahead_plan.horizon + 1, self.first_tick_at(
+                plan, steps[-1][0] - DESIRED_CAR_OBSTACLE_DISTANCE + 1, True))
+        if ahead_plan is None or ahead_plan.kind != CRUISING:
+            return max(tick, self.first_tick_at(
+                plan, ahead.position - DESIRED_CAR_OBSTACLE_DISTANCE + 1, True))
+
+        # both cruise until the horizon of the car ahead, compare their bounds as lines:
+        # the car can only come close once its upper line is less than 4 cells behind the lower line ahead
+        unit = max(plan.unit, ahead_plan.unit)
+        scale, ahead_scale = unit // plan.unit, unit // ahead_plan.unit
+        speed = (plan.speed + plan.error) * scale
+        ahead_speed = (ahead_plan.speed - ahead_plan.error) * ahead_scale
+        offset = (plan.position * 100 * unit + plan.progress * scale - plan.tick * speed) - \
+            (ahead_plan.position * 100 * unit + ahead_plan.progress * ahead_scale -
+             ahead_plan.tick * ahead_speed)
+        limit = -DESIRED_CAR_OBSTACLE_DISTANCE * 100 * unit
+        slope = speed - ahead_speed
+        if tick * slope + offset > limit:
+            close = tick
+        elif slope <= 0:
+            close = None
+        else:
+            close = (limit - offset) // slope + 1
+        if close is not None and close <= ahead_plan.horizon:
+            return close
+
+        # after its horizon the car ahead is at least where it was then
+        lowest, _ = self.position_bounds(ahead_plan, ahead_plan.horizon)
+        return max(ahead_plan.horizon + 1, self.first_tick_at(
+            plan, lowest - DESIRED_CAR_OBSTACLE_DISTANCE + 1, True))
+
+    def step_tick_at(self, plan, position, tick):
+        # first tick at or after tick the accelerating car starts at the position or beyond,
+        # the tick after its horizon if it does not before
+        steps, first = plan.steps, plan.first
+        for t in range(tick, plan.horizon + 1):
+            if steps[t - first][0] >= position:
+                return t
+        return plan.horizon + 1
+
+    def resting_horizon(self, car, road_index, tick):
+        # first tick at or after tick the stopped car could have no obstacle in front of it anymore
+        road = self.model.roads[road_index]
+        if road.light_signals_changed:
+            road.index_light_signals()
+
+        # red light signals up to 3 cells ahead keep the car standing until they change
+        light_signals = road.light_signals
+        light_signal_horizon = tick
+        i = road.next_light_signal[car.position]
+        while i < len(light_signals) and \
+                light_signals[i].position - car.position < DESIRED_CAR_OBSTACLE_DISTANCE:
+            light_signal = light_signals[i]
+            if light_signal.state_at(tick) == 0:
+                change = light_signal.next_change_tick(tick)
+                light_signal_horizon = change if light_signal_horizon == tick else min(
+                    light_signal_horizon, change)
+            i += 1
+
+        # the car in front keeps it standing until that car can have moved away
+        ahead_horizon = tick
+        ahead = self.ahead[car]
+        if ahead is not None:
+            ahead_plan = self.plans.get(ahead)
+            close = car.position + DESIRED_CAR_OBSTACLE_DISTANCE
+            if ahead_plan is None:
+                if ahead.position < close:
+                    ahead_horizon = self.reach_tick(
+                        ahead, close - ahead.position, tick)
+            elif ahead_plan.kind == ACCELERATING:
+                ahead_horizon = self.step_tick_at(ahead_plan, close, tick)
+            elif ahead_plan.kind != CRUISING:
+                if ahead.position < close:
+                    ahead_horizon = ahead_plan.horizon + 1
+            else:
+                ahead_horizon = min(ahead_plan.horizon + 1,
+                                    max(tick, self.first_tick_at(ahead_plan, close, True)))
+
+        return max(light_signal_horizon, ahead_horizon)
+
+    def braking_horizon(self, car, road_index, tick):
+        # distance to the obstacle of a car that keeps its cell and the first tick
+        # at or after tick the distance could be different
+        road = self.model.roads[road_index]
+        if road.light_signals_changed:
+            road.index_light_signals()
+
+        # light signals up to 3 cells ahead can become the obstacle or stop being it when they change
+        distance = NO_OBSTACLE_DISTANCE
+        horizon = None
+        light_signals = road.light_signals
+        i = road.next_light_signal[car.position]
+        while i < len(light_signals) and \
+                light_signals[i].position - car.position < DESIRED_CAR_OBSTACLE_DISTANCE:
+            light_signal = light_signals[i]
+            if light_signal.state_at(tick) == 0:
+                distance = min(
+                    distance, light_signal.position - car.position)
+            change = light_signal.next_change_tick(tick)
+            horizon = change if horizon is None else min(horizon, change)
+            i += 1
+
+        # the car in front changes the distance when it moves
+        ahead = self.ahead[car]
+        if ahead is not None:
+            ahead_position = self.position_at(ahead, tick)
+            if ahead_position - car.position <= distance:
+                distance = ahead_position - car.position
+                ahead_plan = self.plans.get(ahead)
+                if ahead_plan is None:
+                    ahead_horizon = self.reach_tick(ahead, 1, tick)
+                elif ahead_plan.kind == ACCELERATING:
+                    ahead_horizon = self.step_tick_at(
+                        ahead_plan, ahead_position + 1, tick)
+                elif ahead_plan.kind != CRUISING:
+                    ahead_horizon = ahead_plan.horizon + 1
+                else:
+                    ahead_horizon = min(ahead_plan.horizon + 1, max(tick, self.first_tick_at(
+                        ahead_plan, ahead_position + 1, True)))
+                horizon = ahead_horizon if horizon is None else min(
+                    horizon, ahead_horizon)
+
+        if horizon is None:
+            horizon = tick
+        return distance, horizon
@@ -0,0 +1,129 @@
+"""
+Description: A simulation environment for car traffic with cellular automata
+The program encapsules four files: main.py, controller.py, model.py, view.py
+Author: Christian Tognazza
+Datum: 13.04.2023
+"""
+
+from collections import deque
+
+# structured events of the model: blocked spawns, exiting cars, light signal changes, road changes
+# usage: model.set_events(EventLog(sink=print)), a Model without one does not create any events
+#
+# every event is a tuple (tick, kind, direction, offset, position, value) of the road it happened on:
+#   spawn_blocked   position of the generator
+#   car_exit        position the car left the road at, value = number of the car
+#   signal_change   position of the light signal, value = new state (0 = red, 1 = green)
+#   road_added, road_removed
+# the last events are kept in a ring buffer and counted per kind,
+# the sink only gets a sample of at most sample_rate events per kind every sample_interval ticks
+
+KINDS = ["spawn_blocked", "car_exit", "signal_change",
+         "road_added", "road_removed"]
+
+# number of events kept in the ring buffer
+CAPACITY = 10000
+
+MESSAGES = {
+    "spawn_blocked": "traffic jam!",
+    "car_exit": "car left the road",
+    "signal_change": "light signal changed",
+    "road_added": "road added",
+    "road_removed": "road removed",
+}
+
+
+class EventLog:
+    def __init__(self, capacity=CAPACITY, kinds=None, sink=None, sample_rate=5, sample_interval=100):
+        if kinds is None:
+            kinds = KINDS
+        for kind in kinds:
+            if kind not in KINDS:
+                raise Exception(f"unknown event kind {kind}")
+        if sample_rate < 0 or sample_interval < 1:
+            raise Exception(
+                "sample_rate must not be negative and sample_interval at least 1")
+
+        # kinds that are recorded, others are dropped when they are emitted
+        self.kinds = set(kinds)
+        self.events = deque(maxlen=capacity)
+        # kind --> number of events since the log was created
+        self.counters = {kind: 0 for kind in kinds}
+        # tick the emitted events belong to, kept up to date by the model
+        self.tick = 0
+        # callbacks that get every recorded event
+        self.listeners = []
+
+        # sink gets formatted lines of the sampled events, e.g. print or a file's write
+        self.sink = sink
+        self.sample_rate = sample_rate
+        self.sample_interval = sample_interval
+        # kind --> (sample window, events sent to the sink in it, events suppressed in it)
+        self.samples = {}
+
+    def subscribe(self, listener):
+        # listener(event) is called for every recorded event
+        self.listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        self.listeners.remove(listener)
+
+    def emit(self, kind, road, position=None, value=None):
+        if kind not in self.kinds:
+            return
+
+        event = (self.tick, kind, road.direction, road.offset, position, value)
+        self.events.append(event)
+        self.counters[kind] += 1
+        for listener in self.listeners:
+            listener(event)
+        if self.sink is not None:
+            self.sample(event)
+
+    def sample(self, event):
+        # send the event to the sink unless sample_rate events of its kind were sent in this window
+        kind = event[1]
+        window = event[0] // self.sample_interval
+        sample_window, sent, suppressed = self.samples.get(kind, (window, 0, 0))
+        if sample_window != window:
+            self.report_suppressed(kind, sample_window, suppressed)
+            sent, suppressed = 0, 0
+
+        if sent < self.sample_rate:
+            self.sink(format_event(event))
+            sent += 1
+        else:
+            suppressed += 1
+        self.samples[kind] = (window, sent, suppressed)
+
+    def flush(self):
+        # report the events still suppressed in the running sample windows to the sink
+        if self.sink is None:
+            return
+        for kind, (sample_window, _, suppressed) in self.samples.items():
+            self.report_suppressed(kind, sample_window, suppressed)
+        self.samples = {}
+
+    def report_suppressed(self, kind, sample_window, suppressed):
+        if suppressed:
+            self.sink(
+                f"{suppressed} more {kind} events in ticks {sample_window * self.sample_interval} "
+                f"to {(sample_window + 1) * self.sample_interval - 1}")
+
+    def recent(self, kind=None, count=None):
+        # the last events (of a kind), oldest first
+        events = [event for event in self.events if kind is None or event[1] == kind]
+        if count is not None:
+            events = events[-count:]
+        return events
+
+
+def format_event(event):
+    tick, kind, direction, offset, position, value = event
+    line = f"tick {tick}: {MESSAGES[kind]} ({direction} road {offset}"
+    if position is not None:
+        line += f", position {position}"
+    if value is not None:
+        line += f", {'car' if kind == 'car_exit' else 'state'} {value}"
+
+    return line + ")"
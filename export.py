@@ -0,0 +1,236 @@
+"""
+Description: A simulation environment for car traffic with cellular automata
+The program encapsules four files: main.py, controller.py, model.py, view.py
+Author: Christian Tognazza
+Datum: 13.04.2023
+"""
+
+import json
+import os
+import struct
+import sys
+from array import array
+
+# streaming export of car trajectories and road aggregates
+# usage: model.exporter = TrajectoryExporter("out"), ..., model.exporter.close()
+#
+# every table is written column by column in chunks of about chunk_rows rows:
+#   out/schema.json                    tables, columns, dtypes and number of chunks
+#   out/cars/000000.position.npy       one .npy file per column and chunk
+# a chunk is written once and never changed, only the rows of the open chunk are held in memory
+# the files open without parsing: numpy.load(path, mmap_mode="r"), see open_chunks
+
+# rows per chunk and table
+CHUNK_ROWS = 1 << 16
+
+# columns of the tables: name, array typecode, numpy dtype
+TABLES = {
+    # one row per car and sampled tick
+    "cars": [
+        ("tick", "q", "<i8"),
+        ("road", "i", "<i4"),
+        ("car", "q", "<i8"),
+        ("position", "q", "<i8"),
+        ("speed", "d", "<f8"),
+    ],
+    # one row per road and sampled tick, the counters are totals since the road was added
+    "roads": [
+        ("tick", "q", "<i8"),
+        ("road", "i", "<i4"),
+        ("cars", "i", "<i4"),
+        ("mean_speed", "d", "<f8"),
+        ("spawned", "q", "<i8"),
+        ("exited", "q", "<i8"),
+        ("blocked", "q", "<i8"),
+    ],
+}
+
+
+class ColumnWriter:
+    # buffers the rows of a table and writes them as chunks of .npy columns
+    # on_chunk is called after every written chunk
+    def __init__(self, directory, columns, chunk_rows, on_chunk=None):
+        self.directory = directory
+        self.columns = columns
+        self.chunk_rows = chunk_rows
+        self.on_chunk = on_chunk
+        self.chunks = 0
+        self.rows = 0
+        self.buffers = [array(typecode) for _, typecode, _ in columns]
+        os.makedirs(directory, exist_ok=True)
+
+    def append(self, *values):
+        # append one row, a value per column
+        for buffer, value in zip(self.buffers, values):
+            buffer.append(value)
+        if len(self.buffers[0]) >= self.chunk_rows:
+            self.flush()
+
+    def extend(self, *columns):
+        # append many rows given as one sequence per column
+        for buffer, values in zip(self.buffers, columns):
+            buffer.extend(values)
+        if len(self.buffers[0]) >= self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        # write the buffered rows as the next chunk
+        count = len(self.buffers[0])
+        if count == 0:
+            return
+
+        for (name, _, dtype), buffer in zip(self.columns, self.buffers):
+            path = os.path.join(self.directory, f"{self.chunks:06d}.{name}.npy")
+            write_npy(path, buffer, dtype)
+            del buffer[:]
+        self.chunks += 1
+        self.rows += count
+        if self.on_chunk is not None:
+            self.on_chunk()
+
+
+class TrajectoryExporter:
+    def __init__(self, directory, sample_every=1, chunk_rows=CHUNK_ROWS):
+        if sample_every < 1:
+            raise Exception("sample_every must be at least 1")
+
+        self.directory = directory
+        self.sample_every = sample_every
+        self.writers = {}
+        for table, columns in TABLES.items():
+            self.writers[table] = ColumnWriter(os.path.join(directory, table), columns,
+                                               chunk_rows, on_chunk=self.write_schema)
+        # last tick a sample was written for, skipped ticks are only written once
+        self.last_tick = None
+        self.write_schema()
+
+    def record(self, model):
+        # sample the model after a tick, called by Model.do_tick
+        if model.tick % self.sample_every == 0:
+            self.write_sample(model, model.tick)
+
+    def record_skipped(self, model, last_tick):
+        # sample ticks skipped by Model.advance up to last_tick, no car moved in them
+        tick = model.tick + 1
+        if self.last_tick is not None:
+            tick = max(tick, self.last_tick + 1)
+        # first sampled tick
+        tick += -tick % self.sample_every
+        while tick <= last_tick:
+            self.write_sample(model, tick)
+            tick += self.sample_every
+
+    def write_sample(self, model, tick):
+        self.last_tick = tick
+        cars = self.writers["cars"]
+        roads = self.writers["roads"]
+
+        engine = model.engine
+        if engine is not None and not engine.cars_on_roads:
+            # the numpy engine holds the cars as arrays, grouped by road
+            count = len(engine.position)
+            cars.extend([tick] * count, engine.road.tolist(), engine.number.tolist(),
+                        engine.position.tolist(), engine.speed.tolist())
+            car_counts = [0] * len(model.roads)
+            speed_sums = [0.0] * len(model.roads)
+            for road_index, speed in zip(engine.road.tolist(), engine.speed.tolist()):
+                car_counts[road_index] += 1
+                speed_sums[road_index] += speed
+        else:
+            if engine is not None:
+                # the event engine brings its sleeping cars up to the tick
+                engine.update_cars()
+            # the rows of all roads are added at once like the arrays of the numpy engine,
+            # so the chunks are the same with every engine
+            road_indices, numbers, positions, speeds = [], [], [], []
+            car_counts, speed_sums = [], []
+            for road_index, road in enumerate(model.roads):
+                road_speeds = [car.speed for car in road.cars]
+                road_indices.extend([road_index] * len(road_speeds))
+                numbers.extend(car.number for car in road.cars)
+                positions.extend(car.position for car in road.cars)
+                speeds.extend(road_speeds)
+                car_counts.append(len(road_speeds))
+                speed_sums.append(sum(road_speeds))
+            cars.extend([tick] * len(speeds), road_indices, numbers, positions, speeds)
+
+        for road_index, road in enumerate(model.roads):
+            count = car_counts[road_index]
+            roads.append(tick, road_index, count,
+                         speed_sums[road_index] / count if count else 0.0,
+                         road.spawned, road.exited, road.blocked)
+
+    def write_schema(self):
+        # describes the tables, rewritten whenever chunks were added
+        schema = {
+            "sample_every": self.sample_every,
+            "tables": {
+                table: {
+                    "columns": {name: dtype for name, _, dtype in TABLES[table]},
+                    "chunks": writer.chunks,
+                    "rows": writer.rows,
+                }
+                for table, writer in self.writers.items()
+            },
+        }
+        temporary_path = os.path.join(self.directory, "schema.json.tmp")
+        with open(temporary_path, "w") as schema_file:
+            json.dump(schema, schema_file, indent=2)
+        os.replace(temporary_path, os.path.join(
+            self.directory, "schema.json"))
+
+    def flush(self):
+        # write the open chunks, later rows start new chunks
+        for writer in self.writers.values():
+            writer.flush()
+
+    def close(self):
+        self.flush()
+
+
+def write_npy(path, values, dtype):
+    # write an array.array as .npy file (format version 1.0), little endian
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+
+    header = repr({"descr": dtype, "fortran_order": False,
+                  "shape": (len(values),)})
+    # the header is padded so the data starts at a multiple of 64 bytes
+    padding = 63 - (10 + len(header)) % 64
+    header = (header + " " * padding + "\n").encode("latin1")
+    with open(path, "wb") as npy_file:
+        npy_file.write(b"\x93NUMPY\x01\x00")
+        npy_file.write(struct.pack("<H", len(header)))
+        npy_file.write(header)
+        values.tofile(npy_file)
+
+
+def open_chunks(directory, table):
+    # memory mapped chunks of a table as dicts of column name --> numpy array, needs numpy
+    import numpy as np
+
+    with open(os.path.join(directory, "schema.json")) as schema_file:
+        schema = json.load(schema_file)["tables"][table]
+
+    for chunk in range(schema["chunks"]):
+        yield {
+            name: np.load(os.path.join(directory, table, f"{chunk:06d}.{name}.npy"),
+                          mmap_mode="r")
+            for name in schema["columns"]
+        }
+
+
+def load_table(directory, table):
+    # all chunks of a table concatenated into one array per column, needs numpy
+    import numpy as np
+
+    chunks = list(open_chunks(directory, table))
+    with open(os.path.join(directory, "schema.json")) as schema_file:
+        columns = json.load(schema_file)["tables"][table]["columns"]
+
+    return {
+        name: np.concatenate([chunk[name] for chunk in chunks]) if chunks
+        else np.empty(0, dtype=dtype)
+        for name, dtype in columns.items()
+    }
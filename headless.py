@@ -0,0 +1,270 @@
+"""
+Description: A simulation environment for car traffic with cellular automata
+The program encapsules four files: main.py, controller.py, model.py, view.py
+Author: Christian Tognazza
+Datum: 13.04.2023
+"""
+
+import argparse
+import time
+
+from model import *
+from snapshot import load_snapshot, save_snapshot
+from instrumentation import Instrumentation
+from export import TrajectoryExporter
+from raster import FrameWriter
+from metrics import TrafficMetrics
+from events import EventLog, KINDS
+from replay import ReplayRecorder, KEYFRAME_EVERY
+
+# headless batch runner, drives the Model without tkinter and without rendering
+# usage: python -m headless run --size 500 --ticks 100000 --roads 10x10 --delay 5 --avg-speed 120 --seed 42
+# long runs can be checkpointed and continued:
+# python -m headless run --ticks 100000 --checkpoint-every 10000 --snapshot run.tsim
+# python -m headless run --ticks 50000 --restore run.tsim
+# and recorded to be watched in the GUI (REPLAY in main.py):
+# python -m headless run --ticks 100000 --record run.trep
+
+
+def parse_roads(value):
+    # parse "<vertical>x<horizontal>", e.g. "10x10"
+    try:
+        num_vertical_roads, num_horizontal_roads = (
+            int(num_roads) for num_roads in value.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            "roads must be given as <vertical>x<horizontal>, e.g. 10x10")
+
+    return num_vertical_roads, num_horizontal_roads
+
+
+def build_model(size, roads, delay, avg_speed, engine="object", render_grid=False,
+                block_intersections=False, seed=None, sparse=False):
+    # same setup as the Controller does with its sliders
+    model = Model(size=size, engine=engine, render_grid=render_grid,
+                  block_intersections=block_intersections, seed=seed, sparse=sparse)
+    num_vertical_roads, num_horizontal_roads = roads
+    model.set_num_roads(num_horizontal_roads, "horizontal")
+    model.set_num_roads(num_vertical_roads, "vertical")
+    model.set_generator_avg_speed(avg_speed)
+    model.update_generators_delay(delay)
+
+    return model
+
+
+def run(model, ticks, fast_forward=False, checkpoint_every=None, snapshot_path=None,
+        frame_writer=None, recorder=None):
+    # run the model as fast as possible, returns the summary metrics
+    # fast_forward skips ticks in which no car changes (car updates are not counted then)
+    # with a snapshot_path the model is saved every checkpoint_every ticks and at the end
+    # a frame_writer gets the grid of every tick it wants a frame of
+    # a recorder gets every tick, the model must render its grid then
+    car_updates = 0
+    start = time.perf_counter()
+    done = 0
+    while done < ticks:
+        chunk = ticks - done
+        if snapshot_path is not None and checkpoint_every:
+            chunk = min(chunk, checkpoint_every - done % checkpoint_every)
+        if frame_writer is not None:
+            chunk = min(chunk, frame_writer.ticks_until_frame(model.tick))
+        frame_due = frame_writer is not None and frame_writer.is_frame_tick(
+            model.tick + chunk)
+
+        # the grid is only rendered in the tick of a frame
+        if frame_due and not model.sparse and not model.render_grid:
+            car_updates += step(model, chunk - 1, fast_forward, recorder)
+            model.render_grid = True
+            car_updates += step(model, 1, False, recorder)
+            model.render_grid = False
+        else:
+            car_updates += step(model, chunk, fast_forward, recorder)
+        done += chunk
+
+        if frame_due:
+            frame_writer.write(model)
+        if snapshot_path is not None and checkpoint_every and done < ticks and done % checkpoint_every == 0:
+            save_snapshot(model, snapshot_path)
+    elapsed = time.perf_counter() - start
+
+    if snapshot_path is not None:
+        save_snapshot(model, snapshot_path)
+
+    model.store_engine_cars()
+    speeds = [car.speed for road in model.roads for car in road.cars]
+
+    return {
+        "ticks": ticks,
+        "seconds": elapsed,
+        "ticks_per_second": ticks / elapsed if elapsed > 0 else 0,
+        "car_updates_per_second": car_updates / elapsed if elapsed > 0 else 0,
+        "cars": len(speeds),
+        "spawned": sum(road.spawned for road in model.roads),
+        "exited": sum(road.exited for road in model.roads),
+        "blocked": sum(road.blocked for road in model.roads),
+        "mean_speed": sum(speeds) / len(speeds) if speeds else 0,
+    }
+
+
+def step(model, ticks, fast_forward, recorder=None):
+    # perform the given number of ticks, returns the number of car updates done
+    if fast_forward:
+        model.advance(ticks)
+        return 0
+
+    car_updates = 0
+    for _ in range(ticks):
+        car_updates += model.count_cars()
+        model.do_tick()
+        if recorder is not None:
+            recorder.record(model)
+    return car_updates
+
+
+def traffic_metrics(model):
+    # totals of the traffic statistics of the model, see metrics.TrafficMetrics.summary
+    summary = model.metrics.summary(model.roads)
+    return {f"traffic_{name}": value for name, value in summary.items() if name != "roads"}
+
+
+def print_metrics(metrics):
+    for name, value in metrics.items():
+        if isinstance(value, float):
+            value = round(value, 2)
+        print(f"{name}: {value}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="headless", description="run the traffic simulation without a GUI")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run a single simulation")
+    run_parser.add_argument("--size", type=int, default=50)
+    run_parser.add_argument("--ticks", type=int, default=1000)
+    run_parser.add_argument("--roads", type=parse_roads, default=(1, 1),
+                            help="<vertical>x<horizontal> number of roads")
+    run_parser.add_argument("--delay", type=int, default=10,
+                            help="car generator delay in ticks")
+    run_parser.add_argument("--avg-speed", type=int, default=100,
+                            help="average car speed of the generators")
+    run_parser.add_argument("--seed", type=int, default=None)
+    run_parser.add_argument("--engine", choices=["object", "numpy", "event"],
+                            default="object")
+    run_parser.add_argument("--block-intersections", action="store_true",
+                            help="cars cannot enter intersections held by crossing cars")
+    run_parser.add_argument("--sparse", action="store_true",
+                            help="store only the roads, no size x size grids (for very large sizes)")
+    run_parser.add_argument("--fast-forward", action="store_true",
+                            help="skip ticks in which no car moves or spawns")
+    run_parser.add_argument("--restore", metavar="PATH", default=None,
+                            help="continue the run saved in a snapshot, the road options are ignored")
+    run_parser.add_argument("--snapshot", metavar="PATH", default=None,
+                            help="save the model to a snapshot at the end of the run")
+    run_parser.add_argument("--checkpoint-every", type=int, default=None, metavar="TICKS",
+                            help="also save the snapshot every TICKS ticks")
+    run_parser.add_argument("--export", metavar="DIRECTORY", default=None,
+                            help="write car trajectories and road aggregates as .npy column chunks")
+    run_parser.add_argument("--sample-every", type=int, default=1, metavar="TICKS",
+                            help="export every TICKS-th tick")
+    run_parser.add_argument("--frames", metavar="DIRECTORY", default=None,
+                            help="write the grid as numbered images, e.g. to make a video")
+    run_parser.add_argument("--frame-every", type=int, default=1, metavar="TICKS",
+                            help="write a frame every TICKS ticks")
+    run_parser.add_argument("--frame-format", choices=["png", "ppm"], default="png")
+    run_parser.add_argument("--frame-scale", type=int, default=4, metavar="PIXELS",
+                            help="pixels per cell")
+    run_parser.add_argument("--metrics", type=int, default=None, metavar="WINDOW",
+                            help="keep traffic statistics over windows of WINDOW ticks and print them")
+    run_parser.add_argument("--tumbling", action="store_true",
+                            help="take the --metrics windows as consecutive blocks instead of sliding")
+    run_parser.add_argument("--events", metavar="PATH", default=None,
+                            help="write a sample of the events (blocked spawns, exits, ...) to a text file")
+    run_parser.add_argument("--event-kinds", nargs="+", choices=KINDS, default=None,
+                            help="kinds of events to record, default all")
+    run_parser.add_argument("--record", metavar="PATH", default=None,
+                            help="record the run to a replay file that can be watched and scrubbed in the GUI")
+    run_parser.add_argument("--keyframe-every", type=int, default=KEYFRAME_EVERY, metavar="TICKS",
+                            help="store the full state in the replay file every TICKS ticks")
+    run_parser.add_argument("--instrument", metavar="PATH", default=None,
+                            help="record the timings of the tick phases and export them as JSON")
+
+    args = parser.parse_args(argv)
+
+    if args.size < 3:
+        parser.error("size must be at least 3")
+
+    if args.checkpoint_every is not None and args.snapshot is None:
+        parser.error("--checkpoint-every needs --snapshot")
+    if args.sample_every < 1:
+        parser.error("sample-every must be at least 1")
+    if args.frame_every < 1 or args.frame_scale < 1:
+        parser.error("frame-every and frame-scale must be at least 1")
+    if args.metrics is not None and args.metrics < 1:
+        parser.error("metrics window must be at least 1")
+    if args.record is not None and (args.sparse or args.fast_forward):
+        parser.error("--record needs every tick rendered, not --sparse or --fast-forward")
+    if args.keyframe_every < 1:
+        parser.error("keyframe-every must be at least 1")
+    if args.block_intersections and args.engine != "object":
+        parser.error("--block-intersections is only supported by --engine object")
+
+    if args.restore is not None:
+        try:
+            model = load_snapshot(
+                args.restore, engine=args.engine, render_grid=False, sparse=args.sparse)
+        except OSError as error:
+            parser.error(f"cannot read snapshot {args.restore}: {error.strerror}")
+        except Exception as error:
+            # not a snapshot, or a snapshot the engine cannot run
+            parser.error(f"cannot restore snapshot {args.restore}: {error}")
+    else:
+        try:
+            model = build_model(args.size, args.roads, args.delay, args.avg_speed, engine=args.engine,
+                                block_intersections=args.block_intersections, seed=args.seed,
+                                sparse=args.sparse)
+        except ValueError as error:
+            # more roads than offsets
+            parser.error(str(error))
+
+    if args.instrument is not None:
+        model.instrumentation = Instrumentation()
+    if args.export is not None:
+        model.exporter = TrajectoryExporter(
+            args.export, sample_every=args.sample_every)
+    if args.metrics is not None:
+        model.set_metrics(TrafficMetrics(
+            window=args.metrics, sliding=not args.tumbling))
+    events_file = None
+    if args.events is not None:
+        events_file = open(args.events, "w")
+        model.set_events(EventLog(kinds=args.event_kinds,
+                         sink=lambda line: events_file.write(line + "\n")))
+    frame_writer = None
+    if args.frames is not None:
+        frame_writer = FrameWriter(args.frames, every=args.frame_every,
+                                   image_format=args.frame_format, scale=args.frame_scale)
+    recorder = None
+    if args.record is not None:
+        recorder = ReplayRecorder(
+            args.record, model, keyframe_every=args.keyframe_every)
+    print_metrics(run(model, args.ticks, fast_forward=args.fast_forward,
+                      checkpoint_every=args.checkpoint_every, snapshot_path=args.snapshot,
+                      frame_writer=frame_writer, recorder=recorder))
+    if recorder is not None:
+        recorder.close()
+    if args.metrics is not None:
+        print_metrics(traffic_metrics(model))
+    if events_file is not None:
+        print_metrics({f"events_{kind}": count for kind,
+                      count in model.events.counters.items()})
+        model.events.flush()
+        events_file.close()
+    if args.instrument is not None:
+        model.instrumentation.export(args.instrument)
+    if args.export is not None:
+        model.exporter.close()
+
+
+if __name__ == "__main__":
+    main()
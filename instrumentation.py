@@ -0,0 +1,157 @@
+"""
+Description: A simulation environment for car traffic with cellular automata
+The program encapsules four files: main.py, controller.py, model.py, view.py
+Author: Christian Tognazza
+Datum: 13.04.2023
+"""
+
+import json
+import threading
+import time
+from collections import deque
+
+# opt-in timings of the phases of a tick and counters of the cars
+# usage: model.instrumentation = Instrumentation(), a Model without one is not timed at all
+#
+# every tick gets a row with the seconds spent per phase and the car counters,
+# the last WINDOW rows are kept, the histograms of the phases are taken over them
+
+# number of ticks kept for the rolling histograms and the export
+WINDOW = 600
+# upper bounds of the histogram buckets in seconds, doubling from 1 µs, the last one is open
+HISTOGRAM_BOUNDS = [0.000001 * 2 ** i for i in range(20)]
+
+
+class Instrumentation:
+    def __init__(self, window=WINDOW):
+        self.window = window
+        # finished rows, oldest first
+        self.rows = deque(maxlen=window)
+        # row of the running tick, phases are added up until the next tick starts
+        self.row = None
+        # phase name --> durations of the last ticks
+        self.phases = {}
+        # lifetime totals of the roads at the end of the last tick, to count per tick
+        self.totals = {"spawned": 0, "exited": 0, "blocked": 0}
+        # the view records from the tkinter thread while a simulation thread ticks the model
+        self.lock = threading.Lock()
+
+    def begin_tick(self, tick):
+        # finish the row of the last tick and start a new one
+        with self.lock:
+            self.finish_row()
+            self.row = {"tick": tick, "phases": {}, "counters": {}}
+
+    def finish_row(self):
+        # the caller holds the lock
+        if self.row is None:
+            return
+
+        self.rows.append(self.row)
+        for name, seconds in self.row["phases"].items():
+            if name not in self.phases:
+                self.phases[name] = deque(maxlen=self.window)
+            self.phases[name].append(seconds)
+        self.row = None
+
+    def record(self, name, seconds):
+        # add the duration of a phase to the running tick, phases done several times per tick add up
+        with self.lock:
+            if self.row is None:
+                self.row = {"tick": None, "phases": {}, "counters": {}}
+            phases = self.row["phases"]
+            phases[name] = phases.get(name, 0) + seconds
+
+    def count(self, roads, cars):
+        # counters of the running tick: cars alive and spawns, exits, blocked spawns in this tick
+        totals = {name: sum(getattr(road, name) for road in roads)
+                  for name in self.totals}
+        with self.lock:
+            if self.row is None:
+                return
+
+            counters = self.row["counters"]
+            counters["cars"] = cars
+            for name, total in totals.items():
+                counters[name] = max(0, total - self.totals[name])
+                self.totals[name] = total
+
+    def percentile(self, name, percent):
+        # duration of a phase that percent of the last ticks stayed below
+        durations = sorted(self.phases.get(name, ()))
+        if not durations:
+            return 0
+        return durations[min(len(durations) - 1, int(len(durations) * percent / 100))]
+
+    def mean(self, name):
+        durations = self.phases.get(name, ())
+        if not durations:
+            return 0
+        return sum(durations) / len(durations)
+
+    def histogram(self, name):
+        # number of the last ticks per duration bucket, see HISTOGRAM_BOUNDS
+        buckets = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+        for seconds in self.phases.get(name, ()):
+            bucket = 0
+            while bucket < len(HISTOGRAM_BOUNDS) and seconds > HISTOGRAM_BOUNDS[bucket]:
+                bucket += 1
+            buckets[bucket] += 1
+
+        return buckets
+
+    def summary_lines(self):
+        # short text per phase and the last counters, used by the overlay of the view
+        with self.lock:
+            return self.format_summary()
+
+    def format_summary(self):
+        lines = []
+        for name in sorted(self.phases):
+            lines.append(
+                f"{name}: {self.mean(name) * 1000:.2f} ms, p95 {self.percentile(name, 95) * 1000:.2f} ms")
+        if self.rows:
+            counters = self.rows[-1]["counters"]
+            lines.append(" ".join(f"{name}={value}" for name,
+                         value in counters.items()))
+
+        return lines
+
+    def export(self, path):
+        # write the rows and the phase statistics as JSON for offline analysis
+        with self.lock, open(path, "w") as export_file:
+            self.finish_row()
+            json.dump({
+                "window": self.window,
+                "histogram_bounds": HISTOGRAM_BOUNDS,
+                "phases": {
+                    name: {
+                        "mean": self.mean(name),
+                        "p50": self.percentile(name, 50),
+                        "p95": self.percentile(name, 95),
+                        "max": max(self.phases[name]),
+                        "histogram": self.histogram(name),
+                    }
+                    for name in sorted(self.phases)
+                },
+                "ticks": list(self.rows),
+            }, export_file, indent=1)
+
+
+class Timer:
+    # measures a phase into an instrumentation, does nothing without one
+    # with Timer(instrumentation, "View.draw_grid"): ...
+    def __init__(self, instrumentation, name):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        if self.instrumentation is not None:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exception):
+        if self.instrumentation is not None:
+            self.instrumentation.record(
+                self.name, time.perf_counter() - self.start)
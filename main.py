@@ -12,12 +12,38 @@ from controller import *
 # must be between 25 and 50
 SIZE = 50
 
+# road engine of the model: "object", "numpy" (needs numpy installed) or "event"
+ENGINE = "object"
+
+# None = one tick per frame like the original loop, otherwise the model runs on its own
+# thread with this many ticks per second (0 = as fast as possible) and frames are dropped
+TICKS_PER_SECOND = None
+
+# "cells" = one canvas rectangle per cell, "raster" = the grid is drawn as one image
+VIEW_BACKEND = "cells"
+
+# show timings of the tick phases on the canvas and export them when the window is closed
+INSTRUMENT = False
+
+# show flow, density, speeds and queues of the last ticks on the canvas
+METRICS = False
+
+# opt-in: print a sample of the traffic jams (blocked car spawns) to the console
+LOG_EVENTS = False
+
+# path of a recording made with python -m headless run --record, its ticks are shown
+# (seek, play backwards or faster) instead of simulated, None = simulate
+REPLAY = None
+
 
 def main():
     if SIZE < 25 or SIZE > 75:
         raise Exception("SIZE must be between 25 and 75")
     root = Tk()
-    controller = Controller(root, size=SIZE)
+    controller = Controller(root, size=SIZE, engine=ENGINE,
+                            ticks_per_second=TICKS_PER_SECOND, instrument=INSTRUMENT,
+                            view_backend=VIEW_BACKEND, metrics=METRICS,
+                            log_events=LOG_EVENTS, replay=REPLAY)
     controller.mainloop()
 
 
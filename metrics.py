@@ -0,0 +1,354 @@
+"""
+Description: A simulation environment for car traffic with cellular automata
+The program encapsules four files: main.py, controller.py, model.py, view.py
+Author: Christian Tognazza
+Datum: 13.04.2023
+"""
+
+from collections import deque
+
+# running traffic statistics, updated by the roads as their cars change
+# usage: model.set_metrics(TrafficMetrics(window=100)), then model.metrics.summary() at any tick
+#
+# every car update, spawn and exit changes the statistics of its road in O(1),
+# at the end of a tick the windows of all roads and light signals move on by one tick
+# (no pass over the cars), so flows, densities and queues are over the last `window` ticks:
+# sliding = the last window ticks, tumbling = the last completed block of window ticks
+
+# width of the speed histogram buckets, the last bucket holds all faster cars
+SPEED_BUCKET = 5
+SPEED_BUCKETS = 60
+# number of (density, flow) points kept per road for the fundamental diagram
+FUNDAMENTAL_DIAGRAM_POINTS = 1000
+
+
+class Window:
+    # sum of a value over the last ticks
+    def __init__(self, length, sliding=True):
+        self.length = length
+        self.sliding = sliding
+        # value added in the running tick
+        self.current = 0
+        # sum over the window
+        self.total = 0
+        self.ticks = 0
+        # sliding: value per tick of the window, tumbling: sum of the running block
+        self.buckets = [0] * length if sliding else None
+        self.running = 0
+
+    def add(self, value):
+        self.current += value
+
+    def advance(self):
+        # the running tick is over
+        if self.sliding:
+            index = self.ticks % self.length
+            self.total += self.current - self.buckets[index]
+            self.buckets[index] = self.current
+        else:
+            self.running += self.current
+            if (self.ticks + 1) % self.length == 0:
+                self.total = self.running
+                self.running = 0
+        self.current = 0
+        self.ticks += 1
+
+    def span(self):
+        # number of ticks the total is taken over
+        if self.sliding:
+            return min(self.ticks, self.length)
+        return self.length if self.ticks >= self.length else 0
+
+    def jump(self, ticks, value):
+        # advance by ticks ticks that all add the same value, in O(1) for ticks >= length
+        if ticks < self.length:
+            for _ in range(ticks):
+                self.add(value)
+                self.advance()
+            return
+
+        start = self.ticks
+        self.ticks += ticks
+        if self.sliding:
+            self.buckets = [value] * self.length
+            self.total = value * self.length
+            return
+
+        # last block that was completed
+        block_end = self.ticks - self.ticks % self.length
+        if block_end - self.length >= start:
+            self.total = value * self.length
+        else:
+            self.total = self.running + value * (block_end - start)
+        self.running = value * (self.ticks - block_end)
+
+    def rate(self):
+        # mean value per tick
+        span = self.span()
+        return self.total / span if span else 0
+
+
+class LightSignalMetrics:
+    def __init__(self, position, window, sliding):
+        self.position = position
+        # cars that passed the light signal
+        self.flow = Window(window, sliding)
+        # stopped cars in front of the light signal (up to the previous one)
+        self.stopped = 0
+        # number of stopped cars in front of the light signal while it is red, per tick
+        self.queue = Window(window, sliding)
+
+
+class RoadMetrics:
+    def __init__(self, road, window, sliding):
+        self.window = window
+        self.sliding = sliding
+        # cars that left the road at its end
+        self.exit_flow = Window(window, sliding)
+        # cars on the road per tick
+        self.density = Window(window, sliding)
+        # speed sum of the cars per tick
+        self.speed = Window(window, sliding)
+        # cars that came to a stop
+        self.stops = Window(window, sliding)
+        self.total_stops = 0
+        self.fundamental_diagram = deque(maxlen=FUNDAMENTAL_DIAGRAM_POINTS)
+        self.light_signals = []
+        self.reindex(road)
+
+    def reindex(self, road):
+        # recount the live state from the cars of the road, needed when roads or light signals change
+        self.road = road
+        self.length = road.length
+        self.cars = 0
+        self.speed_sum = 0
+        self.speed_histogram = [0] * SPEED_BUCKETS
+
+        if road.light_signals_changed:
+            road.index_light_signals()
+        # light signals that stayed keep their windows
+        previous = {
+            light_signal.position: light_signal for light_signal in self.light_signals}
+        self.light_signals = [previous.get(light_signal.position) or LightSignalMetrics(
+            light_signal.position, self.window, self.sliding) for light_signal in road.light_signals]
+        # stopped cars behind the last light signal
+        self.stopped_after_light_signals = 0
+        for light_signal in self.light_signals:
+            light_signal.stopped = 0
+
+        for car in road.cars:
+            self.add_car(car.position, car.speed)
+
+    def segment(self, position):
+        # index of the first light signal at or after the position, len(light_signals) = none
+        if position >= self.length:
+            return len(self.light_signals)
+        return self.road.next_light_signal[position]
+
+    def add_stopped(self, position, count):
+        segment = self.segment(position)
+        if segment < len(self.light_signals):
+            self.light_signals[segment].stopped += count
+        else:
+            self.stopped_after_light_signals += count
+
+    def add_car(self, position, speed):
+        # a car entered the road
+        self.cars += 1
+        self.speed_sum += speed
+        self.speed_histogram[speed_bucket(speed)] += 1
+        if speed == 0:
+            self.add_stopped(position, 1)
+
+    def remove_car(self, position, speed):
+        self.cars -= 1
+        self.speed_sum -= speed
+        self.speed_histogram[speed_bucket(speed)] -= 1
+        if speed == 0:
+            self.add_stopped(position, -1)
+
+    def update_car(self, old_position, old_speed, position, speed):
+        # a car moved from old_position with old_speed to position with speed
+        self.remove_car(old_position, old_speed)
+        if old_speed > 0 and speed == 0:
+            self.stops.add(1)
+            self.total_stops += 1
+
+        # light signals passed on the way
+        i = self.segment(old_position)
+        while i < len(self.light_signals) and self.light_signals[i].position < position:
+            self.light_signals[i].flow.add(1)
+            i += 1
+
+        if position >= self.length:
+            self.exit_flow.add(1)
+            return
+        self.add_car(position, speed)
+
+    def end_tick(self, light_signals):
+        # move the windows on, light_signals are the light signals of the road
+        self.density.add(self.cars)
+        self.speed.add(self.speed_sum)
+        for metrics, light_signal in zip(self.light_signals, light_signals):
+            if light_signal.state == 0:
+                metrics.queue.add(metrics.stopped)
+            metrics.flow.advance()
+            metrics.queue.advance()
+        self.exit_flow.advance()
+        self.density.advance()
+        self.speed.advance()
+        self.stops.advance()
+
+        if self.density.ticks % self.window == 0:
+            self.fundamental_diagram.append(
+                (self.mean_density(), self.exit_flow.rate()))
+
+    def skip_ticks(self, light_signals, ticks):
+        # ticks in which no car moved and no light signal changed, every tick adds the same values
+        # the windows of the first window of ticks still hold moving ticks and are done tick by tick,
+        # after that every window only holds standing ticks
+        looped = min(ticks, self.window)
+        for _ in range(looped):
+            self.end_tick(light_signals)
+        ticks -= looped
+        if not ticks:
+            return
+
+        first_tick = self.density.ticks
+        self.exit_flow.jump(ticks, 0)
+        self.density.jump(ticks, self.cars)
+        self.speed.jump(ticks, self.speed_sum)
+        self.stops.jump(ticks, 0)
+        for metrics, light_signal in zip(self.light_signals, light_signals):
+            metrics.flow.jump(ticks, 0)
+            metrics.queue.jump(
+                ticks, metrics.stopped if light_signal.state == 0 else 0)
+
+        completed = (first_tick + ticks) // self.window - \
+            first_tick // self.window
+        for _ in range(min(completed, FUNDAMENTAL_DIAGRAM_POINTS)):
+            self.fundamental_diagram.append((self.cars / self.length, 0))
+
+    def mean_density(self):
+        # cars per road cell over the window
+        return self.density.rate() / self.length
+
+    def mean_speed(self):
+        # mean speed of the cars over the window
+        return self.speed.total / self.density.total if self.density.total else 0
+
+    def speed_percentile(self, percent):
+        return histogram_percentile(self.speed_histogram, percent)
+
+
+class TrafficMetrics:
+    def __init__(self, window=100, sliding=True):
+        if window < 1:
+            raise Exception("window must be at least 1")
+
+        self.window = window
+        self.sliding = sliding
+        self.tick = 0
+        # road --> RoadMetrics, roads keep their windows while other roads change
+        self.roads = {}
+
+    def index_roads(self, roads, changed=None):
+        # attach metrics to new roads and recount the changed roads (None = all roads),
+        # called when roads or light signals change
+        self.roads = {id(road): self.roads.get(id(road)) for road in roads}
+        for road in roads:
+            if self.roads[id(road)] is None:
+                self.roads[id(road)] = RoadMetrics(
+                    road, self.window, self.sliding)
+            elif changed is None or road in changed:
+                self.roads[id(road)].reindex(road)
+            road.metrics = self.roads[id(road)]
+
+    def end_tick(self, roads):
+        for road in roads:
+            road.metrics.end_tick(road.light_signals)
+        self.tick += 1
+
+    def skip_ticks(self, roads, ticks):
+        # ticks in which no car moved (see Model.advance)
+        for road in roads:
+            road.metrics.skip_ticks(road.light_signals, ticks)
+        self.tick += ticks
+
+    def summary(self, roads):
+        # statistics of all roads and in total, flows are cars per tick
+        road_summaries = []
+        for road in roads:
+            metrics = road.metrics
+            road_summaries.append({
+                "direction": road.direction,
+                "offset": road.offset,
+                "cars": metrics.cars,
+                "density": metrics.cars / metrics.length,
+                "mean_density": metrics.mean_density(),
+                "mean_speed": metrics.mean_speed(),
+                "speed_p50": metrics.speed_percentile(50),
+                "speed_p90": metrics.speed_percentile(90),
+                "exit_flow": metrics.exit_flow.rate(),
+                "stops": metrics.total_stops,
+                "stop_rate": metrics.stops.rate(),
+                "light_signal_flow": [light_signal.flow.rate() for light_signal in metrics.light_signals],
+                "queue": [light_signal.stopped if state.state == 0 else 0
+                          for light_signal, state in zip(metrics.light_signals, road.light_signals)],
+                "mean_queue": [light_signal.queue.rate() for light_signal in metrics.light_signals],
+            })
+
+        histogram = [0] * SPEED_BUCKETS
+        for road in roads:
+            for bucket, count in enumerate(road.metrics.speed_histogram):
+                histogram[bucket] += count
+        cars = sum(road.metrics.cars for road in roads)
+        length = sum(road.metrics.length for road in roads)
+        density_total = sum(road.metrics.density.total for road in roads)
+
+        return {
+            "tick": self.tick,
+            "window": self.window,
+            "cars": cars,
+            "density": cars / length if length else 0,
+            "mean_speed": sum(road.metrics.speed.total for road in roads) / density_total if density_total else 0,
+            "speed_p50": histogram_percentile(histogram, 50),
+            "speed_p90": histogram_percentile(histogram, 90),
+            "exit_flow": sum(road.metrics.exit_flow.rate() for road in roads),
+            "stops": sum(road.metrics.total_stops for road in roads),
+            "queue": sum(sum(road_summary["queue"]) for road_summary in road_summaries),
+            "roads": road_summaries,
+        }
+
+    def fundamental_diagram(self, roads):
+        # (density, flow) points of all roads, one per road and completed window
+        return [point for road in roads for point in road.metrics.fundamental_diagram]
+
+    def summary_lines(self, roads):
+        # short text for the overlay of the view
+        summary = self.summary(roads)
+        return [
+            f"cars {summary['cars']} density {summary['density']:.3f} mean speed {summary['mean_speed']:.1f}",
+            f"speed p50 {summary['speed_p50']} p90 {summary['speed_p90']}",
+            f"exit flow {summary['exit_flow']:.2f}/tick queue {summary['queue']} stops {summary['stops']}",
+        ]
+
+
+def speed_bucket(speed):
+    return min(int(speed // SPEED_BUCKET), SPEED_BUCKETS - 1)
+
+
+def histogram_percentile(histogram, percent):
+    # upper speed of the bucket in which the percentile lies
+    count = sum(histogram)
+    if count == 0:
+        return 0
+
+    rank = count * percent / 100
+    seen = 0
+    for bucket, bucket_count in enumerate(histogram):
+        seen += bucket_count
+        if seen >= rank and bucket_count:
+            return (bucket + 1) * SPEED_BUCKET
+
+    return SPEED_BUCKETS * SPEED_BUCKET
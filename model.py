@@ -5,7 +5,17 @@ Author: Christian Tognazza
 Datum: 13.04.2023
 """
 
+import heapq
+import itertools
+import math
 import random
+import time
+from collections import deque
+
+# distance reported when there is no obstacle ahead
+NO_OBSTACLE_DISTANCE = 999
+# Model.advance checks at least every x ticks if it can skip ticks
+MAX_IDLE_CHECK_INTERVAL = 32
 
 
 class Road:
@@ -17,19 +27,59 @@ class Road:
         self.direction = direction
         self.length = length
         self.generator = generator
-        self.list = self.empty_list()
-        self.cars = []
+        # positions of the cars at the start of the last tick, used for rendering
+        self.car_positions = []
+        # cars ordered by position, rearmost car first, cars enter on the left and leave on the right
+        self.cars = deque()
+        # False once a car passed the car in front of it, until the next spawn sorts again
+        self.cars_sorted = True
         self.light_signals = []
+        # index of the first light signal at or after each position
+        self.next_light_signal = []
+        # index of the first red light signal at or after each light signal index, None = no red one
+        self.next_red_light_signal = [None]
+        # the indexes are built before the first use
+        self.light_signals_changed = True
+        # grid cells of the intersections on this road by position
+        self.crossings = {}
+        # first intersection position at or after each position, None = no intersection ahead
+        self.next_crossing = [None]
+        # intersection cells held by a car, shared by all roads of the model
+        # None = cars do not block intersections
+        self.occupancy = None
+        # running traffic statistics of the road, see metrics.py, None = not collected
+        self.metrics = None
+        # event log of the model, see events.py, None = no events
+        self.events = None
+
+        # counters over the lifetime of the road
+        self.spawned = 0
+        self.exited = 0
+        self.blocked = 0
 
     def do_tick(self):
         # update the state of the road for the current tick
-        new_list = self.empty_list()
-        remove_car_indexes = []
+        if self.light_signals_changed:
+            self.index_light_signals()
+
+        self.car_positions = [car.position for car in self.cars]
+        cars_sorted = self.cars_sorted
+        exiting = 0
+        occupancy = self.occupancy
+        metrics = self.metrics
+        events = self.events
 
         # update cars positions
-        for i, car in enumerate(self.cars):
-            new_list[car.position] = car
-            distance_to_next_car = self.find_next_car_distance(i)
+        next_cars = iter(self.cars)
+        next(next_cars, None)
+        previous_position = -1
+        for car in self.cars:
+            # cars are checked against the next car's position before it moves
+            next_car = next(next_cars, None)
+            if next_car is None:
+                distance_to_next_car = NO_OBSTACLE_DISTANCE
+            else:
+                distance_to_next_car = next_car.position - car.position
             distance_to_next_light_signal = self.find_next_light_signal_distance(
                 car.position)
 
@@ -37,73 +87,261 @@ class Road:
             distance_to_next_obstacle = min(
                 distance_to_next_car, distance_to_next_light_signal)
 
+            if metrics is not None:
+                old_position, old_speed = car.position, car.speed
+
             # update car state
-            car.do_tick(distance_to_next_obstacle)
+            if occupancy is None:
+                car.do_tick(distance_to_next_obstacle)
+            else:
+                self.move_car_through_intersections(
+                    car, distance_to_next_obstacle, distance_to_next_car)
+            if metrics is not None:
+                metrics.update_car(old_position, old_speed,
+                                   car.position, car.speed)
             if car.position > self.length - 1:
-                remove_car_indexes.append(i)
+                exiting += 1
+                if events is not None:
+                    events.emit("car_exit", self, car.position, car.number)
+            if car.position < previous_position:
+                cars_sorted = False
+            previous_position = car.position
 
         # remove cars that have left the road
-        for i, remove_index in enumerate(remove_car_indexes):
-            del self.cars[remove_index-i]
-
-        # update light signals states
-        for light_signal in self.light_signals:
-            light_signal.do_tick()
+        if exiting:
+            if cars_sorted:
+                # cars in order --> the leaving cars are the front ones
+                for _ in range(exiting):
+                    self.cars.pop()
+            else:
+                self.set_cars(
+                    car for car in self.cars if car.position <= self.length - 1)
+        self.cars_sorted = self.cars_sorted and cars_sorted
+        self.exited += exiting
 
         # generate new car if wanted
         car = self.generator.do_tick()
         if car is not None:
-            try:
+            if self.is_position_taken(car.position):
+                self.block_spawn()
+            else:
+                car.number = self.spawned
                 self.add_car(car)
-            except:
-                # car cannot be added
-                # --> cars jammed up
-                # not an error state
-                print("traffic jam!")
-
-        self.list = new_list
-
-    def find_next_car_distance(self, car_index):
-        # find the distance to the next car from the current car index
-        if car_index == len(self.cars) - 1:
-            return 999
-
-        next_car = self.cars[car_index+1]
-        distance_to_next_car = next_car.position - \
-            self.cars[car_index].position
+                self.spawned += 1
+                if metrics is not None:
+                    metrics.add_car(car.position, car.speed)
+
+    def block_spawn(self):
+        # car cannot be added
+        # --> cars jammed up
+        # not an error state
+        self.blocked += 1
+        if self.events is not None:
+            self.events.emit("spawn_blocked", self, self.generator.position)
+
+    def is_spawn_blocked(self):
+        # check if the generator position is taken by a car
+        return self.is_position_taken(self.generator.position)
+
+    def is_position_taken(self, position):
+        # check if a car is at the position
+        if self.cars_sorted and (not self.cars or self.cars[0].position >= position):
+            # cars are in order, only the rearmost car can be there
+            return bool(self.cars) and self.cars[0].position == position
+        return any(car.position == position for car in self.cars)
+
+    def is_idle(self):
+        # check if the next tick would not change any car
+        if self.light_signals_changed:
+            self.index_light_signals()
+
+        next_cars = iter(self.cars)
+        next(next_cars, None)
+        for car in self.cars:
+            next_car = next(next_cars, None)
+            distance_to_next_obstacle = self.find_next_light_signal_distance(
+                car.position)
+            if next_car is not None:
+                distance_to_next_obstacle = min(
+                    distance_to_next_obstacle, next_car.position - car.position)
+            if self.occupancy is not None:
+                distance_to_next_obstacle = min(
+                    distance_to_next_obstacle, self.find_held_crossing_distance(car.position))
+            if not car.is_at_rest(distance_to_next_obstacle):
+                return False
+
+        return True
+
+    def find_held_crossing_distance(self, car_position):
+        # distance to the first intersection held by a car of another road, intersections
+        # as far away as DESIRED_CAR_OBSTACLE_DISTANCE or further do not slow a car down
+        crossing = self.next_crossing[car_position + 1]
+        while crossing is not None and crossing - car_position < DESIRED_CAR_OBSTACLE_DISTANCE:
+            if self.is_crossing_held(crossing):
+                return crossing - car_position
+            crossing = self.next_crossing[crossing + 1]
+        return NO_OBSTACLE_DISTANCE
+
+    def move_car_through_intersections(self, car, distance_to_next_obstacle, distance_to_next_car):
+        # move a car without entering intersection cells held by a car of another road
+        old_position = car.position
+        # a held intersection is an obstacle like a red light signal
+        distance_to_next_obstacle = min(
+            distance_to_next_obstacle, self.find_held_crossing_distance(old_position))
+
+        car.do_tick(distance_to_next_obstacle)
+
+        crossing = self.next_crossing[old_position + 1]
+
+        # stop in front of the first held intersection the car would drive over or into
+        while crossing is not None and crossing <= car.position:
+            if self.is_crossing_held(crossing):
+                car.position = crossing - 1
+                car.speed = 0
+                car.progress = 0
+                break
+            crossing = self.next_crossing[crossing + 1]
+
+        # cars wait in front of held intersections, so the car does not drive into
+        # the car in front (not moved yet in this tick) but stops behind it
+        if car.position >= old_position + distance_to_next_car:
+            car.position = max(old_position, old_position + distance_to_next_car - 1)
+            car.speed = 0
+            car.progress = 0
+
+        if car.position == old_position:
+            # car stayed, it still holds its intersection if it had one
+            self.hold_crossing(car)
+            return
 
-        return distance_to_next_car
+        # release the intersection the car left
+        cell = self.crossings.get(old_position)
+        if cell is not None and self.occupancy.get(cell, (None, None))[1] is car:
+            del self.occupancy[cell]
+        self.hold_crossing(car)
+
+    def is_crossing_held(self, crossing):
+        # check if an intersection is held by a car of another road
+        holder = self.occupancy.get(self.crossings[crossing])
+        return holder is not None and holder[0] is not self
+
+    def hold_crossing(self, car):
+        # let the car hold the intersection it stands on, if nobody else does
+        cell = self.crossings.get(car.position)
+        if cell is not None and cell not in self.occupancy:
+            self.occupancy[cell] = (self, car)
+
+    def index_crossings(self):
+        # rebuild the index of the next intersection at or after each position
+        self.next_crossing = [None] * (self.length + 1)
+        next_crossing = None
+        for position in reversed(range(self.length)):
+            if position in self.crossings:
+                next_crossing = position
+            self.next_crossing[position] = next_crossing
+
+    def set_cars(self, cars):
+        # replace the cars of the road, cars must be in road order
+        self.cars = deque(cars)
+        self.cars_sorted = all(
+            car.position <= next_car.position for car, next_car in zip(self.cars, list(self.cars)[1:]))
 
     def find_next_light_signal_distance(self, car_position):
-        # find the distance to the next light signal from the current car position
-        distance_to_next_light_signal = 999
-        for light_signal in self.light_signals:
-            if light_signal.position < car_position:
-                continue
-            distance = light_signal.position - car_position
-            # check if distance is lower than lowest distance before & check if light is red
-            if distance < distance_to_next_light_signal and light_signal.state == 0:
-                distance_to_next_light_signal = distance
-
-        return distance_to_next_light_signal
+        # find the distance to the next red light signal from the current car position
+        # light signals are sorted by position, so the first red one at or after the car is the closest
+        red_index = self.next_red_light_signal[self.next_light_signal[car_position]]
+        if red_index is None:
+            return NO_OBSTACLE_DISTANCE
+
+        distance = self.light_signals[red_index].position - car_position
+        # light signals further away than the sentinel are ignored
+        return min(distance, NO_OBSTACLE_DISTANCE)
+
+    def index_light_signals(self):
+        # rebuild both light signal indexes, needed when light signals are added or removed
+        self.next_light_signal = [len(self.light_signals)] * self.length
+        previous_position = -1
+        for i, light_signal in enumerate(self.light_signals):
+            for position in range(previous_position + 1, min(light_signal.position + 1, self.length)):
+                self.next_light_signal[position] = i
+            previous_position = light_signal.position
+
+        self.next_red_light_signal = [None] * (len(self.light_signals) + 1)
+        for i in reversed(range(len(self.light_signals))):
+            self.update_red_light_signal_index(i)
+
+        self.light_signals_changed = False
+
+    def update_red_light_signal_index(self, light_signal_index):
+        # a light signal changed its state, update the entries before it
+        # until one does not change anymore (walks back over green light signals only)
+        for i in reversed(range(light_signal_index + 1)):
+            if self.light_signals[i].state == 0:
+                red_index = i
+            else:
+                red_index = self.next_red_light_signal[i + 1]
+
+            if i < light_signal_index and self.next_red_light_signal[i] == red_index:
+                break
+            self.next_red_light_signal[i] = red_index
 
     def add_car(self, car):
         # add a car to the road
+        if self.cars_sorted:
+            # cars are in order, only the rearmost car can be in the way
+            if not self.cars or self.cars[0].position > car.position:
+                self.cars.appendleft(car)
+                return
+            if self.cars[0].position == car.position:
+                raise Exception("car at this position already exists")
+
         if any(existing_car.position == car.position for existing_car in self.cars):
             raise Exception("car at this position already exists")
-        self.cars.append(car)
         # sort cars by position for easier updates
-        self.cars.sort(key=lambda car: car.position)
+        self.cars = deque(
+            sorted([*self.cars, car], key=lambda car: car.position))
+        self.cars_sorted = True
+
+    def find_light_signal_slot(self, position):
+        # index of the first light signal at or after the position (binary search,
+        # the light signal index may be outdated while light signals change)
+        low, high = 0, len(self.light_signals)
+        while low < high:
+            middle = (low + high) // 2
+            if self.light_signals[middle].position < position:
+                low = middle + 1
+            else:
+                high = middle
+
+        return low
+
+    def find_light_signal(self, position):
+        # index of the light signal at the position, None if there is none
+        index = self.find_light_signal_slot(position)
+        if index < len(self.light_signals) and self.light_signals[index].position == position:
+            return index
+        return None
 
     def add_light_signal(self, light_signal):
-        if any(existing_light_signal.position == light_signal.position for existing_light_signal in self.light_signals):
+        if not self.light_signals or self.light_signals[-1].position < light_signal.position:
+            # light signals added in road order stay sorted
+            self.light_signals.append(light_signal)
+            self.light_signals_changed = True
+            return
+
+        index = self.find_light_signal_slot(light_signal.position)
+        if self.light_signals[index].position == light_signal.position:
             raise Exception("light signal at this position already exists")
-        self.light_signals.append(light_signal)
-        self.light_signals.sort(key=lambda light_signal: light_signal.position)
+        self.light_signals.insert(index, light_signal)
+        self.light_signals_changed = True
 
-    def empty_list(self):
-        # create an empty list for the road's list
-        return [None for _ in range(self.length)]
+    def remove_light_signal(self, light_signal_index):
+        del self.light_signals[light_signal_index]
+        self.light_signals_changed = True
+
+    def clear_light_signals(self):
+        self.light_signals = []
+        self.light_signals_changed = True
 
 
 # anything below 4 cells distance between is considered critical and deceleration is needed
@@ -119,11 +357,15 @@ MAX_DECELERATION_STRENGTH = 4
 
 
 class Car:
-    def __init__(self, speed, max_speed, position):
+    __slots__ = ["speed", "max_speed", "position", "progress", "number"]
+
+    def __init__(self, speed, max_speed, position, number=-1):
         self.speed = speed
         self.max_speed = max_speed
         self.position = position
         self.progress = 0
+        # n-th car spawned on its road, identifies the car in exported trajectories
+        self.number = number
 
     def do_tick(self, distance_to_next_obstacle):
         # update the state of the car for the current tick (frame)
@@ -146,6 +388,16 @@ class Car:
         self.position += int(self.progress // 100)
         self.progress = self.progress % 100
 
+    def is_at_rest(self, distance_to_next_obstacle):
+        # check if a tick would leave the car unchanged
+        # (stopped in front of an obstacle, or braked down to a speed too small to add progress)
+        state = (self.speed, self.progress, self.position)
+        self.do_tick(distance_to_next_obstacle)
+        at_rest = (self.speed, self.progress, self.position) == state
+        self.speed, self.progress, self.position = state
+
+        return at_rest
+
     def accelerate(self):
         # increase the cars speed by percentage of max speed based on ACCELERATION_DIVIDER
         if self.speed < self.max_speed:
@@ -168,12 +420,15 @@ class Car:
 
 
 class CarGenerator:
-    def __init__(self, position=0, delay=10, min_speed=75, max_speed=125):
+    def __init__(self, position=0, delay=10, min_speed=75, max_speed=125, rng=None):
         self.position = position
         self.delay = delay
         self.min_speed = min_speed
         self.max_speed = max_speed
         self.progress = 0
+        # random number stream of this generator, a Model hands out its own
+        # seeded streams to generators without one
+        self.rng = rng
 
     def do_tick(self):
         # generate a new car after x ticks delay
@@ -183,7 +438,7 @@ class CarGenerator:
 
         self.progress = 0
         # choose random max_speed based on min and max
-        max_speed = random.randint(self.min_speed, self.max_speed)
+        max_speed = self.rng.randint(self.min_speed, self.max_speed)
         car = Car(
             # start of with half of the max speed
             speed=max_speed / 2,
@@ -193,9 +448,13 @@ class CarGenerator:
 
         return car
 
+    def ticks_until_spawn(self):
+        # number of ticks before the tick in which the next car is generated
+        return max(0, self.delay - self.progress)
+
 
 class LightSignal:
-    def __init__(self, position, red_duration=60, green_duration=40, red_delay=5, state=0):
+    def __init__(self, position, red_duration=60, green_duration=40, red_delay=5, state=0, start_tick=0):
         if red_duration <= green_duration:
             raise Exception("red_duration must be greater than green_duration")
 
@@ -205,70 +464,398 @@ class LightSignal:
         self.red_delay = red_delay
         # state of 0 = red, 1 = green
         self.state = state
-        self.progress = 0
+        self.initial_state = state
+        # the state only depends on the number of ticks since the light signal was created
+        self.start_tick = start_tick
 
         # add an offset so lights stay red
         # avoids crashes, allows other cars on intersections to pass before turning green
+        progress = 0
         if self.state == 0:
             offset = (red_duration - green_duration) / 2
-            self.progress = self.progress + offset
-
-    def do_tick(self):
-        # update the state of the light signal
-        if self.state == 1 and self.progress >= self.green_duration:
-            self.state = 0
-            self.progress = 0
-
-        elif self.state == 0 and self.progress >= self.red_duration:
-            self.state = 1
-            self.progress = 0
-
-        self.progress += 1
+            progress = progress + offset
+
+        # number of ticks the initial state lasts, afterwards the light signal
+        # cycles through the other state and the initial state
+        self.first_duration = max(
+            0, math.ceil(self.duration(state) - progress)) + 1
+        self.cycle_duration = red_duration + green_duration
+
+    def duration(self, state):
+        # number of ticks a state lasts
+        return self.red_duration if state == 0 else self.green_duration
+
+    def state_at(self, tick):
+        # state of the light signal seen by cars in the given tick
+        ticks = tick - self.start_tick
+        if ticks < self.first_duration:
+            return self.initial_state
+
+        phase = (ticks - self.first_duration) % self.cycle_duration
+        if phase < self.duration(1 - self.initial_state):
+            return 1 - self.initial_state
+        return self.initial_state
+
+    def next_change_tick(self, tick):
+        # first tick after the given tick in which the state is different
+        ticks = tick - self.start_tick
+        if ticks < self.first_duration:
+            return self.start_tick + self.first_duration
+
+        phase = (ticks - self.first_duration) % self.cycle_duration
+        other_duration = self.duration(1 - self.initial_state)
+        if phase < other_duration:
+            return tick + other_duration - phase
+        return tick + self.cycle_duration - phase
 
 
 class Model:
-    def __init__(self, size):
+    def __init__(self, size, engine="object", render_grid=True, block_intersections=False, seed=None, sparse=False):
+        if engine not in ["object", "numpy", "event"]:
+            raise Exception("engine must be object, numpy or event")
+        if block_intersections and engine != "object":
+            raise Exception(
+                "blocking intersections is only supported by the object engine")
+
         self.size = size
-        self.grid = self.empty_grid(self.size)
-        self.border_frame = self.empty_border_grid(self.size)
+        # all randomness of a model comes from this generator, the same seed gives the same run
+        self.random = random.Random(seed)
+        # a sparse model only stores its roads, no size x size grids,
+        # its cells are rendered on demand for a region with render_region
+        self.sparse = sparse
+        self.grid = None
+        self.border_grid = None
+        # road cells without cars and light signals, only changes with the roads
+        self.static_grid = None
+        if not sparse:
+            self.grid = self.empty_grid(self.size)
+            self.border_grid = self.empty_border_grid(self.size)
+            self.static_grid = self.empty_grid(self.size)
         self.roads = []
-        self.intersections = []
+        # (direction, offset) --> road
+        self.roads_by_offset = {}
+        # intersection points (x, y)
+        self.intersections = set()
+        # number of ticks done, light signal states are a function of it
+        self.tick = 0
+        # heap of (tick of next state change, order, road, light signal)
+        # entries of removed light signals are dropped when they come up
+        self.light_signal_changes = []
+        self.light_signal_order = itertools.count()
+        # headless runs without a view can skip rendering the grid
+        self.render_grid = render_grid and not sparse
+        # intersection cell --> (road, car) holding it, shared by all roads
+        # a car cannot enter an intersection held by a car of a crossing road
+        self.occupancy = {} if block_intersections else None
+        # cells holding a car or light signal in the last rendered grid
+        self.dynamic_cells = set()
+        # cells that changed with the last tick, None if every cell may have changed
+        self.changed_cells = None
+        # road cells added or removed since the last rendered tick
+        self.static_changes = set()
+        self.redraw_all = True
+        # opt-in timings of the tick phases, see instrumentation.py, None = not measured
+        self.instrumentation = None
+        # opt-in trajectory export, see export.py, None = nothing is exported
+        self.exporter = None
+        # opt-in running traffic statistics, see metrics.py and set_metrics
+        self.metrics = None
+        # opt-in event log, see events.py and set_events
+        self.events = None
+        # number of changes to the roads, light signals or generators, ticks after a change
+        # cannot be simulated from a state before it (see replay.py)
+        self.changes = 0
+
+        # the object engine runs Road.do_tick for every road,
+        # the numpy engine updates the cars of all roads at once as arrays,
+        # the event engine only updates the cars that can meet an obstacle in the tick
+        self.engine = None
+        if engine == "numpy":
+            from numpy_engine import NumpyEngine
+            self.engine = NumpyEngine(self)
+        elif engine == "event":
+            from event_engine import EventEngine
+            self.engine = EventEngine(self)
 
     def add_road(self, road):
         # add a road to the model
-        for road_iteration in self.roads:
-            if road.offset == road_iteration.offset and road.direction == road_iteration.direction:
+        self.add_roads([road])
+
+    def add_roads(self, roads):
+        # add several roads at once, only the intersections of the new roads are calculated,
+        # the other roads keep their cars and light signal phases
+        # no road is added if one of them is invalid
+        offsets = set()
+        for road in roads:
+            key = (road.direction, road.offset)
+            if key in self.roads_by_offset or key in offsets:
                 raise Exception("road already exists")
 
-        if road.offset >= self.size or road.offset in [0, self.size - 1]:
-            raise Exception(
-                "road offset cannot be on the edge or bigger or equal to size")
-
-        self.roads.append(road)
-        self.calculate_intersection_light_signals()
+            if road.offset >= self.size or road.offset in [0, self.size - 1]:
+                raise Exception(
+                    "road offset cannot be on the edge or bigger or equal to size")
+            offsets.add(key)
+
+        for road in roads:
+            if road.generator.rng is None:
+                road.generator.rng = self.new_random_stream()
+
+        start = time.perf_counter()
+        self.changes += 1
+        self.store_engine_cars()
+        self.roads.extend(roads)
+        for road in roads:
+            self.roads_by_offset[(road.direction, road.offset)] = road
+            road.events = self.events
+            if self.events is not None:
+                self.events.emit("road_added", road)
+        self.connect_roads(roads)
+        self.load_engine_cars()
+        for road in roads:
+            self.render_road_layer(road, 1)
+        if self.instrumentation is not None:
+            # intersections, engine reload and grid update of the topology change
+            self.instrumentation.record(
+                "Model.add_roads", time.perf_counter() - start)
+
+    def remove_roads(self, roads):
+        # remove several roads at once, only the intersections of the removed roads are calculated,
+        # the other roads keep their cars and light signal phases
+        # in the given order (without duplicates), so events and light signal changes are seeded
+        removed = dict.fromkeys(roads)
+        for road in removed:
+            if self.roads_by_offset.get((road.direction, road.offset)) is not road:
+                raise Exception("road does not exist")
+
+        start = time.perf_counter()
+        self.changes += 1
+        self.store_engine_cars()
+        self.roads = [road for road in self.roads if road not in removed]
+        self.disconnect_roads(removed)
+        for road in removed:
+            del self.roads_by_offset[(road.direction, road.offset)]
+            road.events = None
+            if self.events is not None:
+                self.events.emit("road_removed", road)
+        self.load_engine_cars()
+        for road in removed:
+            self.render_road_layer(road, 0)
+        if self.instrumentation is not None:
+            self.instrumentation.record(
+                "Model.remove_roads", time.perf_counter() - start)
 
     def clear_roads(self, direction):
-        # clear all roads in the given direction
+        # remove all roads in the given direction
         if direction not in ["vertical", "horizontal"]:
             raise Exception("invalid road direction")
 
-        self.roads = [
-            road for road in self.roads if road.direction != direction]
-        for road in self.roads:
-            road.cars = []
+        self.remove_roads(
+            [road for road in self.roads if road.direction == direction])
 
-        self.calculate_intersection_light_signals()
+    def set_num_roads(self, num_roads, direction):
+        # change the number of roads in the given direction, the last added roads are removed first
+        # and new roads get random free offsets, all other roads keep their cars
+        if direction not in ["vertical", "horizontal"]:
+            raise Exception("invalid road direction")
+        if not 0 <= num_roads <= self.size - 2:
+            # every road needs its own offset between the edges of the grid
+            raise ValueError(
+                f"roads must be between 0 and {self.size - 2} per direction for size {self.size}")
+
+        existing_roads = [
+            road for road in self.roads if road.direction == direction]
+        if num_roads < len(existing_roads):
+            self.remove_roads(existing_roads[num_roads:])
+            return
+
+        offsets = {road.offset for road in existing_roads}
+        # new roads get the generator settings of the existing roads
+        settings = self.roads[0].generator if self.roads else CarGenerator()
+        roads = []
+        for _ in range(num_roads - len(existing_roads)):
+            offset = self.random.randint(1, self.size-2)
+            while offset in offsets:
+                # offset is already used
+                # try again with new random value
+                offset = self.random.randint(1, self.size-2)
+            offsets.add(offset)
+            roads.append(
+                Road(
+                    offset=offset,
+                    direction=direction,
+                    length=self.size,
+                    # random streams are handed out in the same order as by add_road
+                    generator=CarGenerator(
+                        delay=settings.delay,
+                        min_speed=settings.min_speed,
+                        max_speed=settings.max_speed,
+                        rng=self.new_random_stream()
+                    )
+                )
+            )
+
+        self.add_roads(roads)
+
+    def new_random_stream(self):
+        # independent random stream for a car generator, derived from the model seed
+        return random.Random(self.random.getrandbits(64))
+
+    def store_engine_cars(self):
+        # write the cars of the engine back to the roads before the roads change
+        if self.engine is not None:
+            self.engine.store_roads()
+
+    def load_engine_cars(self):
+        # hand the (changed) roads and their cars back to the engine
+        if self.engine is not None:
+            self.engine.load_roads()
+
+    def snapshot(self):
+        # full state of the model as compact bytes, see snapshot.py
+        from snapshot import write_snapshot
+        return write_snapshot(self)
+
+    @classmethod
+    def restore(cls, data, engine="object", render_grid=True, sparse=False):
+        # create a model from bytes of Model.snapshot, it continues exactly like the original
+        from snapshot import read_snapshot
+        return read_snapshot(data, engine=engine, render_grid=render_grid, sparse=sparse)
+
+    def connect_roads(self, roads):
+        # add the intersections of new roads, the light signals of the crossing roads
+        # only change around the new intersections
+        new_roads = set(roads)
+        # ordered like the roads, the changed roads are indexed in this order
+        changed_roads = dict.fromkeys(roads)
+        crossings = []
+        for road in roads:
+            for crossing_road in self.roads:
+                if crossing_road.direction == road.direction:
+                    continue
+                if crossing_road in new_roads:
+                    # both roads are new, the intersection is added from the vertical one
+                    if road.direction == "vertical":
+                        self.connect(road, crossing_road)
+                    continue
+                self.connect(road, crossing_road)
+                crossings.append((crossing_road, road.offset))
+                changed_roads[crossing_road] = None
+
+        for road in roads:
+            road.clear_light_signals()
+            for crossing in sorted(road.crossings):
+                self.update_light_signal(road, crossing)
+        for road, crossing in crossings:
+            # the new intersection can take the light signals of the next two positions
+            for position in range(crossing, crossing + 3):
+                self.update_light_signal(road, position)
+
+        self.update_changed_roads(changed_roads)
+
+    def disconnect_roads(self, roads):
+        # remove the intersections of removed roads, the light signals of the crossing roads
+        # only change around the removed intersections
+        changed_roads = {}
+        crossings = []
+        for road in roads:
+            crossing_direction = "horizontal" if road.direction == "vertical" else "vertical"
+            for crossing, cell in road.crossings.items():
+                if self.occupancy is not None:
+                    # the cell is no intersection anymore, whoever held it
+                    self.occupancy.pop(cell, None)
+                if road.direction == "vertical":
+                    self.intersections.discard((crossing, road.offset))
+                else:
+                    self.intersections.discard((road.offset, crossing))
+
+                crossing_road = self.roads_by_offset[(
+                    crossing_direction, crossing)]
+                if crossing_road in roads:
+                    continue
+                del crossing_road.crossings[road.offset]
+                crossings.append((crossing_road, road.offset))
+                changed_roads[crossing_road] = None
+
+        for road in roads:
+            road.crossings = {}
+            road.clear_light_signals()
+            road.metrics = None
+        for road, crossing in crossings:
+            # a light signal shared with the removed intersection can be needed again
+            for position in range(crossing, crossing + 3):
+                self.update_light_signal(road, position)
+
+        self.update_changed_roads(changed_roads)
+
+    def connect(self, road, crossing_road):
+        # add the intersection of two crossing roads, they share its grid cell
+        if road.direction == "vertical":
+            vertical_road, horizontal_road = road, crossing_road
+        else:
+            vertical_road, horizontal_road = crossing_road, road
+
+        self.intersections.add((horizontal_road.offset, vertical_road.offset))
+        cell = self.cell_index(vertical_road.offset, horizontal_road.offset)
+        vertical_road.crossings[horizontal_road.offset] = cell
+        horizontal_road.crossings[vertical_road.offset] = cell
+
+    def update_light_signal(self, road, crossing):
+        # add or remove the light signal one position before the intersection at crossing
+        # an intersection one or two cells after another one has no light signal of its own
+        # (same rule as calculate_intersection_light_signals)
+        needed = crossing in road.crossings and crossing - 1 not in road.crossings \
+            and crossing - 2 not in road.crossings
+        index = road.find_light_signal(crossing - 1)
+        if needed and index is None:
+            self.add_intersection_light_signal(road, crossing)
+        elif not needed and index is not None:
+            road.remove_light_signal(index)
+
+    def add_intersection_light_signal(self, road, crossing):
+        # vertical roads start red and horizontal roads green, a light signal added to an
+        # existing intersection continues opposite to the light signal of the crossing road
+        crossing_direction = "horizontal" if road.direction == "vertical" else "vertical"
+        crossing_road = self.roads_by_offset[(crossing_direction, crossing)]
+        index = crossing_road.find_light_signal(road.offset - 1)
+        if index is None:
+            state = 0 if road.direction == "vertical" else 1
+            start_tick = self.tick
+        else:
+            state = 1 - crossing_road.light_signals[index].initial_state
+            start_tick = crossing_road.light_signals[index].start_tick
+
+        light_signal = LightSignal(
+            position=crossing - 1, state=state, start_tick=start_tick)
+        light_signal.state = light_signal.state_at(self.tick)
+        road.add_light_signal(light_signal)
+        heapq.heappush(self.light_signal_changes, (light_signal.next_change_tick(
+            self.tick), next(self.light_signal_order), road, light_signal))
+
+    def update_changed_roads(self, roads):
+        # update the indexes of roads whose intersections changed
+        if self.occupancy is not None:
+            for road in roads:
+                road.occupancy = self.occupancy
+                road.index_crossings()
+                for car in road.cars:
+                    road.hold_crossing(car)
+        if self.metrics is not None:
+            self.metrics.index_roads(self.roads, changed=roads)
 
     def calculate_intersection_light_signals(self):
         # calculate light signales at intersections, clear old light signales
-        self.intersections = []
+        # (full recalculation, roads added or removed later only update their intersections)
+        # the engine indexes the light signals, it gets the roads again afterwards
+        self.changes += 1
+        self.store_engine_cars()
         for road in self.roads:
-            road.light_signals = []
+            road.clear_light_signals()
         # isolate vertical and horizontal roads
-        vertical_roads = [
-            road for road in self.roads if road.direction == "vertical"]
-        horizontal_roads = [
-            road for road in self.roads if road.direction == "horizontal"]
+        # ordered by offset, so the light signals are added in the order of their positions
+        vertical_roads = sorted((
+            road for road in self.roads if road.direction == "vertical"), key=lambda road: road.offset)
+        horizontal_roads = sorted((
+            road for road in self.roads if road.direction == "horizontal"), key=lambda road: road.offset)
 
         for vertical_road in vertical_roads:
             for horizontal_road in horizontal_roads:
@@ -281,7 +868,8 @@ class Model:
                     LightSignal(
                         # vertical road --> need x position -1
                         position=intersection_point[0] - 1,
-                        state=0
+                        state=0,
+                        start_tick=self.tick
                     )
                 )
 
@@ -289,7 +877,8 @@ class Model:
                     LightSignal(
                         # horizontal road --> need y position -1
                         position=intersection_point[1] - 1,
-                        state=1
+                        state=1,
+                        start_tick=self.tick
                     )
                 )
 
@@ -313,70 +902,445 @@ class Model:
             # can remove them directly, since we reversed the list beforehand
             # --> we have reversed indexes, e.g. [5, 2, 1]
             for remove_index in light_signal_remove_indexes:
-                del road.light_signals[remove_index]
+                road.remove_light_signal(remove_index)
+
+        self.index_intersections()
+        self.schedule_light_signals()
+        self.index_occupancy()
+        self.index_metrics()
+        self.load_engine_cars()
+
+    def set_metrics(self, metrics):
+        # start collecting traffic statistics, None stops it
+        self.store_engine_cars()
+        if self.metrics is not None:
+            for road in self.roads:
+                road.metrics = None
+        self.metrics = metrics
+        self.index_metrics()
+        self.load_engine_cars()
+
+    def set_events(self, events):
+        # start creating events, None stops it
+        self.events = events
+        for road in self.roads:
+            road.events = events
+        if events is not None:
+            events.tick = self.tick
+
+    def index_metrics(self):
+        # hand the statistics of every road to the road, counted from its cars
+        if self.metrics is not None:
+            self.metrics.index_roads(self.roads)
+
+    def index_intersections(self):
+        # find the intersection points, crossing roads share the grid cell of their intersection
+        self.intersections = set()
+        self.roads_by_offset = {}
+        for road in self.roads:
+            road.crossings = {}
+            self.roads_by_offset[(road.direction, road.offset)] = road
+
+        for vertical_road in self.roads:
+            if vertical_road.direction != "vertical":
+                continue
+            for horizontal_road in self.roads:
+                if horizontal_road.direction != "horizontal":
+                    continue
+
+                self.connect(vertical_road, horizontal_road)
+
+    def schedule_light_signals(self):
+        # queue the next state change of every light signal
+        self.light_signal_changes = []
+        self.light_signal_order = itertools.count()
+        for road in self.roads:
+            for light_signal in road.light_signals:
+                light_signal.state = light_signal.state_at(self.tick)
+                self.light_signal_changes.append(
+                    (light_signal.next_change_tick(self.tick), next(self.light_signal_order), road, light_signal))
+        heapq.heapify(self.light_signal_changes)
+
+    def update_light_signals(self):
+        # switch the light signals whose state changes with the current tick,
+        # all others are untouched
+        changes = self.light_signal_changes
+        while changes and changes[0][0] <= self.tick:
+            _, order, road, light_signal = changes[0]
+            if road.light_signals_changed:
+                i = road.find_light_signal(light_signal.position)
+            else:
+                i = road.next_light_signal[light_signal.position]
+            if i is None or i >= len(road.light_signals) or road.light_signals[i] is not light_signal:
+                # the light signal was removed with its intersection
+                heapq.heappop(changes)
+                continue
+
+            light_signal.state = light_signal.state_at(self.tick)
+            if not road.light_signals_changed:
+                # otherwise the index is rebuilt from the states anyway
+                road.update_red_light_signal_index(i)
+            if self.events is not None:
+                self.events.emit("signal_change", road,
+                                 light_signal.position, light_signal.state)
+            heapq.heapreplace(
+                changes, (light_signal.next_change_tick(self.tick), order, road, light_signal))
+
+    def index_occupancy(self):
+        # hand the shared occupancy to the roads and let cars on intersections hold them again
+        if self.occupancy is None:
+            return
+
+        self.occupancy.clear()
+        for road in self.roads:
+            road.occupancy = self.occupancy
+            road.index_crossings()
+            for car in road.cars:
+                road.hold_crossing(car)
 
     def do_tick(self):
         # perform a full tick and update the model
-        self.grid = self.empty_grid(self.size)
-        self.border_grid = self.empty_border_grid(self.size)
+        if self.instrumentation is not None:
+            self.do_instrumented_tick()
+            return
+
+        if self.events is not None:
+            self.events.tick = self.tick
+        if self.engine is not None:
+            self.engine.do_tick()  # execute road logic of all roads at once
+        else:
+            for road in self.roads:
+                road.do_tick()  # execute road logic
+
+        self.tick += 1
+        if self.events is not None:
+            # light signals change for the next tick
+            self.events.tick = self.tick
+        self.update_light_signals()
+
+        if self.exporter is not None:
+            self.exporter.record(self)
+        if self.metrics is not None:
+            self.metrics.end_tick(self.roads)
+
+        if self.render_grid:
+            self.render_dynamic_cells()
+
+    def do_instrumented_tick(self):
+        # same as do_tick, with the duration of every phase recorded
+        instrumentation = self.instrumentation
+        instrumentation.begin_tick(self.tick)
+        clock = time.perf_counter
+        if self.events is not None:
+            self.events.tick = self.tick
+
+        start = clock()
+        if self.engine is not None:
+            self.engine.do_tick()
+            instrumentation.record(
+                type(self.engine).__name__ + ".do_tick", clock() - start)
+        else:
+            for road in self.roads:
+                road_start = clock()
+                road.do_tick()
+                instrumentation.record("Road.do_tick", clock() - road_start)
+
+        self.tick += 1
+        if self.events is not None:
+            self.events.tick = self.tick
+        start = clock()
+        self.update_light_signals()
+        instrumentation.record("Model.update_light_signals", clock() - start)
+
+        if self.exporter is not None:
+            start = clock()
+            self.exporter.record(self)
+            instrumentation.record("TrajectoryExporter.record", clock() - start)
+        if self.metrics is not None:
+            start = clock()
+            self.metrics.end_tick(self.roads)
+            instrumentation.record("TrafficMetrics.end_tick", clock() - start)
+
+        if self.render_grid:
+            start = clock()
+            self.render_dynamic_cells()
+            instrumentation.record(
+                "Model.render_dynamic_cells", clock() - start)
+
+        instrumentation.count(self.roads, self.count_cars())
+
+    def advance(self, ticks):
+        # perform the given number of ticks, ticks in which no car moves
+        # or spawns are skipped instead of being executed one by one
+        end = self.tick + ticks
+        skipped = False
+        # checking for idle ticks costs about as much as a tick,
+        # so after a failed check the next one is done later and later
+        check_interval = 1
+        next_check = self.tick
+        while self.tick < end:
+            skip_to = self.tick
+            if self.tick >= next_check:
+                skip_to = self.find_idle_end(end)
+                if skip_to == self.tick:
+                    check_interval = min(2 * check_interval, MAX_IDLE_CHECK_INTERVAL)
+                    next_check = self.tick + check_interval
+                else:
+                    check_interval = 1
+
+            if skip_to == self.tick:
+                self.do_tick()
+                skipped = False
+                continue
+
+            self.skip_idle_ticks(skip_to)
+            next_check = self.tick
+            skipped = True
+
+        if skipped and (self.render_grid or self.sparse):
+            # no car moved in the skipped ticks, cars that left with the last executed tick are gone
+            self.refresh_car_positions()
+            if self.render_grid:
+                self.render_dynamic_cells()
+
+    def is_idle(self):
+        # check if no car moves in the next tick
+        if self.engine is not None:
+            return self.engine.is_idle()
+        return all(road.is_idle() for road in self.roads)
+
+    def is_spawn_blocked(self, road_index):
+        if self.engine is not None:
+            return self.engine.is_spawn_blocked(road_index)
+        return self.roads[road_index].is_spawn_blocked()
+
+    def find_idle_end(self, end):
+        # find the first tick (at most end) in which something can happen,
+        # the current tick if cars are moving
+        if not self.is_idle():
+            return self.tick
+
+        # a light signal change can let cars drive again
+        if self.light_signal_changes:
+            end = min(end, self.light_signal_changes[0][0])
+
+        # a generated car drives unless the generator position is taken
+        for road_index, road in enumerate(self.roads):
+            spawn_tick = self.tick + road.generator.ticks_until_spawn()
+            if spawn_tick < end and not self.is_spawn_blocked(road_index):
+                end = spawn_tick
+
+        return end
+
+    def skip_idle_ticks(self, end):
+        # jump to the given tick without moving cars,
+        # blocked spawns still draw their random numbers in the original order
+        synced_ticks = [self.tick] * len(self.roads)
+        spawns = []
+        for road_index, road in enumerate(self.roads):
+            spawn_tick = self.tick + road.generator.ticks_until_spawn()
+            if spawn_tick < end:
+                spawns.append((spawn_tick, road_index))
+        heapq.heapify(spawns)
+
+        while spawns:
+            spawn_tick, road_index = heapq.heappop(spawns)
+            if self.exporter is not None:
+                # samples of the ticks before this spawn still have the old counters
+                self.exporter.record_skipped(self, spawn_tick)
+            road = self.roads[road_index]
+            road.generator.progress += spawn_tick - synced_ticks[road_index]
+            road.generator.do_tick()
+            if self.events is not None:
+                self.events.tick = spawn_tick
+            road.block_spawn()
+            synced_ticks[road_index] = spawn_tick + 1
+
+            spawn_tick += road.generator.ticks_until_spawn() + 1
+            if spawn_tick < end:
+                heapq.heappush(spawns, (spawn_tick, road_index))
+
+        for road, synced_tick in zip(self.roads, synced_ticks):
+            road.generator.progress += end - synced_tick
+
+        if self.exporter is not None:
+            self.exporter.record_skipped(self, end)
+        if self.metrics is not None:
+            self.metrics.skip_ticks(self.roads, end - self.tick)
+        self.tick = end
+        if self.events is not None:
+            self.events.tick = end
+        self.update_light_signals()
+
+    def refresh_car_positions(self):
+        # rendered car positions after ticks in which no car moved
+        if self.engine is not None:
+            self.engine.refresh_car_positions()
+            return
 
         for road in self.roads:
-            road.do_tick()  # execute road logic
-            self.render_road(road)  # render road to the grid
+            road.car_positions = [car.position for car in road.cars]
+
+    def render_dynamic_cells(self):
+        # overlay cars and light signals on the static road layer
+        # and collect the cells that changed since the last rendered tick
+        if self.engine is not None:
+            self.engine.update_car_positions()
+        previous_cells = {
+            cell: (self.grid[cell], self.border_grid[cell]) for cell in self.dynamic_cells}
+        # reset last tick's cars and light signals to the static layer
+        for cell in self.dynamic_cells:
+            self.grid[cell] = self.static_grid[cell]
+            self.border_grid[cell] = 5
+
+        self.dynamic_cells = set()
+        instrumentation = self.instrumentation
+        for road in self.roads:
+            if instrumentation is None:
+                self.render_road(road)  # render cars and light signals to the grid
+                continue
+            start = time.perf_counter()
+            self.render_road(road)
+            instrumentation.record(
+                "Model.render_road", time.perf_counter() - start)
+
+        if self.redraw_all:
+            self.redraw_all = False
+            self.changed_cells = None
+            self.static_changes = set()
+            return
+
+        # road cells of added or removed roads changed as well
+        self.changed_cells = self.static_changes
+        self.static_changes = set()
+        for cell in self.dynamic_cells | previous_cells.keys():
+            previous = previous_cells.get(cell, (self.static_grid[cell], 5))
+            if (self.grid[cell], self.border_grid[cell]) != previous:
+                self.changed_cells.add(cell)
+
+    def render_road_layer(self, road, code):
+        # set the road cells of an added (1) or removed (0) road in the static layer,
+        # intersections with remaining roads stay road cells
+        if self.sparse:
+            return
+
+        start = time.perf_counter()
+        crossing_direction = "horizontal" if road.direction == "vertical" else "vertical"
+        first_cell, cell_step = self.road_cells(road)
+        for position in range(road.length):
+            if code == 0 and (crossing_direction, position) in self.roads_by_offset:
+                continue
+            cell = first_cell + position * cell_step
+            self.static_grid[cell] = code
+            if cell not in self.dynamic_cells:
+                # cars and light signals are reset to the static layer with the next rendered tick
+                self.grid[cell] = code
+            self.static_changes.add(cell)
+        if self.instrumentation is not None:
+            self.instrumentation.record(
+                "Model.render_road_layer", time.perf_counter() - start)
+
+    def road_cells(self, road):
+        # first grid index of the road and the index step between two positions on it
+        if road.direction == "vertical":
+            return road.offset * self.size, 1
+        return road.offset, self.size
+
+    def cell_index(self, x, y):
+        # grids are stored as flat byte arrays, column by column
+        return x * self.size + y
+
+    def count_cars(self):
+        # number of cars currently on all roads
+        if self.engine is not None:
+            return self.engine.count_cars()
+        return sum(len(road.cars) for road in self.roads)
 
     def update_generators_speed(self, min_speed, max_speed):
-        # re-initiate generator in all roads with new min/max speeds
+        # set the min/max speeds of the generators of all roads,
+        # the generators keep their progress towards the next car
+        self.changes += 1
         for road in self.roads:
-            road.generator = CarGenerator(
-                position=0,
-                delay=road.generator.delay,
-                min_speed=min_speed,
-                max_speed=max_speed
-            )
+            road.generator.min_speed = min_speed
+            road.generator.max_speed = max_speed
+
+    def set_generator_avg_speed(self, avg_speed):
+        # spread min/max speed by a quarter around the average speed
+        min_speed = int(avg_speed - (avg_speed / 4))
+        max_speed = int(avg_speed + (avg_speed / 4))
+
+        self.update_generators_speed(min_speed, max_speed)
 
     def update_generators_delay(self, delay):
-        # re-initiate generator in all roads with new delay
+        # set the delay of the generators of all roads, a generator that already
+        # waited longer than the new delay generates its next car in the next tick
+        self.changes += 1
         for road in self.roads:
-            road.generator = CarGenerator(
-                position=road.generator.position,
-                delay=delay,
-                min_speed=road.generator.min_speed,
-                max_speed=road.generator.max_speed
-            )
+            road.generator.delay = delay
 
     def render_road(self, road):
         # assign the right values to the grid for this road
+        start, step = self.road_cells(road)
         for light_signal in road.light_signals:
-            # calculate (x, y) based on road direction, offset and light signal position on the riad
-            x, y = (road.offset, light_signal.position) if road.direction == "vertical" else (
-                light_signal.position, road.offset)
+            # calculate the cell based on road direction, offset and light signal position on the road
+            cell = start + light_signal.position * step
 
             # red = 0 state, green = 1 state
             # in our color map, the colors are + 3 from our binary light signal state
-            self.grid[x][y] = light_signal.state + 3
-            self.border_grid[x][y] = light_signal.state + 3
-
-        for position, car in enumerate(road.list):
-            # calculate (x, y) like light signal
-            x, y = (road.offset, position) if road.direction == "vertical" else (
-                position, road.offset)
-            if car is not None:
-                self.grid[x][y] = 2  # digit code for blue
-            elif self.grid[x][y] == 0:  # only set road if cell is not light signal and not car
-                self.grid[x][y] = 1  # digit code for empty road
+            self.grid[cell] = light_signal.state + 3
+            self.border_grid[cell] = light_signal.state + 3
+            self.dynamic_cells.add(cell)
+
+        for position in road.car_positions:
+            # calculate the cell like light signal
+            cell = start + position * step
+            self.grid[cell] = 2  # digit code for blue
+            self.dynamic_cells.add(cell)
+
+    def render_region(self, x, y, width, height):
+        # render the cells of a region like the grid, works without grids (sparse models)
+        # returns grid and border grid of the region, indexed by (x - region x) * height + (y - region y)
+        if self.engine is not None:
+            self.engine.update_car_positions()
+        grid = bytearray(width * height)
+        border_grid = bytearray([5]) * (width * height)
+        roads = []
+        for road in self.roads:
+            # first and last road position inside the region and the cell of the first position
+            if road.direction == "vertical":
+                if not x <= road.offset < x + width:
+                    continue
+                first, last = y, y + height - 1
+                start, step = (road.offset - x) * height - y, 1
+            else:
+                if not y <= road.offset < y + height:
+                    continue
+                first, last = x, x + width - 1
+                start, step = road.offset - y - x * height, height
+            first, last = max(first, 0), min(last, road.length - 1)
+            roads.append((road, first, last, start, step))
 
-    def empty_grid(self, size):
-        # create an empty grid
-        grid = [0] * size  # 0 = white
-        for x in range(size):
-            grid[x] = [0] * size
+            for position in range(first, last + 1):
+                grid[start + position * step] = 1  # digit code for empty road
 
-        return grid
+        # cars and light signals on top, in the order of render_dynamic_cells
+        for road, first, last, start, step in roads:
+            for light_signal in road.light_signals:
+                if first <= light_signal.position <= last:
+                    cell = start + light_signal.position * step
+                    grid[cell] = light_signal.state + 3
+                    border_grid[cell] = light_signal.state + 3
+
+            for position in road.car_positions:
+                if first <= position <= last:
+                    grid[start + position * step] = 2  # digit code for blue
+
+        return grid, border_grid
+
+    def empty_grid(self, size):
+        # create an empty grid, one byte per cell
+        return bytearray(size * size)  # 0 = white
 
     def empty_border_grid(self, size):
         # create an empty border grid
-        grid = [5] * size  # 5 = lightgrey
-        for x in range(size):
-            grid[x] = [5] * size
-
-        return grid
+        return bytearray([5]) * (size * size)  # 5 = lightgrey
@@ -0,0 +1,508 @@
+"""
+Description: A simulation environment for car traffic with cellular automata
+The program encapsules four files: main.py, controller.py, model.py, view.py
+Author: Christian Tognazza
+Datum: 13.04.2023
+"""
+
+import argparse
+import heapq
+import multiprocessing
+import random
+import time
+from collections import deque
+
+from model import Car, CarGenerator, LightSignal, NO_OBSTACLE_DISTANCE
+
+# road network mode: links of any length between junction nodes, cars route through the junctions
+# usage: python -m network run --grid 20x20 --block-length 40 --ticks 1000 --processes 4 --seed 1
+#
+# cars follow the same rules as on the roads of the Model, a car that drives over the end of
+# its link goes through the junction and waits at the start of the next link of its route
+# (junctions are point queues, a waiting car enters when the first cell of the link is free)
+# a car that reached the end of its last link leaves the network
+#
+# the links are split into partitions of neighbouring links, each partition runs in its own process,
+# cars that cross into another partition are exchanged once per tick in one batch per partition
+# cars join the queue of their next link in the tick after they left their link, local or not,
+# so the same seed gives the same run for any number of processes
+
+
+class RoutedCar(Car):
+    __slots__ = ["origin", "route", "leg"]
+
+    def __init__(self, speed, max_speed, position, number, origin, route):
+        super().__init__(speed, max_speed, position, number)
+        # link the car was generated on, identifies the car together with its number
+        self.origin = origin
+        # numbers of the links the car drives on, the link it is on is route[leg]
+        self.route = route
+        self.leg = 0
+
+
+class Link:
+    # one way road between two junction nodes, cars enter at position 0 and leave at length
+    def __init__(self, number, source, target, length, generator=None, light_signal=None):
+        if length < 1:
+            raise Exception("link length must be at least 1")
+
+        self.number = number
+        self.source = source
+        self.target = target
+        self.length = length
+        # cars generated at the start of the link, None = no cars are generated
+        self.generator = generator
+        # light signal in front of the target junction, its state only depends on the tick
+        self.light_signal = light_signal
+        # cars ordered by position, rearmost car first
+        self.cars = []
+        # cars that came through the source junction and wait to enter the link
+        self.waiting = deque()
+
+        # counters over the lifetime of the link
+        self.spawned = 0
+        self.exited = 0
+        self.blocked = 0
+
+    def do_tick(self, tick, router, transfers):
+        # update the cars of the link, cars that drive into the next link of their route
+        # are appended to transfers as (next link number, link number, car)
+        light_signal = self.light_signal
+        red = False
+        if light_signal is not None:
+            light_signal.state = light_signal.state_at(tick)
+            red = light_signal.state == 0
+
+        cars = self.cars
+        cars_sorted = True
+        leaving = False
+        previous_position = -1
+        for i, car in enumerate(cars):
+            # cars are checked against the next car's position before it moves
+            if i + 1 < len(cars):
+                distance_to_next_obstacle = cars[i + 1].position - car.position
+            else:
+                distance_to_next_obstacle = NO_OBSTACLE_DISTANCE
+            if red and car.position <= light_signal.position:
+                distance_to_next_obstacle = min(
+                    distance_to_next_obstacle, light_signal.position - car.position)
+
+            car.do_tick(distance_to_next_obstacle)
+            if car.position > self.length - 1:
+                leaving = True
+            if car.position < previous_position:
+                cars_sorted = False
+            previous_position = car.position
+
+        if not cars_sorted:
+            cars.sort(key=lambda car: car.position)
+        if leaving:
+            first = len(cars)
+            while first and cars[first - 1].position > self.length - 1:
+                first -= 1
+            # front car first
+            for car in reversed(cars[first:]):
+                car.leg += 1
+                if car.leg == len(car.route):
+                    self.exited += 1
+                else:
+                    car.position = 0
+                    transfers.append((car.route[car.leg], self.number, car))
+            del cars[first:]
+
+        # cars through the junction go first, then the generator
+        entry_taken = bool(cars) and cars[0].position == 0
+        if self.waiting and not entry_taken:
+            cars.insert(0, self.waiting.popleft())
+            entry_taken = True
+
+        if self.generator is None:
+            return
+        car = self.generator.do_tick()
+        if car is None:
+            return
+        if entry_taken:
+            self.blocked += 1
+            return
+        route = router.route(self, self.generator.rng)
+        cars.insert(0, RoutedCar(car.speed, car.max_speed, car.position,
+                                 self.spawned, self.number, route))
+        self.spawned += 1
+
+
+class Router:
+    # shortest routes (by length) through the network, computed once per junction node
+    def __init__(self, links, exits):
+        self.links = {link.number: (link.source, link.target, link.length)
+                      for link in links}
+        self.outgoing = {}
+        for number, (source, _, _) in sorted(self.links.items()):
+            self.outgoing.setdefault(source, []).append(number)
+        # nodes routes end at, None = any node
+        self.exits = exits
+        # node --> (nodes reachable from the node, node --> link into it on the shortest route)
+        self.trees = {}
+        # link number --> nodes the routes of cars generated on the link can end at
+        self.destinations = {}
+
+    def tree(self, node):
+        if node in self.trees:
+            return self.trees[node]
+
+        distances = {node: 0}
+        previous = {}
+        queue = [(0, node)]
+        while queue:
+            distance, current = heapq.heappop(queue)
+            if distance > distances[current]:
+                continue
+            for number in self.outgoing.get(current, []):
+                _, target, length = self.links[number]
+                if target not in distances or distance + length < distances[target]:
+                    distances[target] = distance + length
+                    previous[target] = number
+                    heapq.heappush(queue, (distance + length, target))
+
+        reachable = sorted(distances)
+        self.trees[node] = (reachable, previous)
+        return self.trees[node]
+
+    def route(self, link, rng):
+        # route from the start of the link to a random destination, at least the link itself
+        reachable, previous = self.tree(link.target)
+        destinations = self.destinations.get(link.number)
+        if destinations is None:
+            destinations = [node for node in reachable if node != link.source and
+                            (self.exits is None or node in self.exits)]
+            self.destinations[link.number] = destinations
+        if not destinations:
+            return (link.number,)
+
+        node = rng.choice(destinations)
+        route = []
+        while node != link.target:
+            number = previous[node]
+            route.append(number)
+            node = self.links[number][0]
+        route.append(link.number)
+
+        return tuple(reversed(route))
+
+
+class Network:
+    def __init__(self, seed=None):
+        # node --> (x, y), only used to split the network into neighbouring partitions
+        self.nodes = []
+        self.links = []
+        # nodes routes end at, empty = any node
+        self.exits = set()
+        # all randomness of a network comes from this generator, the same seed gives the same run
+        self.random = random.Random(seed)
+
+    def add_node(self, x, y, exit=False):
+        self.nodes.append((x, y))
+        if exit:
+            self.exits.add(len(self.nodes) - 1)
+        return len(self.nodes) - 1
+
+    def add_link(self, source, target, length, delay=None, min_speed=75, max_speed=125,
+                 light_signal=None):
+        # delay = ticks between generated cars, None = the link has no generator
+        # light_signal = initial state of a light signal in front of the target junction
+        if source not in range(len(self.nodes)) or target not in range(len(self.nodes)):
+            raise Exception("link nodes must be added to the network first")
+
+        generator = None
+        if delay is not None:
+            generator = CarGenerator(delay=delay, min_speed=min_speed, max_speed=max_speed,
+                                     rng=random.Random(self.random.getrandbits(64)))
+        signal = None
+        if light_signal is not None:
+            signal = LightSignal(length - 1, state=light_signal)
+        self.links.append(
+            Link(len(self.links), source, target, length, generator, signal))
+
+        return self.links[-1]
+
+    def router(self):
+        return Router(self.links, self.exits or None)
+
+    def partition(self, parts):
+        # split the links into parts of about the same total length,
+        # links are taken in breadth first order of their source nodes so the parts are connected areas
+        outgoing = {}
+        for link in self.links:
+            outgoing.setdefault(link.source, []).append(link)
+
+        order = []
+        seen = set()
+        # start in a corner so the parts become bands through the network
+        for start in sorted(range(len(self.nodes)), key=lambda node: self.nodes[node]):
+            if start in seen:
+                continue
+            seen.add(start)
+            queue = deque([start])
+            while queue:
+                node = queue.popleft()
+                for link in outgoing.get(node, []):
+                    order.append(link)
+                    if link.target not in seen:
+                        seen.add(link.target)
+                        queue.append(link.target)
+
+        total = sum(link.length for link in self.links)
+        partitions = [[] for _ in range(parts)]
+        done = 0
+        for link in order:
+            partitions[min(parts - 1, done * parts // total)].append(link)
+            done += link.length
+
+        return partitions
+
+
+class NetworkPartition:
+    # links simulated by one process
+    def __init__(self, links, router):
+        self.links = {link.number: link for link in links}
+        self.order = sorted(self.links.values(), key=lambda link: link.number)
+        self.router = router
+        self.tick = 0
+        # cars that left a link of this partition into another link of it in the last tick
+        self.local_transfers = []
+
+    def do_tick(self, arrivals):
+        # arrivals are the transfers into this partition from the other partitions in the last tick
+        # cars join the queues by number of the link they left, the same order for any partitioning
+        transfers = self.local_transfers + arrivals
+        transfers.sort(key=lambda transfer: transfer[1])
+        for target, _, car in transfers:
+            self.links[target].waiting.append(car)
+
+        transfers = []
+        for link in self.order:
+            link.do_tick(self.tick, self.router, transfers)
+        self.tick += 1
+
+        self.local_transfers = [
+            transfer for transfer in transfers if transfer[0] in self.links]
+        return [transfer for transfer in transfers if transfer[0] not in self.links]
+
+    def summary(self):
+        return {
+            "cars": sum(len(link.cars) for link in self.order),
+            "waiting": sum(len(link.waiting) for link in self.order) + len(self.local_transfers),
+            "spawned": sum(link.spawned for link in self.order),
+            "exited": sum(link.exited for link in self.order),
+            "blocked": sum(link.blocked for link in self.order),
+        }
+
+    def car_states(self):
+        # (link, origin, number, position, speed, progress) of every car on a link
+        return [(link.number, car.origin, car.number, car.position, car.speed, car.progress)
+                for link in self.order for car in link.cars]
+
+
+def run_partition(connection, partition):
+    # worker process, answers the commands of the NetworkSimulation
+    while True:
+        command, argument = connection.recv()
+        if command == "tick":
+            connection.send(partition.do_tick(argument))
+        elif command == "summary":
+            connection.send(partition.summary())
+        elif command == "cars":
+            connection.send(partition.car_states())
+        else:
+            break
+    connection.close()
+
+
+class NetworkSimulation:
+    def __init__(self, network, processes=1):
+        if processes < 1:
+            raise Exception("processes must be at least 1")
+
+        self.tick = 0
+        # link number --> partition index
+        self.owners = {}
+        partitions = network.partition(processes)
+        for index, links in enumerate(partitions):
+            for link in links:
+                self.owners[link.number] = index
+        # transfers between the partitions of the last tick, by receiving partition
+        self.arrivals = [[] for _ in partitions]
+        router = network.router()
+
+        # a single partition runs in this process
+        self.partition = None
+        self.connections = []
+        self.processes = []
+        if processes == 1:
+            self.partition = NetworkPartition(partitions[0], router)
+            return
+
+        for links in partitions:
+            connection, worker_connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=run_partition, daemon=True, args=(
+                worker_connection, NetworkPartition(links, router)))
+            process.start()
+            worker_connection.close()
+            self.connections.append(connection)
+            self.processes.append(process)
+
+    def do_tick(self):
+        if self.partition is not None:
+            self.partition.do_tick([])
+            self.tick += 1
+            return
+
+        # all partitions tick at the same time, then their cars are handed over
+        for connection, arrivals in zip(self.connections, self.arrivals):
+            connection.send(("tick", arrivals))
+        self.arrivals = [[] for _ in self.connections]
+        for connection in self.connections:
+            for transfer in connection.recv():
+                self.arrivals[self.owners[transfer[0]]].append(transfer)
+        self.tick += 1
+
+    def run(self, ticks):
+        for _ in range(ticks):
+            self.do_tick()
+
+    def summary(self):
+        if self.partition is not None:
+            summaries = [self.partition.summary()]
+        else:
+            summaries = self.request("summary")
+        summary = {key: sum(partition[key] for partition in summaries)
+                   for key in summaries[0]}
+        # cars on their way to another partition wait at a junction as well
+        summary["waiting"] += sum(len(arrivals) for arrivals in self.arrivals)
+        summary["tick"] = self.tick
+        return summary
+
+    def car_states(self):
+        if self.partition is not None:
+            return sorted(self.partition.car_states())
+        return sorted(state for states in self.request("cars") for state in states)
+
+    def request(self, command):
+        for connection in self.connections:
+            connection.send((command, None))
+        return [connection.recv() for connection in self.connections]
+
+    def close(self):
+        for connection in self.connections:
+            connection.send(("close", None))
+        for process in self.processes:
+            process.join()
+        self.connections = []
+        self.processes = []
+
+
+def grid_network(columns, rows, block_length=40, delay=10, avg_speed=100, light_signals=True, seed=None):
+    # city grid of two way streets, cars come in at the border and leave at the border
+    network = Network(seed)
+    min_speed = int(avg_speed - (avg_speed / 4))
+    max_speed = int(avg_speed + (avg_speed / 4))
+    junctions = [[network.add_node(x, y) for y in range(rows)]
+                 for x in range(columns)]
+
+    def add_street(source, target, direction):
+        # light signals of crossing streets start in opposite states like on the Model's roads
+        state = None
+        if light_signals and target in inner:
+            state = 1 if direction == "horizontal" else 0
+        network.add_link(source, target, block_length, light_signal=state)
+
+    inner = {junctions[x][y] for x in range(columns) for y in range(rows)}
+    for x in range(columns):
+        for y in range(rows):
+            if x + 1 < columns:
+                add_street(junctions[x][y], junctions[x + 1][y], "horizontal")
+                add_street(junctions[x + 1][y], junctions[x][y], "horizontal")
+            if y + 1 < rows:
+                add_street(junctions[x][y], junctions[x][y + 1], "vertical")
+                add_street(junctions[x][y + 1], junctions[x][y], "vertical")
+
+    # border nodes with an incoming street that generates cars and an outgoing one cars leave on
+    borders = [(x, -1, x, 0, "vertical") for x in range(columns)] + \
+        [(x, rows, x, rows - 1, "vertical") for x in range(columns)] + \
+        [(-1, y, 0, y, "horizontal") for y in range(rows)] + \
+        [(columns, y, columns - 1, y, "horizontal") for y in range(rows)]
+    for x, y, junction_x, junction_y, direction in borders:
+        border = network.add_node(x, y, exit=True)
+        junction = junctions[junction_x][junction_y]
+        state = None
+        if light_signals:
+            state = 1 if direction == "horizontal" else 0
+        network.add_link(border, junction, block_length, delay=delay, min_speed=min_speed,
+                         max_speed=max_speed, light_signal=state)
+        network.add_link(junction, border, block_length)
+
+    return network
+
+
+def parse_grid(value):
+    # parse "<columns>x<rows>", e.g. "20x20"
+    try:
+        columns, rows = (int(count) for count in value.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            "grid must be given as <columns>x<rows>, e.g. 20x20")
+
+    return columns, rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="network", description="simulate a road network on several processes")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser(
+        "run", help="run a city grid network for a number of ticks")
+    run_parser.add_argument("--grid", type=parse_grid, default=(10, 10),
+                            help="<columns>x<rows> junctions")
+    run_parser.add_argument("--block-length", type=int, default=40,
+                            help="cells between two junctions")
+    run_parser.add_argument("--delay", type=int, default=10,
+                            help="car generator delay in ticks")
+    run_parser.add_argument("--avg-speed", type=int, default=100,
+                            help="average car speed of the generators")
+    run_parser.add_argument("--no-light-signals", action="store_true")
+    run_parser.add_argument("--ticks", type=int, default=1000)
+    run_parser.add_argument("--processes", type=int, default=1,
+                            help="number of partitions, each runs in its own process")
+    run_parser.add_argument("--seed", type=int, default=None)
+
+    args = parser.parse_args(argv)
+
+    columns, rows = args.grid
+    if columns < 1 or rows < 1:
+        parser.error("grid must have at least one junction")
+    if args.block_length < 2:
+        parser.error("block length must be at least 2")
+    if args.processes < 1:
+        parser.error("processes must be at least 1")
+
+    network = grid_network(columns, rows, args.block_length, args.delay, args.avg_speed,
+                           light_signals=not args.no_light_signals, seed=args.seed)
+    simulation = NetworkSimulation(network, processes=args.processes)
+    start = time.perf_counter()
+    try:
+        simulation.run(args.ticks)
+        summary = simulation.summary()
+    finally:
+        simulation.close()
+    elapsed = time.perf_counter() - start
+
+    print(f"links: {len(network.links)}")
+    print(f"processes: {args.processes}")
+    for key, value in summary.items():
+        print(f"{key}: {value}")
+    print(f"seconds: {elapsed:.3f}")
+    print(f"ticks_per_second: {args.ticks / elapsed if elapsed else 0:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+"""
+Description: A simulation environment for car traffic with cellular automata
+The program encapsules four files: main.py, controller.py, model.py, view.py
+Author: Christian Tognazza
+Datum: 13.04.2023
+"""
+
+import numpy as np
+
+from model import *
+from metrics import SPEED_BUCKET, SPEED_BUCKETS
+
+# NumpyEngine simulates the cars of all roads of a Model as flat arrays
+# cars are grouped by road (in the order of model.roads) and keep the order of Road.cars
+# within their road, so every batched operation sees the same neighbours as Road.do_tick
+
+
+class NumpyEngine:
+    # the cars are arrays, the roads only get them back with store_roads
+    cars_on_roads = False
+
+    def __init__(self, model):
+        self.model = model
+        self.load_roads()
+
+    def load_roads(self):
+        # copy the cars of all roads into the arrays
+        road_indexes, positions, progresses, speeds, max_speeds, numbers = [], [], [], [], [], []
+        for road_index, road in enumerate(self.model.roads):
+            for car in road.cars:
+                road_indexes.append(road_index)
+                positions.append(car.position)
+                progresses.append(car.progress)
+                speeds.append(car.speed)
+                max_speeds.append(car.max_speed)
+                numbers.append(car.number)
+
+        self.road = np.array(road_indexes, dtype=np.int64)
+        self.position = np.array(positions, dtype=np.int64)
+        self.progress = np.array(progresses, dtype=np.float64)
+        self.speed = np.array(speeds, dtype=np.float64)
+        self.max_speed = np.array(max_speeds, dtype=np.float64)
+        self.number = np.array(numbers, dtype=np.int64)
+
+        self.length = np.array(
+            [road.length for road in self.model.roads], dtype=np.int64)
+        # roads are laid out one after another on a single axis for searchsorted lookups
+        self.stride = int(self.length.max()) + 1 if len(self.length) else 1
+
+        # all light signals on that axis, for the traffic statistics
+        self.light_signal_keys = np.array([
+            road_index * self.stride + light_signal.position
+            for road_index, road in enumerate(self.model.roads)
+            for light_signal in road.light_signals
+        ], dtype=np.int64)
+        # (road, light signal index) of every light signal
+        self.light_signal_roads = [
+            (road, i) for road in self.model.roads for i in range(len(road.light_signals))]
+
+    def store_roads(self):
+        # write the arrays back to Car objects on the roads
+        cars = [[] for _ in self.model.roads]
+        for road_index, position, progress, speed, max_speed, number in zip(
+                self.road.tolist(), self.position.tolist(), self.progress.tolist(),
+                self.speed.tolist(), self.max_speed.tolist(), self.number.tolist()):
+            car = Car(speed=speed, max_speed=int(max_speed),
+                      position=position, number=number)
+            car.progress = progress
+            cars[road_index].append(car)
+
+        for road, road_cars in zip(self.model.roads, cars):
+            road.set_cars(road_cars)
+
+    def do_tick(self):
+        # update the state of all roads for the current tick
+        roads = self.model.roads
+        start_position = self.position.copy()
+        start_road = self.road.copy()
+        start_speed = self.speed
+
+        obstacle = np.minimum(self.next_car_distance(),
+                              self.next_light_signal_distance())
+        self.speed = self.next_speed(obstacle)
+        self.move()
+        if self.model.metrics is not None:
+            self.update_metrics(start_position, start_speed)
+
+        # remove cars that have left their road
+        inside = self.position <= self.length[self.road] - 1
+        if not inside.all():
+            exited = np.bincount(self.road[~inside], minlength=len(roads))
+            for road, count in zip(roads, exited.tolist()):
+                road.exited += count
+            if self.model.events is not None:
+                for road_index, position, number in zip(self.road[~inside].tolist(),
+                                                        self.position[~inside].tolist(), self.number[~inside].tolist()):
+                    self.model.events.emit(
+                        "car_exit", roads[road_index], position, number)
+            self.keep(inside)
+
+        self.spawn_cars()
+        if self.model.render_grid or self.model.sparse:
+            self.fill_car_positions(start_road, start_position)
+
+    def is_idle(self):
+        # check if the next tick would not change any car
+        obstacle = np.minimum(self.next_car_distance(),
+                              self.next_light_signal_distance())
+        speed = self.next_speed(obstacle)
+
+        return bool((speed == self.speed).all() and (self.progress + speed == self.progress).all())
+
+    def is_spawn_blocked(self, road_index):
+        # check if the generator position of a road is taken by a car
+        position = self.model.roads[road_index].generator.position
+        return bool(((self.road == road_index) & (self.position == position)).any())
+
+    def next_car_distance(self):
+        # distance to the next car in list order, 999 for the last car of a road
+        distance = np.full(len(self.position), NO_OBSTACLE_DISTANCE,
+                           dtype=np.int64)
+        same_road = self.road[1:] == self.road[:-1]
+        distance[:-1][same_road] = (self.position[1:] - self.position[:-1])[same_road]
+
+        return distance
+
+    def next_light_signal_distance(self):
+        # distance to the closest red light signal at or after each car position
+        red_keys = [
+            road_index * self.stride + light_signal.position
+            for road_index, road in enumerate(self.model.roads)
+            for light_signal in road.light_signals
+            if light_signal.state == 0
+        ]
+        distance = np.full(len(self.position), NO_OBSTACLE_DISTANCE,
+                           dtype=np.int64)
+        if not red_keys:
+            return distance
+
+        red_keys = np.array(red_keys, dtype=np.int64)
+        car_keys = self.road * self.stride + self.position
+        indexes = np.searchsorted(red_keys, car_keys, side="left")
+        found = indexes < len(red_keys)
+        next_keys = red_keys[indexes[found]]
+        same_road = next_keys // self.stride == self.road[found]
+        found[found] = same_road
+        distance[found] = next_keys[same_road] - car_keys[found]
+
+        return distance
+
+    def next_speed(self, obstacle):
+        # batched version of Car.accelerate and Car.decelerate
+        speed = self.speed
+        new_speed = speed.copy()
+
+        accelerating = (obstacle >= DESIRED_CAR_OBSTACLE_DISTANCE) & (
+            speed < self.max_speed)
+        new_speed[accelerating] = speed[accelerating] + \
+            self.max_speed[accelerating] / ACCELERATION_DIVIDER
+
+        decelerating = obstacle < DESIRED_CAR_OBSTACLE_DISTANCE
+        if decelerating.any():
+            current = speed[decelerating]
+            strength = 1 + DESIRED_CAR_OBSTACLE_DISTANCE - \
+                obstacle[decelerating]
+            divisor = DECELERATION_SLOWER + MAX_DECELERATION_STRENGTH - strength
+            divisor[divisor <= 0] = 1
+            # full stop on max break strength
+            minus = np.where(strength == MAX_DECELERATION_STRENGTH,
+                             current, current / divisor)
+            current = current - minus
+            current[current < 0] = 0
+            new_speed[decelerating] = current
+
+        return new_speed
+
+    def move(self):
+        # batched version of the progress/position update in Car.do_tick
+        self.progress += self.speed
+        moved = self.progress >= 100
+        if not moved.any():
+            return
+
+        self.position[moved] += (self.progress[moved] //
+                                 100).astype(np.int64)
+        self.progress[moved] = self.progress[moved] % 100
+
+    def generate_cars(self):
+        # generators are ticked in road order, so random numbers are drawn like in Road.do_tick
+        new_cars = []
+        for road_index, road in enumerate(self.model.roads):
+            car = road.generator.do_tick()
+            if car is not None:
+                new_cars.append((road_index, car))
+
+        return new_cars
+
+    def spawn_cars(self):
+        new_cars = self.generate_cars()
+        if not new_cars:
+            return
+
+        # a car cannot be added on a cell that already holds a car of the same road
+        new_keys = np.array([road_index * self.stride + car.position
+                             for road_index, car in new_cars], dtype=np.int64)
+        blocked = np.isin(new_keys, self.road * self.stride + self.position)
+        added = []
+        for (road_index, car), is_blocked in zip(new_cars, blocked.tolist()):
+            road = self.model.roads[road_index]
+            if is_blocked:
+                road.block_spawn()
+            else:
+                car.number = road.spawned
+                road.spawned += 1
+                added.append((road_index, car))
+                if road.metrics is not None:
+                    road.metrics.add_car(car.position, car.speed)
+
+        if not added:
+            return
+
+        count = len(self.position)
+        self.road = np.concatenate(
+            [self.road, [road_index for road_index, _ in added]])
+        self.position = np.concatenate(
+            [self.position, [car.position for _, car in added]]).astype(np.int64)
+        self.progress = np.concatenate(
+            [self.progress, [car.progress for _, car in added]]).astype(np.float64)
+        self.speed = np.concatenate(
+            [self.speed, [car.speed for _, car in added]]).astype(np.float64)
+        self.max_speed = np.concatenate(
+            [self.max_speed, [car.max_speed for _, car in added]]).astype(np.float64)
+        self.number = np.concatenate(
+            [self.number, [car.number for _, car in added]]).astype(np.int64)
+
+        # Road.add_car appends and sorts the cars by position (stable sort),
+        # roads without a new car keep their order
+        sequence = np.arange(count + len(added))
+        spawned = np.zeros(len(self.length), dtype=bool)
+        spawned[[road_index for road_index, _ in added]] = True
+        sort_key = np.where(spawned[self.road], self.position, sequence)
+        self.keep(np.lexsort((sequence, sort_key, self.road)))
+
+    def update_metrics(self, start_position, start_speed):
+        # batched version of RoadMetrics.update_car for all cars, before the exited cars are removed
+        roads = self.model.roads
+        num_roads = len(roads)
+        exited = self.position >= self.length[self.road]
+        staying = ~exited
+
+        road_cars = np.bincount(self.road, minlength=num_roads)
+        exits = np.bincount(self.road[exited], minlength=num_roads)
+        stops = np.bincount(self.road[(start_speed > 0) & (self.speed == 0)],
+                            minlength=num_roads)
+        speed_change = np.bincount(self.road[staying], weights=self.speed[staying],
+                                   minlength=num_roads) - \
+            np.bincount(self.road, weights=start_speed, minlength=num_roads)
+
+        # speed histograms of all roads as one axis
+        buckets = SPEED_BUCKETS
+        old_buckets = self.road * buckets + \
+            np.minimum(start_speed // SPEED_BUCKET, buckets - 1).astype(np.int64)
+        new_buckets = (self.road * buckets + np.minimum(self.speed // SPEED_BUCKET,
+                       buckets - 1).astype(np.int64))[staying]
+        histogram_change = np.bincount(new_buckets, minlength=num_roads * buckets) - \
+            np.bincount(old_buckets, minlength=num_roads * buckets)
+
+        for road, metrics_cars, metrics_exits, metrics_stops, metrics_speed in zip(
+                roads, road_cars.tolist(), exits.tolist(), stops.tolist(), speed_change.tolist()):
+            if metrics_cars == 0:
+                continue
+            metrics = road.metrics
+            metrics.cars -= metrics_exits
+            metrics.exit_flow.add(metrics_exits)
+            metrics.stops.add(metrics_stops)
+            metrics.total_stops += metrics_stops
+            metrics.speed_sum += metrics_speed
+        for index in np.flatnonzero(histogram_change).tolist():
+            road_index, bucket = divmod(index, buckets)
+            roads[road_index].metrics.speed_histogram[bucket] += int(
+                histogram_change[index])
+
+        # stopped cars per segment in front of a light signal, segment ids are unique over all roads
+        keys = self.light_signal_keys
+        num_segments = len(keys) + num_roads
+        end_position = np.minimum(self.position, self.length[self.road])
+        old_segments = np.searchsorted(
+            keys, self.road * self.stride + start_position) + self.road
+        new_segments = np.searchsorted(
+            keys, self.road * self.stride + end_position) + self.road
+        stopped_change = np.bincount(new_segments[staying & (self.speed == 0)], minlength=num_segments) - \
+            np.bincount(old_segments[start_speed == 0],
+                        minlength=num_segments)
+        if stopped_change.any():
+            road_segments = np.searchsorted(
+                keys, np.arange(num_roads) * self.stride) + np.arange(num_roads)
+            for segment in np.flatnonzero(stopped_change).tolist():
+                road_index = int(np.searchsorted(
+                    road_segments, segment, side="right")) - 1
+                metrics = roads[road_index].metrics
+                i = segment - int(road_segments[road_index])
+                if i < len(metrics.light_signals):
+                    metrics.light_signals[i].stopped += int(
+                        stopped_change[segment])
+                else:
+                    metrics.stopped_after_light_signals += int(
+                        stopped_change[segment])
+
+        # light signals passed: every car passes the light signals between its old and new key
+        if len(keys):
+            passed = np.cumsum(
+                np.bincount(old_segments - self.road, minlength=len(keys) + 1) -
+                np.bincount(new_segments - self.road, minlength=len(keys) + 1))[:len(keys)]
+            for index in np.flatnonzero(passed).tolist():
+                road, i = self.light_signal_roads[index]
+                road.metrics.light_signals[i].flow.add(int(passed[index]))
+
+    def keep(self, selection):
+        # select (and reorder) cars by boolean mask or index array
+        self.road = self.road[selection]
+        self.position = self.position[selection]
+        self.progress = self.progress[selection]
+        self.speed = self.speed[selection]
+        self.max_speed = self.max_speed[selection]
+        self.number = self.number[selection]
+
+    def count_cars(self):
+        return len(self.position)
+
+    def refresh_car_positions(self):
+        self.fill_car_positions(self.road, self.position)
+
+    def update_car_positions(self):
+        # Road.car_positions are filled by every rendered tick, see do_tick
+        pass
+
+    def fill_car_positions(self, road_indexes, positions):
+        # fill Road.car_positions with the positions cars had at the start of the tick
+        boundaries = np.searchsorted(
+            road_indexes, np.arange(1, len(self.model.roads)))
+        for road, road_positions in zip(self.model.roads, np.split(positions, boundaries)):
+            road.car_positions = road_positions.tolist()
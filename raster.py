@@ -0,0 +1,115 @@
+"""
+Description: A simulation environment for car traffic with cellular automata
+The program encapsules four files: main.py, controller.py, model.py, view.py
+Author: Christian Tognazza
+Datum: 13.04.2023
+"""
+
+import os
+import struct
+import zlib
+
+# renders grids into one RGB pixel buffer per frame, without tkinter
+# used by the RasterView and to write PPM/PNG frame sequences of headless runs
+
+# RGB values of the color names of view.COLOR_MAP (X11 colors as used by tkinter)
+COLOR_RGB = {
+    0: (255, 255, 255),  # white, empty cell
+    1: (0, 0, 0),  # black, road
+    2: (0, 0, 255),  # blue, car
+    3: (255, 0, 0),  # red, light signal
+    4: (0, 255, 0),  # green, light signal
+    5: (211, 211, 211),  # lightgrey, border
+}
+
+
+def render_pixels(grid, border_grid, size, scale):
+    # RGB bytes of a size x size grid with scale x scale pixels per cell, row by row
+    # grids are indexed by x * size + y, cells wider than 3 pixels get a border like on the canvas
+    border = max(1, round(scale / 10)) if scale >= 3 else 0
+    inner = scale - 2 * border
+    # pixel lines of a cell for every (color, border color) pair seen
+    inner_lines = {}
+    edge_lines = {}
+    rows = []
+    for y in range(size):
+        # one row of cells is a column of the grid
+        cells = list(zip(grid[y::size], border_grid[y::size]))
+        for cell in cells:
+            if cell not in inner_lines:
+                fill = bytes(COLOR_RGB[cell[0]])
+                outline = bytes(COLOR_RGB[cell[1]])
+                inner_lines[cell] = outline * border + fill * inner + outline * border
+                edge_lines[cell] = outline * scale
+        inner_line = b"".join([inner_lines[cell] for cell in cells])
+        if border:
+            edge_line = b"".join([edge_lines[cell] for cell in cells])
+            rows.append(edge_line * border + inner_line *
+                        inner + edge_line * border)
+        else:
+            rows.append(inner_line * scale)
+
+    return b"".join(rows)
+
+
+def ppm_bytes(grid, border_grid, size, scale):
+    # binary PPM image (P6) of the grid
+    pixels = render_pixels(grid, border_grid, size, scale)
+    width = size * scale
+    return f"P6 {width} {width} 255\n".encode("ascii") + pixels
+
+
+def png_bytes(grid, border_grid, size, scale):
+    # PNG image (8 bit RGB) of the grid
+    pixels = render_pixels(grid, border_grid, size, scale)
+    width = size * scale
+    stride = width * 3
+    # every pixel row starts with filter type 0 (none)
+    raw = b"".join(b"\x00" + pixels[row:row + stride]
+                   for row in range(0, len(pixels), stride))
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", width, width, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw, 6))
+            + chunk(b"IEND", b""))
+
+
+class FrameWriter:
+    # writes every n-th tick of a model as numbered image into a directory
+    def __init__(self, directory, every=1, image_format="png", scale=4):
+        if image_format not in ["png", "ppm"]:
+            raise Exception("image format must be png or ppm")
+        if every < 1:
+            raise Exception("every must be at least 1")
+
+        self.directory = directory
+        self.every = every
+        self.image_format = image_format
+        self.scale = scale
+        self.frames = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def ticks_until_frame(self, tick):
+        # number of ticks until the model reaches the tick of the next frame
+        return self.every - tick % self.every
+
+    def is_frame_tick(self, tick):
+        return tick % self.every == 0
+
+    def write(self, model):
+        # write the current grid of the model, sparse models are rendered as one region
+        if model.sparse:
+            grid, border_grid = model.render_region(
+                0, 0, model.size, model.size)
+        else:
+            grid, border_grid = model.grid, model.border_grid
+
+        encode = png_bytes if self.image_format == "png" else ppm_bytes
+        path = os.path.join(self.directory,
+                            f"frame_{model.tick:08d}.{self.image_format}")
+        with open(path, "wb") as frame_file:
+            frame_file.write(encode(grid, border_grid, model.size, self.scale))
+        self.frames += 1
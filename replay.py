@@ -0,0 +1,280 @@
+"""
+Description: A simulation environment for car traffic with cellular automata
+The program encapsules four files: main.py, controller.py, model.py, view.py
+Author: Christian Tognazza
+Datum: 13.04.2023
+"""
+
+import bisect
+import mmap
+import struct
+import zlib
+from array import array
+
+from model import *
+from snapshot import read_snapshot, unpack_array, write_snapshot
+
+# recording of a run that can be replayed from any tick without running the Model
+# usage: python -m headless run --ticks 100000 --record run.trep, then REPLAY = "run.trep" in main.py
+#
+# every keyframe_every ticks a keyframe holds the model snapshot (roads, cars, light signals)
+# and the rendered grids, every tick a delta holds the cells that changed with old and new codes,
+# so deltas can be applied forwards and backwards and the file grows with the changes only
+# ticks with changed roads, light signals or generators (see Model.changes) get a keyframe as well,
+# so a model is only simulated from a keyframe over ticks without such changes
+# seeking goes to the closest keyframe or the current tick and applies at most keyframe_every / 2 deltas
+#
+# header | records (keyframes and deltas in tick order) | index | trailer
+# all numbers are little endian, codes are the ones of view.COLOR_MAP
+
+REPLAY_MAGIC = b"TREP"
+REPLAY_VERSION = 1
+KEYFRAME_EVERY = 1000
+
+# magic, version, size, first tick, keyframe every
+HEADER = struct.Struct("<4sHiqI")
+# kind, tick, count: number of changed cells (delta) or length of the snapshot (keyframe)
+RECORD = struct.Struct("<Bqi")
+# length of the compressed keyframe data
+KEYFRAME_LENGTH = struct.Struct("<I")
+# offset of the index, number of deltas, number of keyframes, magic
+TRAILER = struct.Struct("<qqq4s")
+KEYFRAME = ord("K")
+DELTA = ord("D")
+
+
+class ReplayRecorder:
+    def __init__(self, path, model, keyframe_every=KEYFRAME_EVERY):
+        if model.sparse:
+            raise Exception("a sparse model has no grid to record")
+        if keyframe_every < 1:
+            raise Exception("keyframe_every must be at least 1")
+
+        self.file = open(path, "wb")
+        self.keyframe_every = keyframe_every
+        self.first_tick = model.tick
+        # Model.changes of the last keyframe
+        self.changes = model.changes
+        # file offsets of the delta of every tick after the first one
+        self.delta_offsets = array("q")
+        # (tick, file offset) of the keyframes
+        self.keyframe_ticks = array("q")
+        self.keyframe_offsets = array("q")
+
+        model.render_grid = True
+        model.render_dynamic_cells()
+        # grids of the last recorded tick
+        self.grid = bytearray(model.grid)
+        self.border_grid = bytearray(model.border_grid)
+
+        self.file.write(HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, model.size,
+                                    self.first_tick, keyframe_every))
+        self.write_keyframe(model)
+
+    def record(self, model):
+        # record the tick the model just did, its grid must be rendered
+        if model.tick != self.first_tick + len(self.delta_offsets) + 1:
+            raise Exception("every tick must be recorded")
+
+        self.write_delta(model)
+        if (model.tick - self.first_tick) % self.keyframe_every == 0 or model.changes != self.changes:
+            self.write_keyframe(model)
+
+    def write_delta(self, model):
+        changed_cells = model.changed_cells
+        if changed_cells is None:
+            changed_cells = range(len(self.grid))
+
+        grid, border_grid = model.grid, model.border_grid
+        cells = array("I")
+        codes = bytearray()
+        border_codes = bytearray()
+        for cell in sorted(changed_cells):
+            if grid[cell] == self.grid[cell] and border_grid[cell] == self.border_grid[cell]:
+                continue
+            cells.append(cell)
+            # old code in the upper four bits, new code in the lower four bits
+            codes.append(self.grid[cell] << 4 | grid[cell])
+            border_codes.append(self.border_grid[cell] << 4 | border_grid[cell])
+            self.grid[cell] = grid[cell]
+            self.border_grid[cell] = border_grid[cell]
+
+        self.delta_offsets.append(self.file.tell())
+        self.file.write(RECORD.pack(DELTA, model.tick, len(cells)))
+        self.file.write(cells.tobytes() + codes + border_codes)
+
+    def write_keyframe(self, model):
+        self.changes = model.changes
+        snapshot = write_snapshot(model)
+        data = zlib.compress(snapshot + self.grid + self.border_grid)
+        self.keyframe_ticks.append(model.tick)
+        self.keyframe_offsets.append(self.file.tell())
+        self.file.write(RECORD.pack(KEYFRAME, model.tick, len(snapshot)))
+        self.file.write(KEYFRAME_LENGTH.pack(len(data)) + data)
+
+    def close(self):
+        # write the index, a recording without one is indexed again when it is opened
+        index_offset = self.file.tell()
+        self.file.write(self.delta_offsets.tobytes() +
+                        self.keyframe_ticks.tobytes() + self.keyframe_offsets.tobytes())
+        self.file.write(TRAILER.pack(index_offset, len(self.delta_offsets),
+                                     len(self.keyframe_ticks), REPLAY_MAGIC))
+        self.file.close()
+
+
+class Replay:
+    def __init__(self, path):
+        # the file is mapped, only the records that are read are loaded into memory
+        with open(path, "rb") as replay_file:
+            try:
+                self.data = mmap.mmap(replay_file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # empty file
+                raise Exception("not a replay file")
+
+        if len(self.data) < HEADER.size:
+            raise Exception("not a replay file")
+        magic, version, self.size, self.first_tick, self.keyframe_every = HEADER.unpack_from(
+            self.data)
+        if magic != REPLAY_MAGIC:
+            raise Exception("not a replay file")
+        if version != REPLAY_VERSION:
+            raise Exception(f"unsupported replay version {version}")
+
+        if not self.read_index():
+            self.scan_records()
+        self.last_tick = self.first_tick + len(self.delta_offsets)
+
+        # grids of the current tick
+        self.tick = None
+        self.grid = None
+        self.border_grid = None
+        # cells that changed with the last seek, None if every cell may have changed
+        self.changed_cells = None
+        self.seek(self.first_tick)
+
+    def read_index(self):
+        # read the index at the end of the file, False if the recording was not closed
+        if len(self.data) < HEADER.size + TRAILER.size:
+            return False
+        index_offset, deltas, keyframes, magic = TRAILER.unpack_from(
+            self.data, len(self.data) - TRAILER.size)
+        if magic != REPLAY_MAGIC:
+            return False
+
+        self.delta_offsets, offset = unpack_array(
+            "q", self.data, index_offset, deltas)
+        self.keyframe_ticks, offset = unpack_array(
+            "q", self.data, offset, keyframes)
+        self.keyframe_offsets, _ = unpack_array(
+            "q", self.data, offset, keyframes)
+        return True
+
+    def scan_records(self):
+        # index the complete records of a recording that was interrupted
+        self.delta_offsets = array("q")
+        self.keyframe_ticks = array("q")
+        self.keyframe_offsets = array("q")
+        offset = HEADER.size
+        while offset + RECORD.size <= len(self.data):
+            kind, tick, count = RECORD.unpack_from(self.data, offset)
+            if kind == DELTA:
+                end = offset + RECORD.size + 6 * count
+            elif kind == KEYFRAME and offset + RECORD.size + KEYFRAME_LENGTH.size <= len(self.data):
+                length, = KEYFRAME_LENGTH.unpack_from(
+                    self.data, offset + RECORD.size)
+                end = offset + RECORD.size + KEYFRAME_LENGTH.size + length
+            else:
+                break
+            if end > len(self.data):
+                break
+
+            if kind == DELTA:
+                self.delta_offsets.append(offset)
+            else:
+                self.keyframe_ticks.append(tick)
+                self.keyframe_offsets.append(offset)
+            offset = end
+
+        if not self.keyframe_ticks:
+            raise Exception("replay file has no keyframe")
+
+    def read_keyframe(self, index):
+        # snapshot bytes and grids of the index-th keyframe
+        offset = self.keyframe_offsets[index]
+        _, tick, snapshot_length = RECORD.unpack_from(self.data, offset)
+        offset += RECORD.size
+        length, = KEYFRAME_LENGTH.unpack_from(self.data, offset)
+        offset += KEYFRAME_LENGTH.size
+        data = zlib.decompress(self.data[offset:offset + length])
+        cells = self.size * self.size
+
+        return (data[:snapshot_length], data[snapshot_length:snapshot_length + cells],
+                data[snapshot_length + cells:])
+
+    def read_delta(self, tick):
+        # cells, old and new grid codes, old and new border codes of the delta into the tick
+        offset = self.delta_offsets[tick - self.first_tick - 1]
+        _, _, count = RECORD.unpack_from(self.data, offset)
+        cells, offset = unpack_array(
+            "I", self.data, offset + RECORD.size, count)
+        codes = self.data[offset:offset + count]
+        border_codes = self.data[offset + count:offset + 2 * count]
+
+        return cells, codes, border_codes
+
+    def seek(self, tick):
+        # show the given tick, from the closest keyframe or from the current tick
+        tick = min(max(tick, self.first_tick), self.last_tick)
+        index = bisect.bisect_right(self.keyframe_ticks, tick) - 1
+        start = self.keyframe_ticks[index]
+        if index + 1 < len(self.keyframe_ticks) and \
+                self.keyframe_ticks[index + 1] - tick < tick - start:
+            index += 1
+            start = self.keyframe_ticks[index]
+
+        if self.tick is not None and abs(tick - self.tick) <= abs(tick - start):
+            self.changed_cells = set()
+        else:
+            _, grid, border_grid = self.read_keyframe(index)
+            self.grid = bytearray(grid)
+            self.border_grid = bytearray(border_grid)
+            self.tick = start
+            self.changed_cells = None
+
+        while self.tick < tick:
+            self.apply_delta(self.tick + 1, 1)
+            self.tick += 1
+        while self.tick > tick:
+            self.apply_delta(self.tick, -1)
+            self.tick -= 1
+
+    def step(self, ticks):
+        # move by ticks ticks, negative = backwards, returns False at the start or end of the recording
+        self.seek(self.tick + ticks)
+        return self.first_tick < self.tick < self.last_tick
+
+    def apply_delta(self, tick, direction):
+        # apply the delta into the tick forwards (1) or undo it (-1)
+        cells, codes, border_codes = self.read_delta(tick)
+        shift = 0 if direction == 1 else 4
+        grid, border_grid = self.grid, self.border_grid
+        for cell, code, border_code in zip(cells, codes, border_codes):
+            grid[cell] = code >> shift & 15
+            border_grid[cell] = border_code >> shift & 15
+        if self.changed_cells is not None:
+            self.changed_cells.update(cells)
+
+    def model_at(self, tick, engine="object"):
+        # Model in the state of the given tick, restored from the keyframe before it and simulated on
+        tick = min(max(tick, self.first_tick), self.last_tick)
+        index = bisect.bisect_right(self.keyframe_ticks, tick) - 1
+        snapshot, _, _ = self.read_keyframe(index)
+        model = read_snapshot(snapshot, engine=engine)
+        while model.tick < tick:
+            model.do_tick()
+
+        return model
+
+    def close(self):
+        self.data.close()
@@ -0,0 +1,252 @@
+"""
+Description: A simulation environment for car traffic with cellular automata
+The program encapsules four files: main.py, controller.py, model.py, view.py
+Author: Christian Tognazza
+Datum: 13.04.2023
+"""
+
+import argparse
+import random
+import time
+
+import numpy as np
+
+from model import *
+from numpy_engine import NumpyEngine
+from headless import build_model, parse_roads
+from sweep import parse_seeds
+
+# replicas of one road layout with different car generator seeds, simulated together
+# usage: python -m replicas run --size 100 --roads 5x5 --ticks 1000 --seeds 0-63 --layout-seed 1
+#
+# the roads and light signals are the ones of a layout model, every replica gets its own cars and
+# generator random streams (see reseed_generators), replica k of seed s runs exactly like the
+# layout model after reseed_generators(model, s)
+# the cars of all replicas are one set of arrays, every (replica, road) is a road of a NumpyEngine,
+# so a tick is one array pass over all replicas, light signals are switched once for all of them
+# and the generators only draw random numbers in the ticks they spawn in
+
+
+def reseed_generators(model, seed):
+    # give the car generators of the model new random streams derived from the seed,
+    # the roads and light signals stay the same
+    streams = random.Random(seed)
+    for road in model.roads:
+        road.generator.rng = random.Random(streams.getrandbits(64))
+
+
+class ReplicaEngine(NumpyEngine):
+    def __init__(self, replicas):
+        # replicas.roads holds the roads of all replicas, replica after replica
+        self.replicas = replicas
+        # progress of the generators per layout road, the generators of a road
+        # spawn in the same ticks in every replica, only their random numbers differ
+        self.generator_progress = [
+            road.generator.progress for road in replicas.layout.roads]
+        super().__init__(replicas)
+
+    def generate_cars(self):
+        # only the generators that spawn in this tick are ticked, in road order like NumpyEngine
+        layout_roads = self.replicas.layout.roads
+        spawning = []
+        for road_index, road in enumerate(layout_roads):
+            if self.generator_progress[road_index] < road.generator.delay:
+                self.generator_progress[road_index] += 1
+            else:
+                self.generator_progress[road_index] = 0
+                spawning.append(road_index)
+        if not spawning:
+            return []
+
+        new_cars = []
+        roads = self.model.roads
+        for first in range(0, len(roads), len(layout_roads)):
+            for road_index in spawning:
+                generator = roads[first + road_index].generator
+                generator.progress = generator.delay
+                new_cars.append((first + road_index, generator.do_tick()))
+
+        return new_cars
+
+    def store_roads(self):
+        super().store_roads()
+        layout_roads = self.replicas.layout.roads
+        for road_index, road in enumerate(self.model.roads):
+            road.generator.progress = self.generator_progress[road_index % len(layout_roads)]
+
+    def next_light_signal_distance(self):
+        # all replicas see the same red light signals, their keys are laid out once per replica
+        layout_roads = self.replicas.layout.roads
+        layout_keys = np.array([
+            road_index * self.stride + light_signal.position
+            for road_index, road in enumerate(layout_roads)
+            for light_signal in road.light_signals
+            if light_signal.state == 0
+        ], dtype=np.int64)
+        distance = np.full(len(self.position), NO_OBSTACLE_DISTANCE,
+                           dtype=np.int64)
+        if not len(layout_keys):
+            return distance
+
+        replica_offsets = np.arange(len(self.replicas.seeds)) * \
+            len(layout_roads) * self.stride
+        red_keys = (replica_offsets[:, None] + layout_keys[None, :]).ravel()
+        car_keys = self.road * self.stride + self.position
+        indexes = np.searchsorted(red_keys, car_keys, side="left")
+        found = indexes < len(red_keys)
+        next_keys = red_keys[indexes[found]]
+        same_road = next_keys // self.stride == self.road[found]
+        found[found] = same_road
+        distance[found] = next_keys[same_road] - car_keys[found]
+
+        return distance
+
+
+class Replicas:
+    def __init__(self, layout, seeds):
+        # layout is a Model, every replica starts from its cars and generator progress
+        if not seeds:
+            raise Exception("at least one seed is needed")
+        if layout.occupancy is not None:
+            raise Exception(
+                "blocking intersections is not supported by replicas")
+
+        self.layout = layout
+        self.seeds = list(seeds)
+        # the engine only needs these of a Model
+        self.metrics = None
+        self.events = None
+        self.render_grid = False
+        self.sparse = False
+
+        layout.store_engine_cars()
+        self.roads = []
+        for seed in self.seeds:
+            streams = random.Random(seed)
+            for layout_road in layout.roads:
+                generator = layout_road.generator
+                road = Road(layout_road.offset, layout_road.direction, layout_road.length, CarGenerator(
+                    generator.position, generator.delay, generator.min_speed, generator.max_speed,
+                    rng=random.Random(streams.getrandbits(64))))
+                road.generator.progress = generator.progress
+                # light signals are shared, the layout switches them
+                road.light_signals = layout_road.light_signals
+                road.spawned = layout_road.spawned
+                road.exited = layout_road.exited
+                road.blocked = layout_road.blocked
+                for layout_car in layout_road.cars:
+                    car = Car(layout_car.speed, layout_car.max_speed,
+                              layout_car.position, layout_car.number)
+                    car.progress = layout_car.progress
+                    road.cars.append(car)
+                self.roads.append(road)
+
+        self.engine = ReplicaEngine(self)
+
+    def do_tick(self):
+        # same as Model.do_tick, for all replicas at once
+        self.engine.do_tick()
+        self.layout.tick += 1
+        self.layout.update_light_signals()
+
+    def run(self, ticks):
+        for _ in range(ticks):
+            self.do_tick()
+
+    def replica_roads(self, replica):
+        num_roads = len(self.layout.roads)
+        return self.roads[replica * num_roads:(replica + 1) * num_roads]
+
+    def summary(self):
+        # statistics per replica (like headless.run) and their mean, deviation, min and max
+        engine = self.engine
+        num_replicas = len(self.seeds)
+        replica = engine.road // len(self.layout.roads)
+        cars = np.bincount(replica, minlength=num_replicas)
+        speed_sums = np.bincount(
+            replica, weights=engine.speed, minlength=num_replicas)
+
+        per_replica = []
+        for index, seed in enumerate(self.seeds):
+            roads = self.replica_roads(index)
+            per_replica.append({
+                "seed": seed,
+                "cars": int(cars[index]),
+                "spawned": sum(road.spawned for road in roads),
+                "exited": sum(road.exited for road in roads),
+                "blocked": sum(road.blocked for road in roads),
+                "mean_speed": float(speed_sums[index] / cars[index]) if cars[index] else 0,
+            })
+
+        statistics = {}
+        for key in ["cars", "spawned", "exited", "blocked", "mean_speed"]:
+            values = np.array([result[key] for result in per_replica], dtype=np.float64)
+            statistics[key] = {
+                "mean": float(values.mean()),
+                "std": float(values.std()),
+                "min": float(values.min()),
+                "max": float(values.max()),
+            }
+
+        return {
+            "tick": self.layout.tick,
+            "replicas": num_replicas,
+            "statistics": statistics,
+            "per_replica": per_replica,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="replicas", description="run replicas of one road layout with different seeds together")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser(
+        "run", help="run the replicas and print their statistics")
+    run_parser.add_argument("--size", type=int, default=50)
+    run_parser.add_argument("--ticks", type=int, default=1000)
+    run_parser.add_argument("--roads", type=parse_roads, default=(1, 1),
+                            help="<vertical>x<horizontal> number of roads")
+    run_parser.add_argument("--delay", type=int, default=10,
+                            help="car generator delay in ticks")
+    run_parser.add_argument("--avg-speed", type=int, default=100,
+                            help="average car speed of the generators")
+    run_parser.add_argument("--seeds", type=parse_seeds, nargs="+", default=[list(range(8))],
+                            help="generator seeds or seed ranges of the replicas, e.g. 0-63")
+    run_parser.add_argument("--layout-seed", type=int, default=None,
+                            help="seed of the road offsets, the same for all replicas")
+    run_parser.add_argument("--per-replica", action="store_true",
+                            help="also print the statistics of every replica")
+
+    args = parser.parse_args(argv)
+
+    if args.size < 3:
+        parser.error("size must be at least 3")
+
+    try:
+        layout = build_model(args.size, args.roads, args.delay, args.avg_speed,
+                             engine="numpy", seed=args.layout_seed)
+    except ValueError as error:
+        parser.error(str(error))
+    replicas = Replicas(
+        layout, [seed for seeds in args.seeds for seed in seeds])
+    start = time.perf_counter()
+    replicas.run(args.ticks)
+    elapsed = time.perf_counter() - start
+
+    summary = replicas.summary()
+    print(f"replicas: {summary['replicas']}")
+    print(f"ticks: {args.ticks}")
+    print(f"seconds: {elapsed:.3f}")
+    print(f"replica_ticks_per_second: {summary['replicas'] * args.ticks / elapsed if elapsed else 0:.1f}")
+    for key, statistics in summary["statistics"].items():
+        print(f"{key}: mean {statistics['mean']:.2f} std {statistics['std']:.2f} "
+              f"min {statistics['min']:.2f} max {statistics['max']:.2f}")
+    if args.per_replica:
+        for result in summary["per_replica"]:
+            print(" ".join(f"{key}={round(value, 2) if isinstance(value, float) else value}"
+                           for key, value in result.items()))
+
+
+if __name__ == "__main__":
+    main()
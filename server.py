@@ -0,0 +1,373 @@
+"""
+Description: A simulation environment for car traffic with cellular automata
+The program encapsules four files: main.py, controller.py, model.py, view.py
+Author: Christian Tognazza
+Datum: 13.04.2023
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import struct
+import sys
+from array import array
+
+from model import *
+from headless import build_model, parse_roads
+from raster import COLOR_RGB
+
+# local server that runs the model and streams its frames to any number of browsers
+# usage: python -m server --size 100 --roads 5x5 --port 8000, then open http://127.0.0.1:8000
+#
+# every tick is encoded once as delta of the changed cells, all clients get the same bytes
+# a client that is still busy with an older frame skips the frames in between and
+# gets a keyframe of the newest tick instead, so nothing queues up for slow clients
+#
+# messages are binary websocket frames, little endian:
+#   header      kind (1 byte, "K" or "D"), tick (int64), count (uint32)
+#   keyframe    count = size, then size * size grid codes and size * size border codes
+#   delta       count = changed cells, then count cell indexes (uint32), grid codes, border codes
+# cells are indexed like the grid of the model: x * size + y, codes are the ones of view.COLOR_MAP
+
+HEADER = struct.Struct("<BqI")
+KEYFRAME = ord("K")
+DELTA = ord("D")
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+# bytes a client may have in its send buffer before it counts as busy
+CLIENT_BUFFER_LIMIT = 1 << 16
+
+
+class FrameBroadcaster:
+    # newest frame of the model, encoded once for all clients
+    def __init__(self, size):
+        self.size = size
+        self.tick = -1
+        # websocket frame with the delta from the tick before, None if the tick had no delta
+        self.delta = None
+        self.grid = bytes(size * size)
+        self.border_grid = bytes([5]) * (size * size)
+        # websocket frame of the keyframe of the newest tick, encoded when the first client needs it
+        self.keyframe = None
+        # set when the next frame is published
+        self.frame_published = asyncio.Event()
+
+        self.clients = 0
+        self.frames_sent = 0
+        self.keyframes_sent = 0
+        self.frames_skipped = 0
+
+    def publish(self, tick, delta, grid, border_grid):
+        # delta is the encoded message of the changed cells, None = every cell may have changed
+        self.tick = tick
+        self.delta = None if delta is None else websocket_frame(delta)
+        self.grid = grid
+        self.border_grid = border_grid
+        self.keyframe = None
+        self.frame_published.set()
+        self.frame_published = asyncio.Event()
+
+    def keyframe_message(self):
+        if self.keyframe is None:
+            self.keyframe = websocket_frame(
+                HEADER.pack(KEYFRAME, self.tick, self.size) + self.grid + self.border_grid)
+        return self.keyframe
+
+    async def stream(self, writer):
+        # send the newest frames to a client until it disconnects
+        sent_tick = None
+        while True:
+            if self.tick == sent_tick or self.tick < 0:
+                await self.frame_published.wait()
+                continue
+
+            tick = self.tick
+            if sent_tick == tick - 1 and self.delta is not None:
+                message = self.delta
+            else:
+                # new client, the delta was reset or frames were skipped
+                message = self.keyframe_message()
+                self.keyframes_sent += 1
+                if sent_tick is not None:
+                    self.frames_skipped += tick - sent_tick - 1
+
+            writer.write(message)
+            self.frames_sent += 1
+            sent_tick = tick
+            # waits only while the client is too slow, newer frames replace older ones meanwhile
+            await writer.drain()
+
+    def stats(self):
+        return {
+            "tick": self.tick,
+            "clients": self.clients,
+            "frames_sent": self.frames_sent,
+            "keyframes_sent": self.keyframes_sent,
+            "frames_skipped": self.frames_skipped,
+        }
+
+
+class FrameServer:
+    def __init__(self, model, ticks_per_second=20):
+        if model.sparse:
+            raise Exception("the server needs a model with grids, not a sparse one")
+
+        self.model = model
+        self.model.render_grid = True
+        self.ticks_per_second = ticks_per_second
+        self.broadcaster = None
+
+    async def serve(self, host="127.0.0.1", port=8000):
+        self.broadcaster = FrameBroadcaster(self.model.size)
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"serving on http://{host}:{port}")
+        async with server:
+            await self.run_model()
+
+    async def run_model(self):
+        # tick the model on a worker thread so the clients are served while it ticks
+        loop = asyncio.get_running_loop()
+        next_tick_time = loop.time()
+        while True:
+            frame = await loop.run_in_executor(None, self.tick_model)
+            self.broadcaster.publish(*frame)
+
+            if not self.ticks_per_second:
+                await asyncio.sleep(0)
+                continue
+            next_tick_time += 1 / self.ticks_per_second
+            delay = next_tick_time - loop.time()
+            if delay < 0:
+                next_tick_time = loop.time()
+            await asyncio.sleep(max(0, delay))
+
+    def tick_model(self):
+        # perform a tick and encode its frame, runs on the worker thread
+        model = self.model
+        model.do_tick()
+        delta = None
+        if model.changed_cells is not None:
+            delta = encode_delta(model.tick, model.changed_cells,
+                                 model.grid, model.border_grid)
+
+        return model.tick, delta, bytes(model.grid), bytes(model.border_grid)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            request = await reader.readuntil(b"\r\n\r\n")
+            path, headers = parse_request(request)
+            if path == "/ws" and headers.get("upgrade", "").lower() == "websocket":
+                await self.handle_websocket(reader, writer, headers)
+            elif path == "/":
+                send_response(writer, "200 OK", "text/html; charset=utf-8",
+                              page(self.model.size).encode("utf-8"))
+            elif path == "/stats":
+                send_response(writer, "200 OK", "application/json",
+                              json.dumps(self.broadcaster.stats()).encode("utf-8"))
+            else:
+                send_response(writer, "404 Not Found",
+                              "text/plain", b"not found")
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def handle_websocket(self, reader, writer, headers):
+        key = headers.get("sec-websocket-key", "")
+        accept = base64.b64encode(hashlib.sha1(
+            (key + WEBSOCKET_GUID).encode("ascii")).digest()).decode("ascii")
+        writer.write((
+            "HTTP/1.1 101 Switching Protocols\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode("ascii"))
+        writer.transport.set_write_buffer_limits(high=CLIENT_BUFFER_LIMIT)
+
+        # the client only sends control frames, the stream stops when it closes
+        stream = asyncio.current_task()
+        reading = asyncio.create_task(read_client(reader, writer, stream))
+        self.broadcaster.clients += 1
+        try:
+            await self.broadcaster.stream(writer)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self.broadcaster.clients -= 1
+            reading.cancel()
+
+
+async def read_client(reader, writer, stream):
+    # answer pings and stop the stream when the client closes the connection
+    try:
+        while True:
+            opcode, payload = await read_websocket_frame(reader)
+            if opcode == 8:
+                writer.write(websocket_frame(bytes(payload[:2]), opcode=8))
+                break
+            if opcode == 9:
+                writer.write(websocket_frame(bytes(payload), opcode=10))
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    stream.cancel()
+
+
+async def read_websocket_frame(reader):
+    # returns opcode and unmasked payload of the next frame of a client
+    first, second = await reader.readexactly(2)
+    length = second & 0x7f
+    if length == 126:
+        length, = struct.unpack("!H", await reader.readexactly(2))
+    elif length == 127:
+        length, = struct.unpack("!Q", await reader.readexactly(8))
+    mask = await reader.readexactly(4) if second & 0x80 else bytes(4)
+    payload = bytearray(await reader.readexactly(length))
+    for i in range(length):
+        payload[i] ^= mask[i % 4]
+
+    return first & 0x0f, payload
+
+
+def websocket_frame(payload, opcode=2):
+    # unmasked websocket frame (server to client), opcode 2 = binary
+    length = len(payload)
+    if length < 126:
+        header = struct.pack("!BB", 0x80 | opcode, length)
+    elif length < 1 << 16:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+
+    return header + payload
+
+
+def encode_delta(tick, changed_cells, grid, border_grid):
+    # delta message of the changed cells, see the message format above
+    cells = array("I", changed_cells)
+    codes = bytes([grid[cell] for cell in cells])
+    border_codes = bytes([border_grid[cell] for cell in cells])
+    if sys.byteorder == "big":
+        cells.byteswap()
+
+    return HEADER.pack(DELTA, tick, len(cells)) + cells.tobytes() + codes + border_codes
+
+
+def parse_request(request):
+    # path and lower case headers of an HTTP request
+    lines = request.decode("latin1").split("\r\n")
+    method, path, _ = lines[0].split(" ", 2)
+    if method != "GET":
+        raise ValueError("only GET requests are served")
+
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+
+    return path, headers
+
+
+def send_response(writer, status, content_type, body):
+    writer.write((
+        f"HTTP/1.1 {status}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        "Connection: close\r\n\r\n").encode("ascii") + body)
+
+
+def page(size):
+    # viewer page, draws the frames on a canvas like the View
+    colors = json.dumps(
+        [f"rgb{COLOR_RGB[code]}" for code in range(len(COLOR_RGB))])
+    return PAGE.replace("SIZE", str(size)).replace("COLORS", colors)
+
+
+PAGE = """<!DOCTYPE html>
+<html>
+<head><title>Christian Traffic Simulation</title></head>
+<body style="margin: 0; background: #ddd">
+<canvas id="canvas"></canvas>
+<div id="status" style="font: 12px monospace"></div>
+<script>
+const size = SIZE;
+const colors = COLORS;
+const cell = Math.max(1, Math.floor(Math.min(window.innerWidth, window.innerHeight - 20) / size));
+const border = cell >= 3 ? Math.max(1, Math.round(cell / 10)) : 0;
+const canvas = document.getElementById("canvas");
+canvas.width = canvas.height = size * cell;
+const context = canvas.getContext("2d");
+
+function drawCell(index, code, borderCode) {
+    const x = Math.floor(index / size), y = index % size;
+    context.fillStyle = colors[borderCode];
+    context.fillRect(x * cell, y * cell, cell, cell);
+    context.fillStyle = colors[code];
+    context.fillRect(x * cell + border, y * cell + border, cell - 2 * border, cell - 2 * border);
+}
+
+const socket = new WebSocket(`ws://${location.host}/ws`);
+socket.binaryType = "arraybuffer";
+socket.onmessage = (event) => {
+    const view = new DataView(event.data);
+    const bytes = new Uint8Array(event.data);
+    const kind = String.fromCharCode(view.getUint8(0));
+    const tick = Number(view.getBigInt64(1, true));
+    const count = view.getUint32(9, true);
+    if (kind === "K") {
+        const cells = size * size;
+        for (let i = 0; i < cells; i++) {
+            drawCell(i, bytes[13 + i], bytes[13 + cells + i]);
+        }
+    } else {
+        const codes = 13 + 4 * count;
+        for (let i = 0; i < count; i++) {
+            drawCell(view.getUint32(13 + 4 * i, true), bytes[codes + i], bytes[codes + count + i]);
+        }
+    }
+    document.getElementById("status").textContent = `tick ${tick}`;
+};
+socket.onclose = () => { document.getElementById("status").textContent += " (disconnected)"; };
+</script>
+</body>
+</html>
+"""
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="server", description="run the traffic simulation and stream it to browsers")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--size", type=int, default=50)
+    parser.add_argument("--roads", type=parse_roads, default=(1, 1),
+                        help="<vertical>x<horizontal> number of roads")
+    parser.add_argument("--delay", type=int, default=10,
+                        help="car generator delay in ticks")
+    parser.add_argument("--avg-speed", type=int, default=100,
+                        help="average car speed of the generators")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--engine", choices=["object", "numpy", "event"],
+                        default="object")
+    parser.add_argument("--ticks-per-second", type=float, default=20,
+                        help="0 = as fast as possible")
+    args = parser.parse_args(argv)
+
+    if args.size < 3:
+        parser.error("size must be at least 3")
+
+    try:
+        model = build_model(args.size, args.roads, args.delay, args.avg_speed, engine=args.engine,
+                            render_grid=True, seed=args.seed)
+    except ValueError as error:
+        parser.error(str(error))
+    try:
+        asyncio.run(FrameServer(model, ticks_per_second=args.ticks_per_second).serve(
+            args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Description: A simulation environment for car traffic with cellular automata
+The program encapsules four files: main.py, controller.py, model.py, view.py
+Author: Christian Tognazza
+Datum: 13.04.2023
+"""
+
+import threading
+import time
+
+from model import *
+
+# run the model as fast as possible instead of at a fixed number of ticks per second
+AS_FAST_AS_POSSIBLE = 0
+# a simulation further behind its schedule than this (in s) does not try to catch up
+MAX_SCHEDULE_LAG = 0.25
+
+# SimulationThread runs a Model on a worker thread, independent of the frame rate of the view
+# frames are handed over double buffered: the worker renders into the back buffer only when
+# the view asked for a frame, the view draws the front buffer, intermediate ticks are not rendered
+
+
+class ChangeQueue:
+    # changes of a model queued by other threads (e.g. the GUI), the latest change per key wins
+    # the thread ticking the model applies them together at the next tick boundary
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.changes = {}
+
+    def put(self, key, change):
+        # change is a function without arguments that changes the model
+        with self.lock:
+            self.changes[key] = change
+
+    def apply(self):
+        # apply the queued changes in the order their keys were first queued,
+        # the caller holds the model, returns the number of applied changes
+        with self.lock:
+            changes, self.changes = self.changes, {}
+        for change in changes.values():
+            change()
+
+        return len(changes)
+
+
+class SimulationThread(threading.Thread):
+    def __init__(self, model, ticks_per_second=AS_FAST_AS_POSSIBLE):
+        super().__init__(daemon=True)
+        self.model = model
+        self.ticks_per_second = ticks_per_second
+        # held while the model is changed, by the worker for every tick and
+        # by the controller for changes from the GUI
+        self.lock = threading.Lock()
+        self.running = threading.Event()
+        self.stopped = False
+        # changes from the GUI, applied before the next tick
+        self.changes = ChangeQueue()
+
+        # front buffer is drawn by the view, back buffer is written by the worker
+        size = model.size * model.size
+        self.front = (-1, bytearray(size), bytearray(size))
+        self.back = (-1, bytearray(size), bytearray(size))
+        self.frame_lock = threading.Lock()
+        self.frame_wanted = True
+        self.frame_ready = False
+
+        # the grid is only rendered in ticks that produce a frame
+        self.model.render_grid = False
+
+    def run(self):
+        next_tick_time = time.perf_counter()
+        while not self.stopped:
+            if not self.running.is_set():
+                self.running.wait(0.1)
+                next_tick_time = time.perf_counter()
+                continue
+
+            self.step()
+
+            if self.ticks_per_second == AS_FAST_AS_POSSIBLE:
+                continue
+
+            # sleep until the scheduled time of the next tick, the schedule does not drift
+            # with the duration of the ticks, a slow stretch is only caught up for a short while
+            next_tick_time += 1 / self.ticks_per_second
+            delay = next_tick_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -MAX_SCHEDULE_LAG:
+                next_tick_time = time.perf_counter()
+
+    def step(self, render=False):
+        # perform a tick and publish a frame if the view is waiting for one (or render is set)
+        with self.lock:
+            self.changes.apply()
+            render = render or self.frame_wanted
+            self.model.render_grid = render
+            self.model.do_tick()
+            self.model.render_grid = False
+            if render:
+                self.publish_frame()
+
+    def apply_changes(self):
+        # apply the queued changes without a tick and publish a frame of them, used while paused
+        with self.lock:
+            if not self.changes.apply():
+                return False
+            self.model.render_grid = True
+            self.model.refresh_car_positions()
+            self.model.render_dynamic_cells()
+            self.model.render_grid = False
+            self.publish_frame()
+
+        return True
+
+    def publish_frame(self):
+        # copy the grids into the back buffer and swap it with the front buffer
+        # the back buffer is not drawn by the view: it was swapped out before the view asked again
+        _, grid, border_grid = self.back
+        grid[:] = self.model.grid
+        border_grid[:] = self.model.border_grid
+        with self.frame_lock:
+            self.back = self.front
+            self.front = (self.model.tick, grid, border_grid)
+            self.frame_wanted = False
+            self.frame_ready = True
+
+    def take_frame(self):
+        # newest frame as (tick, grid, border_grid), None if there is no new one
+        # the buffers stay untouched by the worker until take_frame is called again
+        with self.frame_lock:
+            self.frame_wanted = True
+            if not self.frame_ready:
+                return None
+            self.frame_ready = False
+            return self.front
+
+    def start_simulation(self):
+        if not self.is_alive():
+            self.start()
+        self.running.set()
+
+    def stop_simulation(self):
+        self.running.clear()
+
+    def close(self):
+        self.stopped = True
+        self.running.set()
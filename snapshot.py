@@ -0,0 +1,242 @@
+"""
+Description: A simulation environment for car traffic with cellular automata
+The program encapsules four files: main.py, controller.py, model.py, view.py
+Author: Christian Tognazza
+Datum: 13.04.2023
+"""
+
+import os
+import struct
+from array import array
+
+from model import *
+
+# binary snapshot of a Model: roads, cars, light signals, generators and random states
+# all numbers are little endian, the grids are not stored (they are rendered from the roads)
+#
+# header | model random state | roads | occupancy
+# road: road header | generator random state | cars (5 columns) | car positions | light signals
+
+SNAPSHOT_MAGIC = b"TSIM"
+# version 2 added the car numbers
+SNAPSHOT_VERSION = 2
+
+# magic, version, size, tick, block intersections, number of roads
+HEADER = struct.Struct("<4sHiqBI")
+# direction, offset, length,
+# generator position, delay, min speed, max speed, progress,
+# spawned, exited, blocked, cars sorted,
+# number of cars, number of car positions, number of light signals
+ROAD = struct.Struct("<BiiiiiiiqqqBIII")
+# position, red duration, green duration, red delay, initial state, start tick
+LIGHT_SIGNAL = struct.Struct("<iiiiBq")
+# version, has gauss_next, gauss_next, the 625 words of the Mersenne Twister follow
+RANDOM_STATE = struct.Struct("<iBd")
+RANDOM_STATE_WORDS = 625
+# intersection cell, road index, car index on that road
+OCCUPANCY = struct.Struct("<qII")
+COUNT = struct.Struct("<I")
+
+DIRECTIONS = ["horizontal", "vertical"]
+
+
+def write_snapshot(model):
+    # encode the state of the model, cars of the numpy engine are written back to the roads first
+    model.store_engine_cars()
+    parts = [HEADER.pack(
+        SNAPSHOT_MAGIC,
+        SNAPSHOT_VERSION,
+        model.size,
+        model.tick,
+        model.occupancy is not None,
+        len(model.roads)
+    )]
+    parts.append(pack_random_state(model.random))
+
+    for road in model.roads:
+        generator = road.generator
+        parts.append(ROAD.pack(
+            DIRECTIONS.index(road.direction),
+            road.offset,
+            road.length,
+            generator.position,
+            generator.delay,
+            generator.min_speed,
+            generator.max_speed,
+            generator.progress,
+            road.spawned,
+            road.exited,
+            road.blocked,
+            road.cars_sorted,
+            len(road.cars),
+            len(road.car_positions),
+            len(road.light_signals)
+        ))
+        parts.append(pack_random_state(generator.rng))
+
+        # cars are stored column by column
+        parts.append(array("q", [car.position for car in road.cars]).tobytes())
+        parts.append(array("d", [car.progress for car in road.cars]).tobytes())
+        parts.append(array("d", [car.speed for car in road.cars]).tobytes())
+        parts.append(array("q", [car.max_speed for car in road.cars]).tobytes())
+        parts.append(array("q", [car.number for car in road.cars]).tobytes())
+        parts.append(array("q", road.car_positions).tobytes())
+
+        for light_signal in road.light_signals:
+            parts.append(LIGHT_SIGNAL.pack(
+                light_signal.position,
+                light_signal.red_duration,
+                light_signal.green_duration,
+                light_signal.red_delay,
+                light_signal.initial_state,
+                light_signal.start_tick
+            ))
+
+    # which car holds which intersection
+    occupancy = model.occupancy or {}
+    road_indexes = {id(road): i for i, road in enumerate(model.roads)}
+    parts.append(COUNT.pack(len(occupancy)))
+    for cell, (road, car) in occupancy.items():
+        car_index = next(i for i, road_car in enumerate(road.cars)
+                         if road_car is car)
+        parts.append(OCCUPANCY.pack(cell, road_indexes[id(road)], car_index))
+
+    return b"".join(parts)
+
+
+def read_snapshot(data, engine="object", render_grid=True, sparse=False):
+    # create a new Model from a snapshot
+    data = memoryview(data)
+    magic, version, size, tick, block_intersections, num_roads = HEADER.unpack_from(
+        data)
+    if magic != SNAPSHOT_MAGIC:
+        raise Exception("not a traffic simulation snapshot")
+    if version not in [1, SNAPSHOT_VERSION]:
+        raise Exception(f"unsupported snapshot version {version}")
+    offset = HEADER.size
+
+    model = Model(size, engine=engine, render_grid=render_grid,
+                  block_intersections=bool(block_intersections), sparse=sparse)
+    model.tick = tick
+    offset = unpack_random_state(data, offset, model.random)
+
+    for _ in range(num_roads):
+        (direction, road_offset, length,
+         generator_position, delay, min_speed, max_speed, generator_progress,
+         spawned, exited, blocked, cars_sorted,
+         num_cars, num_car_positions, num_light_signals) = ROAD.unpack_from(data, offset)
+        offset += ROAD.size
+
+        generator = CarGenerator(
+            position=generator_position,
+            delay=delay,
+            min_speed=min_speed,
+            max_speed=max_speed,
+            rng=random.Random()
+        )
+        generator.progress = generator_progress
+        offset = unpack_random_state(data, offset, generator.rng)
+
+        road = Road(road_offset, DIRECTIONS[direction], length, generator)
+        road.spawned = spawned
+        road.exited = exited
+        road.blocked = blocked
+
+        positions, offset = unpack_array("q", data, offset, num_cars)
+        progresses, offset = unpack_array("d", data, offset, num_cars)
+        speeds, offset = unpack_array("d", data, offset, num_cars)
+        max_speeds, offset = unpack_array("q", data, offset, num_cars)
+        numbers = [-1] * num_cars
+        if version >= 2:
+            numbers, offset = unpack_array("q", data, offset, num_cars)
+        cars = []
+        for position, progress, speed, car_max_speed, number in zip(
+                positions, progresses, speeds, max_speeds, numbers):
+            car = Car(speed=speed, max_speed=car_max_speed,
+                      position=position, number=number)
+            car.progress = progress
+            cars.append(car)
+        road.set_cars(cars)
+        road.cars_sorted = bool(cars_sorted)
+
+        car_positions, offset = unpack_array(
+            "q", data, offset, num_car_positions)
+        road.car_positions = list(car_positions)
+
+        for _ in range(num_light_signals):
+            position, red_duration, green_duration, red_delay, state, start_tick = LIGHT_SIGNAL.unpack_from(
+                data, offset)
+            offset += LIGHT_SIGNAL.size
+            road.add_light_signal(LightSignal(
+                position,
+                red_duration=red_duration,
+                green_duration=green_duration,
+                red_delay=red_delay,
+                state=state,
+                start_tick=start_tick
+            ))
+
+        model.roads.append(road)
+
+    # derived state: intersections, light signal schedule, occupancy, road layer
+    model.index_intersections()
+    model.schedule_light_signals()
+    model.index_occupancy()
+    (num_occupied,) = COUNT.unpack_from(data, offset)
+    offset += COUNT.size
+    if model.occupancy is not None:
+        model.occupancy.clear()
+    for _ in range(num_occupied):
+        cell, road_index, car_index = OCCUPANCY.unpack_from(data, offset)
+        offset += OCCUPANCY.size
+        road = model.roads[road_index]
+        model.occupancy[cell] = (road, road.cars[car_index])
+
+    model.load_engine_cars()
+    if not model.sparse:
+        # the grids of the new model are empty, only the road cells are set
+        for road in model.roads:
+            model.render_road_layer(road, 1)
+    if model.render_grid:
+        model.render_dynamic_cells()
+
+    return model
+
+
+def save_snapshot(model, path):
+    # write atomically, a crash while saving keeps the previous snapshot
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "wb") as snapshot_file:
+        snapshot_file.write(write_snapshot(model))
+    os.replace(temporary_path, path)
+
+
+def load_snapshot(path, engine="object", render_grid=True, sparse=False):
+    with open(path, "rb") as snapshot_file:
+        return read_snapshot(snapshot_file.read(), engine=engine, render_grid=render_grid, sparse=sparse)
+
+
+def pack_random_state(rng):
+    version, words, gauss_next = rng.getstate()
+    return RANDOM_STATE.pack(version, gauss_next is not None, gauss_next or 0.0) + \
+        array("I", words).tobytes()
+
+
+def unpack_random_state(data, offset, rng):
+    # restore the state of rng in place, returns the offset after the state
+    version, has_gauss_next, gauss_next = RANDOM_STATE.unpack_from(
+        data, offset)
+    offset += RANDOM_STATE.size
+    words, offset = unpack_array("I", data, offset, RANDOM_STATE_WORDS)
+    rng.setstate((version, tuple(words), gauss_next if has_gauss_next else None))
+
+    return offset
+
+
+def unpack_array(typecode, data, offset, count):
+    # read count numbers of the given array typecode, returns the values and the new offset
+    values = array(typecode)
+    end = offset + count * values.itemsize
+    values.frombytes(data[offset:end])
+
+    return values, end
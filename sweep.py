@@ -0,0 +1,166 @@
+"""
+Description: A simulation environment for car traffic with cellular automata
+The program encapsules four files: main.py, controller.py, model.py, view.py
+Author: Christian Tognazza
+Datum: 13.04.2023
+"""
+
+import argparse
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from headless import build_model, parse_roads, run
+
+# parameter sweep over headless models, one process per run
+# usage: python -m sweep --roads 5x5 10x10 --delay 3 5 10 --avg-speed 80 120 --seeds 0-9 --out results.jsonl
+# runs already in the results file are skipped, so an interrupted sweep can simply be started again
+
+# parameters that identify a run in the results file
+SCENARIO_KEYS = ["size", "roads", "delay",
+                 "avg_speed", "ticks", "engine", "seed"]
+
+
+def parse_seeds(value):
+    # parse a single seed "3" or a range "0-9" (inclusive)
+    try:
+        if "-" in value:
+            first, last = (int(seed) for seed in value.split("-"))
+            return list(range(first, last + 1))
+        return [int(value)]
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            "seeds must be given as <seed> or <first>-<last>, e.g. 0-9")
+
+
+def build_scenarios(sizes, roads, delays, avg_speeds, seeds, ticks, engine):
+    # cartesian product of all parameters, one dict per run
+    return [
+        {
+            "size": size,
+            "roads": road_counts,
+            "delay": delay,
+            "avg_speed": avg_speed,
+            "ticks": ticks,
+            "engine": engine,
+            "seed": seed,
+        }
+        for size, road_counts, delay, avg_speed, seed in itertools.product(
+            sizes, roads, delays, avg_speeds, seeds)
+    ]
+
+
+def scenario_key(scenario):
+    return tuple(scenario[key] for key in SCENARIO_KEYS)
+
+
+def load_finished(path):
+    # keys of the runs already stored in the results file
+    finished = set()
+    if not os.path.exists(path):
+        return finished
+
+    with open(path) as results:
+        for line in results:
+            try:
+                finished.add(scenario_key(json.loads(line)))
+            except (ValueError, KeyError):
+                # last line of an interrupted sweep can be incomplete
+                continue
+
+    return finished
+
+
+def ends_with_newline(path):
+    # check if the last line of the results file is complete
+    with open(path, "rb") as results:
+        results.seek(-1, os.SEEK_END)
+        return results.read(1) == b"\n"
+
+
+def run_scenario(scenario):
+    # runs in a worker process, each run has its own seeded model
+    model = build_model(
+        scenario["size"],
+        parse_roads(scenario["roads"]),
+        scenario["delay"],
+        scenario["avg_speed"],
+        engine=scenario["engine"],
+        seed=scenario["seed"]
+    )
+
+    return {**scenario, **run(model, scenario["ticks"])}
+
+
+def run_sweep(scenarios, path, workers=None):
+    # run all scenarios missing in the results file, results are appended as runs finish
+    finished = load_finished(path)
+    pending = [scenario for scenario in scenarios
+               if scenario_key(scenario) not in finished]
+    print(f"{len(scenarios) - len(pending)} of {len(scenarios)} runs already done")
+    if not pending:
+        return
+
+    with open(path, "a") as results, ProcessPoolExecutor(max_workers=workers) as executor:
+        if results.tell() and not ends_with_newline(path):
+            # the incomplete last line of an interrupted sweep is ended, so it does not swallow a result
+            results.write("\n")
+        futures = [executor.submit(run_scenario, scenario)
+                   for scenario in pending]
+        for done, future in enumerate(as_completed(futures), start=1):
+            metrics = future.result()
+            results.write(json.dumps(metrics) + "\n")
+            results.flush()
+            print(f"[{done}/{len(pending)}] " + " ".join(
+                f"{key}={metrics[key]}" for key in SCENARIO_KEYS)
+                + f" ticks/s={metrics['ticks_per_second']:.0f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="sweep", description="run a parameter sweep of headless simulations")
+    parser.add_argument("--size", type=int, nargs="+", default=[50])
+    parser.add_argument("--roads", nargs="+", default=["1x1"],
+                        help="<vertical>x<horizontal> number of roads")
+    parser.add_argument("--delay", type=int, nargs="+", default=[10],
+                        help="car generator delays in ticks")
+    parser.add_argument("--avg-speed", type=int, nargs="+", default=[100],
+                        help="average car speeds of the generators")
+    parser.add_argument("--seeds", type=parse_seeds, nargs="+", default=[[0]],
+                        help="seeds or seed ranges, e.g. 0-9")
+    parser.add_argument("--ticks", type=int, default=1000)
+    parser.add_argument("--engine", choices=["object", "numpy", "event"],
+                        default="object")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of processes, defaults to the number of cores")
+    parser.add_argument("--out", default="results.jsonl",
+                        help="results file (JSON lines), also used to resume")
+
+    args = parser.parse_args(argv)
+
+    for roads in args.roads:
+        try:
+            road_counts = parse_roads(roads)
+        except argparse.ArgumentTypeError as error:
+            parser.error(str(error))
+        for size in args.size:
+            # every road needs its own offset, see Model.set_num_roads
+            if not all(0 <= num_roads <= size - 2 for num_roads in road_counts):
+                parser.error(
+                    f"roads must be between 0 and {size - 2} per direction for size {size}")
+
+    scenarios = build_scenarios(
+        args.size,
+        args.roads,
+        args.delay,
+        args.avg_speed,
+        [seed for seeds in args.seeds for seed in seeds],
+        args.ticks,
+        args.engine
+    )
+    run_sweep(scenarios, args.out, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+"""
+Description: A simulation environment for car traffic with cellular automata
+The program encapsules four files: main.py, controller.py, model.py, view.py
+Author: Christian Tognazza
+Datum: 13.04.2023
+"""
+
+import os
+import sys
+
+# the modules of the program are imported from the directory above the tests
+# usage: python -m pytest -q tests
+sys.path.insert(0, os.path.dirname(
+    os.path.dirname(os.path.abspath(__file__))))
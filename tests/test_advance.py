@@ -0,0 +1,59 @@
+"""
+Description: A simulation environment for car traffic with cellular automata
+The program encapsules four files: main.py, controller.py, model.py, view.py
+Author: Christian Tognazza
+Datum: 13.04.2023
+"""
+
+import pytest
+
+from headless import build_model
+from model import LightSignal
+
+# advancing over idle ticks gives the same model as performing every tick
+
+# size, roads, generator delay, average speed, ticks, seed
+CASES = [
+    (30, (1, 1), 300, 200, 2000, 1),
+    (30, (2, 2), 120, 150, 2000, 3),
+    (50, (5, 5), 10, 100, 600, 2),
+]
+
+
+def model_state(model):
+    model.store_engine_cars()
+    state = (model.tick,
+             [(road.spawned, road.exited, road.blocked, road.generator.progress,
+               [(car.position, car.speed, car.progress) for car in road.cars],
+               [light_signal.state for light_signal in road.light_signals])
+              for road in model.roads])
+    model.load_engine_cars()
+    return state
+
+
+@pytest.mark.parametrize("engine", ["object", "numpy", "event"])
+@pytest.mark.parametrize("case", CASES)
+def test_advance_performs_the_same_ticks(case, engine):
+    if engine == "numpy":
+        pytest.importorskip("numpy")
+    size, roads, delay, avg_speed, ticks, seed = case
+    stepped = build_model(size, roads, delay, avg_speed, engine=engine, render_grid=True, seed=seed)
+    advanced = build_model(size, roads, delay, avg_speed, engine=engine, render_grid=True, seed=seed)
+    for _ in range(0, ticks, 250):
+        for _ in range(250):
+            stepped.do_tick()
+        advanced.advance(250)
+        assert model_state(advanced) == model_state(stepped)
+        assert advanced.grid == stepped.grid
+
+
+def test_light_signal_state_follows_the_phase():
+    light_signal = LightSignal(0, red_duration=60, green_duration=40, start_tick=7)
+    state = light_signal.state_at(7)
+    change = light_signal.next_change_tick(7)
+    for tick in range(7, 1000):
+        if tick == change:
+            state = 1 - state
+            change = light_signal.next_change_tick(tick)
+        assert light_signal.state_at(tick) == state
+        assert change > tick
@@ -0,0 +1,62 @@
+"""
+Description: A simulation environment for car traffic with cellular automata
+The program encapsules four files: main.py, controller.py, model.py, view.py
+Author: Christian Tognazza
+Datum: 13.04.2023
+"""
+
+import json
+
+import pytest
+
+pytest.importorskip("tkinter")
+from benchmark import BENCHMARKS, compare, main
+
+# the benchmarks run every hot path, a baseline comparison flags slowdowns beyond threshold and noise
+
+
+def bench_result(benchmark, mean, stdev):
+    rate = {"mean": mean, "stdev": stdev, "min": mean - stdev, "max": mean + stdev}
+    return {"benchmark": benchmark, "engine": "object", "size": 20, "roads": "1x1", "delay": 5,
+            "repeats": 2, "ops_per_second": rate, "car_updates_per_second": rate}
+
+
+def test_compare_flags_slowdowns_beyond_threshold_and_noise(capsys):
+    baseline = [bench_result("a", 1000, 10), bench_result("b", 1000, 10), bench_result("c", 1000, 300)]
+    results = [
+        # 20 % slower
+        bench_result("a", 800, 10),
+        # 5 % slower, within the threshold
+        bench_result("b", 950, 10),
+        # 20 % slower, within the noise
+        bench_result("c", 800, 10),
+        # no baseline
+        bench_result("d", 1, 0),
+    ]
+    regressions = compare(results, baseline, threshold=0.1)
+    assert [(regression["benchmark"], round(change, 2)) for regression, change in regressions] == [
+        ("a", -0.2)]
+
+
+def test_main_writes_the_results_and_exits_on_regressions(tmp_path, capsys):
+    out = str(tmp_path / "bench.json")
+    argv = ["--size", "20", "--roads", "1x1", "--delay", "5", "--repeats", "2"]
+    main(argv + ["--out", out])
+    with open(out) as results_file:
+        results = json.load(results_file)["results"]
+    assert [result["benchmark"] for result in results] == list(BENCHMARKS)
+    assert all(result["ops_per_second"]["mean"] > 0 for result in results)
+    assert all(result["car_updates_per_second"]["mean"] > 0 for result in results
+               if result["benchmark"].endswith("do_tick"))
+
+    # a baseline a hundred times faster than this run
+    for result in results:
+        for rate in ["ops_per_second", "car_updates_per_second"]:
+            result[rate] = {key: value * 100 for key, value in result[rate].items()}
+    baseline = str(tmp_path / "baseline.json")
+    with open(baseline, "w") as baseline_file:
+        json.dump({"results": results}, baseline_file)
+    with pytest.raises(SystemExit) as exit_info:
+        main(argv + ["--benchmark", "Car.do_tick", "--baseline", baseline])
+    assert exit_info.value.code == 1
+    assert "REGRESSION Car.do_tick" in capsys.readouterr().out
@@ -0,0 +1,75 @@
+"""
+Description: A simulation environment for car traffic with cellular automata
+The program encapsules four files: main.py, controller.py, model.py, view.py
+Author: Christian Tognazza
+Datum: 13.04.2023
+"""
+
+import random
+
+import pytest
+
+from headless import build_model
+from model import *
+
+# the cars of a road are kept rearmost car first, spawns go to the left end and exits leave on the right
+
+
+def new_road(length=30):
+    generator = CarGenerator(position=0, delay=10, min_speed=50,
+                             max_speed=150, rng=random.Random(1))
+    return Road(0, "horizontal", length, generator)
+
+
+def positions(road):
+    return [car.position for car in road.cars]
+
+
+def test_add_car_keeps_the_cars_in_road_order():
+    road = new_road()
+    for position in [10, 4, 20, 0, 15]:
+        road.add_car(Car(speed=50, max_speed=100, position=position))
+        assert road.cars_sorted
+    assert positions(road) == [0, 4, 10, 15, 20]
+
+    # the rearmost car and any other car block their position
+    for position in [0, 15]:
+        with pytest.raises(Exception):
+            road.add_car(Car(speed=50, max_speed=100, position=position))
+    assert positions(road) == [0, 4, 10, 15, 20]
+    assert road.is_position_taken(15) and not road.is_position_taken(16)
+
+
+def test_set_cars_notices_cars_out_of_order():
+    road = new_road()
+    road.set_cars([Car(speed=50, max_speed=100, position=position)
+                   for position in [3, 9, 6]])
+    assert not road.cars_sorted
+    assert road.is_position_taken(6) and not road.is_position_taken(5)
+
+    # adding a car sorts them again
+    road.add_car(Car(speed=50, max_speed=100, position=1))
+    assert road.cars_sorted
+    assert positions(road) == [1, 3, 6, 9]
+
+
+def test_cars_stay_in_road_order_until_they_leave():
+    model = build_model(60, (3, 3), 3, 150, seed=3)
+    exited = {id(road): 0 for road in model.roads}
+    for _ in range(800):
+        model.do_tick()
+        for road in model.roads:
+            if road.cars_sorted:
+                assert positions(road) == sorted(positions(road))
+            assert all(car.position < road.length for car in road.cars)
+            # every spawned car is either on the road or has left it once
+            assert road.spawned == road.exited + len(road.cars)
+            assert len({car.number for car in road.cars}) == len(road.cars)
+            exited[id(road)] = road.exited
+    assert all(exited.values())
+
+
+def test_cars_have_no_instance_dict():
+    car = Car(speed=50, max_speed=100, position=0)
+    with pytest.raises(AttributeError):
+        car.color = "red"
@@ -0,0 +1,100 @@
+"""
+Description: A simulation environment for car traffic with cellular automata
+The program encapsules four files: main.py, controller.py, model.py, view.py
+Author: Christian Tognazza
+Datum: 13.04.2023
+"""
+
+import pytest
+
+from event_engine import ACCELERATING
+from events import EventLog
+from headless import build_model
+
+# every engine follows the same rules as Road.do_tick and Car.do_tick,
+# a seeded run gives exactly the same cars and counters with each of them
+
+# size, roads, generator delay, average speed, ticks, seed
+CASES = [
+    (50, (5, 5), 10, 100, 600, 1),
+    (50, (5, 5), 3, 150, 600, 2),
+    (80, (2, 1), 20, 100, 900, 5),
+    (40, (0, 4), 3, 200, 900, 7),
+]
+
+
+def road_states(model):
+    # counters and cars of every road, the cars of the engine are written back to the roads first
+    model.store_engine_cars()
+    states = [(road.spawned, road.exited, road.blocked,
+               [(car.position, car.speed, car.progress, car.max_speed, car.number) for car in road.cars])
+              for road in model.roads]
+    model.load_engine_cars()
+    return states
+
+
+def assert_same_runs(case, engines):
+    size, roads, delay, avg_speed, ticks, seed = case
+    models = [build_model(size, roads, delay, avg_speed, engine=engine, seed=seed)
+              for engine in engines]
+    for _ in range(0, ticks, 100):
+        for model in models:
+            for _ in range(100):
+                model.do_tick()
+        expected = road_states(models[0])
+        for model in models[1:]:
+            assert road_states(model) == expected
+
+
+@pytest.mark.parametrize("case", CASES)
+def test_numpy_engine_runs_like_object_engine(case):
+    pytest.importorskip("numpy")
+    assert_same_runs(case, ["object", "numpy"])
+
+
+@pytest.mark.parametrize("case", CASES)
+def test_event_engine_runs_like_object_engine(case):
+    assert_same_runs(case, ["object", "event"])
+
+
+def test_event_engine_lets_free_cars_sleep():
+    # on a road without light signals the cars accelerate after they are generated and cruise behind
+    # each other, most of them sleep, accelerating cars as well
+    case = (400, (1, 0), 20, 100, 1500, 3)
+    assert_same_runs(case, ["object", "event"])
+
+    size, roads, delay, avg_speed, ticks, seed = case
+    model = build_model(size, roads, delay, avg_speed, engine="event", seed=seed)
+    asleep = cars = accelerating = 0
+    for tick in range(ticks):
+        model.do_tick()
+        if tick >= 500:
+            plans = model.engine.plans
+            asleep += len(plans)
+            cars += model.count_cars()
+            accelerating += sum(plan.kind == ACCELERATING for plan in plans.values())
+    assert asleep / cars > 0.5
+    assert accelerating > 0
+
+
+@pytest.mark.parametrize("case", CASES)
+def test_event_engine_renders_like_object_engine(case):
+    # the event engine moves sleeping cars only when their cells are rendered
+    size, roads, delay, avg_speed, ticks, seed = case
+    models = [build_model(size, roads, delay, avg_speed, engine=engine, render_grid=True, seed=seed)
+              for engine in ["object", "event"]]
+    for model in models:
+        model.set_events(EventLog())
+    for tick in range(ticks):
+        for model in models:
+            model.do_tick()
+        assert models[1].grid == models[0].grid
+        assert models[1].border_grid == models[0].border_grid
+        if tick % 100 == 99:
+            # rendering stopped for a while, the cars of the next rendered tick are the same
+            for model in models:
+                model.render_grid = False
+                model.advance(37)
+                model.render_grid = True
+    assert models[1].events.recent() == models[0].events.recent()
+    assert road_states(models[1]) == road_states(models[0])
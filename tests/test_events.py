@@ -0,0 +1,109 @@
+"""
+Description: A simulation environment for car traffic with cellular automata
+The program encapsules four files: main.py, controller.py, model.py, view.py
+Author: Christian Tognazza
+Datum: 13.04.2023
+"""
+
+import random
+
+import pytest
+
+from events import EventLog, format_event
+from headless import build_model
+from model import *
+
+# the event log counts every event of the model, keeps the last ones and samples them to its sink
+
+
+def new_road(offset=3):
+    generator = CarGenerator(position=0, delay=10, min_speed=50,
+                             max_speed=150, rng=random.Random(1))
+    return Road(offset, "vertical", 30, generator)
+
+
+def test_events_follow_the_model():
+    model = build_model(30, (3, 3), 3, 150, seed=10)
+    events = EventLog(capacity=50)
+    model.set_events(events)
+    signal_states = []
+
+    def check_signal(event):
+        # a signal change is emitted with the state the light signal switched to
+        tick, kind, direction, offset, position, value = event
+        if kind == "signal_change":
+            road = model.roads_by_offset[(direction, offset)]
+            light_signal = road.light_signals[road.find_light_signal(position)]
+            signal_states.append(light_signal.state == value)
+
+    events.subscribe(check_signal)
+    for _ in range(400):
+        model.do_tick()
+
+    assert events.counters["spawn_blocked"] == sum(road.blocked for road in model.roads) > 0
+    assert events.counters["car_exit"] == sum(road.exited for road in model.roads) > 0
+    assert signal_states and all(signal_states)
+    assert len(signal_states) == events.counters["signal_change"]
+
+    # the ring buffer keeps the last events in tick order
+    recent = events.recent()
+    assert len(recent) == 50
+    assert [event[0] for event in recent] == sorted(event[0] for event in recent)
+    assert recent[-1][0] <= model.tick
+    assert events.recent("car_exit", 3) == [
+        event for event in recent if event[1] == "car_exit"][-3:]
+
+    # an unsubscribed listener gets no more events
+    events.unsubscribe(check_signal)
+    checked = len(signal_states)
+    for _ in range(100):
+        model.do_tick()
+    assert len(signal_states) == checked < events.counters["signal_change"]
+
+
+def test_sink_gets_a_sample_per_window():
+    lines = []
+    events = EventLog(sink=lines.append, sample_rate=2, sample_interval=10)
+    road = new_road()
+    for tick in range(25):
+        events.tick = tick
+        events.emit("spawn_blocked", road, 0)
+        if tick % 2 == 0:
+            events.emit("car_exit", road, 30, tick)
+    events.flush()
+
+    assert lines == [
+        "tick 0: traffic jam! (vertical road 3, position 0)",
+        "tick 0: car left the road (vertical road 3, position 30, car 0)",
+        "tick 1: traffic jam! (vertical road 3, position 0)",
+        "tick 2: car left the road (vertical road 3, position 30, car 2)",
+        "8 more spawn_blocked events in ticks 0 to 9",
+        "tick 10: traffic jam! (vertical road 3, position 0)",
+        "3 more car_exit events in ticks 0 to 9",
+        "tick 10: car left the road (vertical road 3, position 30, car 10)",
+        "tick 11: traffic jam! (vertical road 3, position 0)",
+        "tick 12: car left the road (vertical road 3, position 30, car 12)",
+        "8 more spawn_blocked events in ticks 10 to 19",
+        "tick 20: traffic jam! (vertical road 3, position 0)",
+        "3 more car_exit events in ticks 10 to 19",
+        "tick 20: car left the road (vertical road 3, position 30, car 20)",
+        "tick 21: traffic jam! (vertical road 3, position 0)",
+        "tick 22: car left the road (vertical road 3, position 30, car 22)",
+        "3 more spawn_blocked events in ticks 20 to 29",
+        "1 more car_exit events in ticks 20 to 29",
+    ]
+    assert events.counters == {"spawn_blocked": 25, "car_exit": 13, "signal_change": 0,
+                               "road_added": 0, "road_removed": 0}
+
+
+def test_kinds_that_are_not_recorded_are_dropped():
+    events = EventLog(kinds=["road_added"])
+    road = new_road()
+    events.emit("car_exit", road, 30, 1)
+    events.emit("road_added", road)
+    assert events.recent() == [(0, "road_added", "vertical", 3, None, None)]
+    assert format_event(events.recent()[0]) == "tick 0: road added (vertical road 3)"
+    with pytest.raises(Exception):
+        EventLog(kinds=["car_crash"])
+    with pytest.raises(Exception):
+        EventLog(sample_interval=0)
@@ -0,0 +1,65 @@
+"""
+Description: A simulation environment for car traffic with cellular automata
+The program encapsules four files: main.py, controller.py, model.py, view.py
+Author: Christian Tognazza
+Datum: 13.04.2023
+"""
+
+import os
+
+import pytest
+
+from export import TrajectoryExporter, load_table
+from headless import build_model
+
+# the export only depends on the simulated ticks, not on the engine or on skipped ticks
+
+
+def export_files(directory):
+    files = {}
+    for path, _, names in os.walk(directory):
+        for name in names:
+            with open(os.path.join(path, name), "rb") as export_file:
+                files[os.path.relpath(os.path.join(path, name), directory)] = export_file.read()
+    return files
+
+
+def export_run(directory, engine, fast_forward):
+    model = build_model(30, (2, 2), 60, 150, engine=engine, seed=3)
+    model.exporter = TrajectoryExporter(str(directory), sample_every=4, chunk_rows=400)
+    for _ in range(10):
+        if fast_forward:
+            model.advance(100)
+        else:
+            for _ in range(100):
+                model.do_tick()
+        # only the rows of the open chunk are held in memory
+        for writer in model.exporter.writers.values():
+            assert len(writer.buffers[0]) < writer.chunk_rows
+    model.exporter.close()
+    return model
+
+
+def test_export_is_the_same_for_every_engine(tmp_path):
+    pytest.importorskip("numpy")
+    export_run(tmp_path / "object", "object", False)
+    export_run(tmp_path / "numpy", "numpy", True)
+    export_run(tmp_path / "event", "event", True)
+    expected = export_files(tmp_path / "object")
+    assert len(expected) > 20
+    assert export_files(tmp_path / "numpy") == expected
+    assert export_files(tmp_path / "event") == expected
+
+
+def test_exported_tables_hold_every_sample(tmp_path):
+    pytest.importorskip("numpy")
+    model = export_run(tmp_path, "object", True)
+    roads = load_table(str(tmp_path), "roads")
+    assert roads["tick"].tolist() == [tick for tick in range(4, 1001, 4) for _ in model.roads]
+    cars = load_table(str(tmp_path), "cars")
+    assert len(cars["tick"]) == int(roads["cars"].sum())
+    last = cars["tick"] == model.tick
+    assert sorted(zip(cars["road"][last].tolist(), cars["car"][last].tolist(),
+                      cars["position"][last].tolist())) == sorted(
+        (road_index, car.number, car.position)
+        for road_index, road in enumerate(model.roads) for car in road.cars)
@@ -0,0 +1,47 @@
+"""
+Description: A simulation environment for car traffic with cellular automata
+The program encapsules four files: main.py, controller.py, model.py, view.py
+Author: Christian Tognazza
+Datum: 13.04.2023
+"""
+
+import pytest
+
+from headless import build_model, main
+from snapshot import save_snapshot
+
+# invalid run options end with a usage error, not with a traceback
+
+
+def test_run_prints_the_summary(capsys):
+    main(["run", "--size", "30", "--roads", "2x2", "--ticks", "200", "--seed", "1"])
+    lines = capsys.readouterr().out.splitlines()
+    assert any(line.startswith("spawned: ") for line in lines)
+
+
+@pytest.mark.parametrize("argv", [
+    ["--engine", "numpy", "--block-intersections"],
+    ["--engine", "event", "--block-intersections"],
+    ["--restore", "missing.tsim"],
+    ["--size", "20", "--roads", "30x3"],
+    ["--size", "20", "--roads", "3x-1"],
+    ["--checkpoint-every", "10"],
+])
+def test_invalid_options_are_usage_errors(argv, tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(SystemExit) as exit_info:
+        main(["run", "--ticks", "10"] + argv)
+    assert exit_info.value.code == 2
+    assert "error:" in capsys.readouterr().err
+
+
+def test_unusable_snapshots_are_usage_errors(tmp_path, capsys):
+    (tmp_path / "broken.tsim").write_bytes(b"no snapshot")
+    blocked = build_model(20, (2, 2), 5, 100, block_intersections=True, seed=1)
+    save_snapshot(blocked, str(tmp_path / "blocked.tsim"))
+    for argv in [["--restore", str(tmp_path / "broken.tsim")],
+                 ["--restore", str(tmp_path / "blocked.tsim"), "--engine", "event"]]:
+        with pytest.raises(SystemExit) as exit_info:
+            main(["run", "--ticks", "10"] + argv)
+        assert exit_info.value.code == 2
+        assert "cannot restore snapshot" in capsys.readouterr().err
@@ -0,0 +1,87 @@
+"""
+Description: A simulation environment for car traffic with cellular automata
+The program encapsules four files: main.py, controller.py, model.py, view.py
+Author: Christian Tognazza
+Datum: 13.04.2023
+"""
+
+import json
+
+from headless import build_model
+from instrumentation import HISTOGRAM_BOUNDS, Instrumentation
+
+# an instrumented tick does the same as a plain tick and records every phase and the car counters
+
+
+def model_state(model):
+    model.store_engine_cars()
+    state = ([(road.spawned, road.exited, road.blocked,
+               [(car.position, car.speed, car.progress) for car in road.cars])
+              for road in model.roads], bytes(model.grid), bytes(model.border_grid))
+    model.load_engine_cars()
+    return state
+
+
+def test_instrumented_ticks_are_plain_ticks():
+    for engine in ["object", "event"]:
+        models = [build_model(40, (3, 3), 3, 120, engine=engine, render_grid=True, seed=8)
+                  for _ in range(2)]
+        models[1].instrumentation = Instrumentation()
+        for tick in range(300):
+            if tick == 150:
+                for model in models:
+                    model.set_num_roads(1, "vertical")
+            for model in models:
+                model.do_tick()
+        assert model_state(models[0]) == model_state(models[1])
+
+
+def test_phases_and_counters_are_recorded(tmp_path):
+    model = build_model(40, (3, 3), 3, 120, render_grid=True, seed=8)
+    instrumentation = Instrumentation(window=100)
+    model.instrumentation = instrumentation
+    for tick in range(250):
+        if tick == 150:
+            start_totals = {name: sum(getattr(road, name) for road in model.roads)
+                            for name in ["spawned", "exited", "blocked"]}
+        if tick == 200:
+            model.set_num_roads(4, "horizontal")
+        model.do_tick()
+
+    path = str(tmp_path / "ticks.json")
+    instrumentation.export(path)
+    with open(path) as export_file:
+        export = json.load(export_file)
+
+    # the last window of ticks is kept
+    assert [row["tick"] for row in export["ticks"]] == list(range(150, 250))
+    assert {"Road.do_tick", "Model.update_light_signals", "Model.render_dynamic_cells",
+            "Model.add_roads"} <= set(export["phases"])
+    for name, phase in export["phases"].items():
+        assert sum(phase["histogram"]) == len(instrumentation.phases[name])
+        assert phase["p50"] <= phase["p95"] <= phase["max"]
+    # the road ticks of a tick add up
+    assert all(row["phases"]["Road.do_tick"] > 0 for row in export["ticks"])
+
+    # the counters of the kept ticks add up to the change of the road totals
+    assert export["ticks"][-1]["counters"]["cars"] == model.count_cars()
+    for name, start_total in start_totals.items():
+        total = sum(getattr(road, name) for road in model.roads)
+        assert sum(row["counters"][name] for row in export["ticks"]) == total - start_total
+    assert sum(row["counters"]["spawned"] for row in export["ticks"]) > 0
+
+
+def test_histogram_and_percentiles():
+    instrumentation = Instrumentation()
+    for tick, seconds in enumerate([0.0000005, 0.0000015, 0.0000015, 0.003, 10]):
+        instrumentation.begin_tick(tick)
+        instrumentation.record("phase", seconds)
+    instrumentation.begin_tick(5)
+
+    buckets = instrumentation.histogram("phase")
+    assert len(buckets) == len(HISTOGRAM_BOUNDS) + 1
+    assert buckets[0] == 1 and buckets[1] == 2 and buckets[-1] == 1
+    assert sum(buckets) == 5
+    assert instrumentation.percentile("phase", 50) == 0.0000015
+    assert instrumentation.percentile("phase", 100) == 10
+    assert instrumentation.percentile("missing", 50) == 0
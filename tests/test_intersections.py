@@ -0,0 +1,33 @@
+"""
+Description: A simulation environment for car traffic with cellular automata
+The program encapsules four files: main.py, controller.py, model.py, view.py
+Author: Christian Tognazza
+Datum: 13.04.2023
+"""
+
+import pytest
+
+from headless import build_model
+
+# with blocked intersections no intersection cell ever holds cars of two roads
+# and cars wait behind the car in front instead of driving into it
+
+
+@pytest.mark.parametrize("avg_speed, delay", [(200, 3), (250, 5)])
+def test_intersections_hold_cars_of_one_road(avg_speed, delay):
+    model = build_model(50, (8, 8), delay, avg_speed, block_intersections=True, seed=0)
+    intersections = {cell for road in model.roads for cell in road.crossings.values()}
+    for _ in range(1500):
+        model.do_tick()
+        roads_on_cells = {}
+        for road in model.roads:
+            positions = [car.position for car in road.cars]
+            assert len(set(positions)) == len(positions)
+            first_cell, cell_step = model.road_cells(road)
+            for position in positions:
+                cell = first_cell + position * cell_step
+                if cell in intersections:
+                    assert roads_on_cells.setdefault(cell, road) is road
+        # every held intersection is held by a car standing on it
+        for cell, (road, car) in model.occupancy.items():
+            assert road.crossings[car.position] == cell
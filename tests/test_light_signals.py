@@ -0,0 +1,69 @@
+"""
+Description: A simulation environment for car traffic with cellular automata
+The program encapsules four files: main.py, controller.py, model.py, view.py
+Author: Christian Tognazza
+Datum: 13.04.2023
+"""
+
+import random
+
+from headless import build_model
+from model import *
+
+# the light signal indexes of a road give the same distances as scanning all light signals
+
+
+def scanned_distance(road, position):
+    # distance to the first red light signal at or after the position
+    for light_signal in road.light_signals:
+        if light_signal.position >= position and light_signal.state == 0:
+            return min(light_signal.position - position, NO_OBSTACLE_DISTANCE)
+    return NO_OBSTACLE_DISTANCE
+
+
+def assert_index_matches_scan(road):
+    if road.light_signals_changed:
+        road.index_light_signals()
+    for position in range(road.length):
+        assert road.find_next_light_signal_distance(
+            position) == scanned_distance(road, position)
+
+
+def test_index_follows_the_switching_light_signals():
+    model = build_model(40, (4, 3), 10, 100, seed=2)
+    for tick in range(400):
+        # removed roads take their light signals along, recalculated ones start again
+        if tick == 150:
+            model.set_num_roads(2, "vertical")
+        if tick == 250:
+            model.calculate_intersection_light_signals()
+        model.do_tick()
+        if tick % 7 == 0:
+            for road in model.roads:
+                assert_index_matches_scan(road)
+
+
+def test_index_follows_added_removed_and_changed_light_signals():
+    generator = CarGenerator(position=0, delay=10, min_speed=50,
+                             max_speed=150, rng=random.Random(1))
+    road = Road(0, "horizontal", 60, generator)
+    assert_index_matches_scan(road)
+
+    rng = random.Random(5)
+    for _ in range(200):
+        action = rng.random()
+        if action < 0.4 or not road.light_signals:
+            position = rng.randrange(road.length)
+            if road.find_light_signal(position) is None:
+                road.add_light_signal(LightSignal(
+                    position, state=rng.randrange(2)))
+        elif action < 0.6:
+            road.remove_light_signal(rng.randrange(len(road.light_signals)))
+        else:
+            # a light signal switches like in Model.update_light_signals
+            if road.light_signals_changed:
+                road.index_light_signals()
+            i = rng.randrange(len(road.light_signals))
+            road.light_signals[i].state = 1 - road.light_signals[i].state
+            road.update_red_light_signal_index(i)
+        assert_index_matches_scan(road)
@@ -0,0 +1,93 @@
+"""
+Description: A simulation environment for car traffic with cellular automata
+The program encapsules four files: main.py, controller.py, model.py, view.py
+Author: Christian Tognazza
+Datum: 13.04.2023
+"""
+
+import pytest
+
+from headless import build_model
+from metrics import RoadMetrics, TrafficMetrics, Window
+
+# the statistics are updated incrementally and equal a recount from the cars
+
+
+def metrics_model(engine, sliding=True, seed=5, delay=4):
+    model = build_model(40, (3, 3), delay, 130, engine=engine, seed=seed)
+    model.set_metrics(TrafficMetrics(window=50, sliding=sliding))
+    return model
+
+
+def assert_same_summary(summary, expected):
+    assert summary.keys() == expected.keys()
+    for name, value in expected.items():
+        if name == "roads":
+            for road_summary, expected_road_summary in zip(summary[name], value):
+                assert_same_summary(road_summary, expected_road_summary)
+        elif isinstance(value, list):
+            assert summary[name] == pytest.approx(value)
+        else:
+            assert summary[name] == pytest.approx(value), name
+
+
+def test_incremental_counts_equal_a_recount():
+    model = metrics_model("object")
+    exited = [[road.exited] for road in model.roads]
+    for _ in range(300):
+        model.do_tick()
+        for road, road_exited in zip(model.roads, exited):
+            road_exited.append(road.exited)
+            recount = RoadMetrics(road, 50, True)
+            assert road.metrics.cars == recount.cars == len(road.cars)
+            assert road.metrics.speed_histogram == recount.speed_histogram
+            assert road.metrics.speed_sum == pytest.approx(recount.speed_sum, abs=1e-6)
+            assert road.metrics.stopped_after_light_signals == recount.stopped_after_light_signals
+            assert [light_signal.stopped for light_signal in road.metrics.light_signals] == \
+                [light_signal.stopped for light_signal in recount.light_signals]
+            # exits of the last 50 ticks
+            exits = road_exited[-1] - road_exited[max(len(road_exited) - 51, 0)]
+            assert road.metrics.exit_flow.total == exits
+
+
+@pytest.mark.parametrize("sliding", [True, False])
+@pytest.mark.parametrize("engine", ["object", "numpy", "event"])
+def test_summary_is_the_same_for_every_engine_and_skipped_ticks(engine, sliding):
+    if engine == "numpy":
+        pytest.importorskip("numpy")
+    # long generator delays leave idle ticks to skip
+    stepped = metrics_model("object", sliding, seed=9, delay=150)
+    advanced = metrics_model(engine, sliding, seed=9, delay=150)
+    for _ in range(6):
+        for _ in range(250):
+            stepped.do_tick()
+        advanced.advance(250)
+        assert_same_summary(advanced.metrics.summary(advanced.roads),
+                            stepped.metrics.summary(stepped.roads))
+        assert advanced.metrics.fundamental_diagram(advanced.roads) == pytest.approx(
+            stepped.metrics.fundamental_diagram(stepped.roads))
+
+
+@pytest.mark.parametrize("sliding", [True, False])
+@pytest.mark.parametrize("ticks", [3, 10, 27, 95])
+def test_window_jump_equals_single_ticks(ticks, sliding):
+    jumped = Window(10, sliding)
+    stepped = Window(10, sliding)
+    for value in range(13):
+        jumped.add(value)
+        jumped.advance()
+        stepped.add(value)
+        stepped.advance()
+    jumped.jump(ticks, 4)
+    for _ in range(ticks):
+        stepped.add(4)
+        stepped.advance()
+    assert (jumped.total, jumped.ticks, jumped.span(), jumped.rate()) == \
+        (stepped.total, stepped.ticks, stepped.span(), stepped.rate())
+    # the window goes on the same after the jump
+    for value in range(7):
+        jumped.add(value)
+        jumped.advance()
+        stepped.add(value)
+        stepped.advance()
+        assert jumped.total == stepped.total
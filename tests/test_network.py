@@ -0,0 +1,42 @@
+"""
+Description: A simulation environment for car traffic with cellular automata
+The program encapsules four files: main.py, controller.py, model.py, view.py
+Author: Christian Tognazza
+Datum: 13.04.2023
+"""
+
+import pytest
+
+from network import NetworkSimulation, grid_network
+
+# the same seed gives the same run for any number of processes
+
+
+def network_run(processes, seed, light_signals=True):
+    simulation = NetworkSimulation(grid_network(
+        4, 3, block_length=12, delay=4, avg_speed=120, light_signals=light_signals, seed=seed),
+        processes=processes)
+    states = []
+    try:
+        for _ in range(4):
+            simulation.run(100)
+            summary = simulation.summary()
+            # every spawned car is on a link, waits at a junction or left the network
+            assert summary["spawned"] == summary["cars"] + summary["waiting"] + summary["exited"]
+            states.append((summary, simulation.car_states()))
+    finally:
+        simulation.close()
+    return states
+
+
+@pytest.mark.parametrize("light_signals", [True, False])
+def test_same_seed_gives_the_same_run(light_signals):
+    expected = network_run(1, 3, light_signals)
+    assert expected[-1][0]["exited"] > 0
+    assert network_run(1, 3, light_signals) == expected
+    assert network_run(1, 4, light_signals) != expected
+
+
+@pytest.mark.parametrize("processes", [2, 3])
+def test_run_does_not_depend_on_the_processes(processes):
+    assert network_run(processes, 5) == network_run(1, 5)
@@ -0,0 +1,97 @@
+"""
+Description: A simulation environment for car traffic with cellular automata
+The program encapsules four files: main.py, controller.py, model.py, view.py
+Author: Christian Tognazza
+Datum: 13.04.2023
+"""
+
+import os
+import struct
+import zlib
+
+import pytest
+
+from headless import build_model, run
+from raster import COLOR_RGB, FrameWriter, png_bytes, ppm_bytes, render_pixels
+
+# the pixel buffer shows every cell as a scale x scale square, with a border like on the canvas
+
+
+def pixel(grid, border_grid, size, scale, px, py):
+    # color of a single pixel, computed cell by cell
+    border = max(1, round(scale / 10)) if scale >= 3 else 0
+    cell = px // scale * size + py // scale
+    x, y = px % scale, py % scale
+    if min(x, y) < border or max(x, y) >= scale - border:
+        return bytes(COLOR_RGB[border_grid[cell]])
+    return bytes(COLOR_RGB[grid[cell]])
+
+
+def rendered_model(size=12, ticks=40):
+    model = build_model(size, (2, 2), 3, 150, render_grid=True, seed=9)
+    for _ in range(ticks):
+        model.do_tick()
+    return model
+
+
+def decode_png(data):
+    # chunks are checked and the pixel rows without their filter byte are returned
+    assert data[:8] == b"\x89PNG\r\n\x1a\n"
+    offset, chunks = 8, {}
+    while offset < len(data):
+        length, = struct.unpack_from(">I", data, offset)
+        kind = data[offset + 4:offset + 8]
+        body = data[offset + 8:offset + 8 + length]
+        crc, = struct.unpack_from(">I", data, offset + 8 + length)
+        assert crc == zlib.crc32(kind + body)
+        chunks[kind] = body
+        offset += 12 + length
+    width, height, depth, color_type, _, _, _ = struct.unpack(">IIBBBBB", chunks[b"IHDR"])
+    raw = zlib.decompress(chunks[b"IDAT"])
+    stride = width * 3 + 1
+    assert all(raw[row] == 0 for row in range(0, len(raw), stride))
+    return width, height, b"".join(raw[row + 1:row + stride] for row in range(0, len(raw), stride))
+
+
+@pytest.mark.parametrize("scale", [1, 2, 3, 5, 12])
+def test_render_pixels_matches_the_cells(scale):
+    model = rendered_model()
+    size = model.size
+    pixels = render_pixels(model.grid, model.border_grid, size, scale)
+    width = size * scale
+    assert len(pixels) == width * width * 3
+    for py in range(width):
+        for px in range(width):
+            offset = (py * width + px) * 3
+            assert pixels[offset:offset + 3] == pixel(
+                model.grid, model.border_grid, size, scale, px, py)
+
+
+def test_ppm_and_png_hold_the_pixels():
+    model = rendered_model()
+    pixels = render_pixels(model.grid, model.border_grid, model.size, 4)
+    ppm = ppm_bytes(model.grid, model.border_grid, model.size, 4)
+    assert ppm == b"P6 48 48 255\n" + pixels
+    assert decode_png(png_bytes(model.grid, model.border_grid, model.size, 4)) == (48, 48, pixels)
+
+
+@pytest.mark.parametrize("sparse", [False, True])
+def test_frame_writer_writes_every_nth_tick(tmp_path, sparse):
+    directory = str(tmp_path / "frames")
+    writer = FrameWriter(directory, every=25, image_format="ppm", scale=2)
+    model = build_model(12, (2, 2), 3, 150, seed=9, sparse=sparse)
+    run(model, 100, frame_writer=writer)
+
+    assert sorted(os.listdir(directory)) == [
+        f"frame_{tick:08d}.ppm" for tick in [25, 50, 75, 100]]
+    assert writer.frames == 4
+    reference = rendered_model(ticks=100)
+    with open(os.path.join(directory, "frame_00000100.ppm"), "rb") as frame_file:
+        assert frame_file.read() == ppm_bytes(reference.grid, reference.border_grid, 12, 2)
+
+
+def test_frame_writer_options_are_checked(tmp_path):
+    with pytest.raises(Exception):
+        FrameWriter(str(tmp_path), image_format="gif")
+    with pytest.raises(Exception):
+        FrameWriter(str(tmp_path), every=0)
@@ -0,0 +1,75 @@
+"""
+Description: A simulation environment for car traffic with cellular automata
+The program encapsules four files: main.py, controller.py, model.py, view.py
+Author: Christian Tognazza
+Datum: 13.04.2023
+"""
+
+import random
+
+from headless import build_model
+from replay import Replay, ReplayRecorder
+
+# every tick of a recording is shown with the grids the model rendered in it
+
+
+def record_run(path, ticks, close=True):
+    model = build_model(30, (3, 3), 5, 120, render_grid=True, seed=2)
+    recorder = ReplayRecorder(str(path), model, keyframe_every=40)
+    grids = {model.tick: (bytes(model.grid), bytes(model.border_grid))}
+    for tick in range(ticks):
+        if tick == 130:
+            # the recording also holds topology changes
+            model.set_num_roads(5, "horizontal")
+        if tick == 210:
+            model.update_generators_delay(2)
+        model.do_tick()
+        recorder.record(model)
+        grids[model.tick] = (bytes(model.grid), bytes(model.border_grid))
+    if close:
+        recorder.close()
+    else:
+        recorder.file.flush()
+    return grids
+
+
+def test_seeking_shows_the_recorded_grids(tmp_path):
+    grids = record_run(tmp_path / "run.trep", 300)
+    replay = Replay(str(tmp_path / "run.trep"))
+    assert (replay.first_tick, replay.last_tick) == (min(grids), max(grids))
+
+    rng = random.Random(1)
+    ticks = [rng.randint(replay.first_tick, replay.last_tick) for _ in range(40)]
+    # single steps forwards and backwards as well
+    ticks += list(range(95, 105)) + list(range(105, 95, -1))
+    for tick in ticks:
+        replay.seek(tick)
+        assert replay.tick == tick
+        assert (replay.grid, replay.border_grid) == grids[tick]
+    replay.close()
+
+
+def test_model_at_continues_the_recorded_run(tmp_path):
+    grids = record_run(tmp_path / "run.trep", 300)
+    replay = Replay(str(tmp_path / "run.trep"))
+    # ticks right after the roads changed cannot be simulated from the keyframe before the change
+    for tick in [0, 39, 40, 125, 131, 145, 159, 170, 211, 230, 300]:
+        model = replay.model_at(tick)
+        model.render_dynamic_cells()
+        assert model.tick == tick
+        assert (model.grid, model.border_grid) == grids[tick]
+    replay.close()
+
+
+def test_interrupted_recording_is_replayed(tmp_path):
+    path = tmp_path / "run.trep"
+    grids = record_run(path, 100, close=False)
+    # the last delta was not written completely
+    with open(path, "r+b") as replay_file:
+        replay_file.truncate(path.stat().st_size - 3)
+    replay = Replay(str(path))
+    assert replay.last_tick == max(grids) - 1
+    for tick in [99, 0, 50]:
+        replay.seek(tick)
+        assert (replay.grid, replay.border_grid) == grids[tick]
+    replay.close()
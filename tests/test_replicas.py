@@ -0,0 +1,56 @@
+"""
+Description: A simulation environment for car traffic with cellular automata
+The program encapsules four files: main.py, controller.py, model.py, view.py
+Author: Christian Tognazza
+Datum: 13.04.2023
+"""
+
+import pytest
+
+from headless import build_model
+
+pytest.importorskip("numpy")
+
+from replicas import Replicas, reseed_generators
+
+# replica k of seed s runs exactly like the layout model after reseed_generators(model, s)
+
+SEEDS = [3, 8, 11, 12]
+
+
+def layout_model(engine="object"):
+    model = build_model(40, (3, 4), 6, 120, engine=engine, seed=1)
+    for _ in range(50):
+        model.do_tick()
+    return model
+
+
+def road_states(roads):
+    return [(road.spawned, road.exited, road.blocked, road.generator.progress,
+             [(car.position, car.speed, car.progress, car.max_speed, car.number) for car in road.cars])
+            for road in roads]
+
+
+@pytest.mark.parametrize("engine", ["object", "numpy", "event"])
+def test_replicas_run_like_reseeded_models(engine):
+    replicas = Replicas(layout_model(), SEEDS)
+    models = []
+    for seed in SEEDS:
+        model = layout_model(engine)
+        reseed_generators(model, seed)
+        models.append(model)
+
+    for _ in range(3):
+        replicas.run(100)
+        replicas.engine.store_roads()
+        for replica, model in enumerate(models):
+            for _ in range(100):
+                model.do_tick()
+            model.store_engine_cars()
+            assert road_states(replicas.replica_roads(replica)) == road_states(model.roads)
+            model.load_engine_cars()
+
+    # the seeds give different runs
+    exited = [result["exited"] for result in replicas.summary()["per_replica"]]
+    assert exited == [sum(road.exited for road in model.roads) for model in models]
+    assert len(set(exited)) > 1
@@ -0,0 +1,128 @@
+"""
+Description: A simulation environment for car traffic with cellular automata
+The program encapsules four files: main.py, controller.py, model.py, view.py
+Author: Christian Tognazza
+Datum: 13.04.2023
+"""
+
+import asyncio
+import struct
+
+from headless import build_model
+from server import (DELTA, HEADER, KEYFRAME, FrameBroadcaster, FrameServer, encode_delta,
+                    read_websocket_frame, websocket_frame)
+
+# viewers that apply the streamed keyframes and deltas see the grids of the model
+
+
+class Client:
+    # applies the messages like the page of the server
+    def __init__(self):
+        self.tick = None
+        self.grid = None
+        self.border_grid = None
+        self.kinds = []
+
+    def receive(self, frame):
+        first, second = frame[0], frame[1]
+        assert first == 0x82
+        length, offset = second & 0x7f, 2
+        if length == 126:
+            length, = struct.unpack_from("!H", frame, 2)
+            offset = 4
+        elif length == 127:
+            length, = struct.unpack_from("!Q", frame, 2)
+            offset = 10
+        message = frame[offset:]
+        assert len(message) == length
+
+        kind, self.tick, count = HEADER.unpack_from(message)
+        data = message[HEADER.size:]
+        self.kinds.append(kind)
+        if kind == KEYFRAME:
+            self.grid = bytearray(data[:count * count])
+            self.border_grid = bytearray(data[count * count:])
+            assert len(self.border_grid) == count * count
+            return
+
+        assert kind == DELTA
+        cells = struct.unpack_from(f"<{count}I", data)
+        codes = data[4 * count:5 * count]
+        border_codes = data[5 * count:]
+        assert len(border_codes) == count
+        for cell, code, border_code in zip(cells, codes, border_codes):
+            self.grid[cell] = code
+            self.border_grid[cell] = border_code
+
+
+class Writer:
+    # stream writer of a client, drain waits while the client is busy
+    def __init__(self, client):
+        self.client = client
+        self.ready = asyncio.Event()
+        self.ready.set()
+
+    def write(self, frame):
+        self.client.receive(frame)
+
+    async def drain(self):
+        await self.ready.wait()
+
+
+def test_header_count_is_unsigned():
+    # the count is a uint32 like the cell indexes
+    assert HEADER.format == "<BqI"
+    assert HEADER.unpack(HEADER.pack(DELTA, 7, 2 ** 31)) == (DELTA, 7, 2 ** 31)
+    message = encode_delta(7, [3, 1], bytes([0, 2, 0, 3]), bytes([5, 3, 5, 5]))
+    assert message == HEADER.pack(DELTA, 7, 2) + struct.pack("<2I", 3, 1) + bytes([3, 2, 5, 3])
+
+
+def test_websocket_frames_round_trip():
+    async def read(frame):
+        reader = asyncio.StreamReader()
+        reader.feed_data(frame)
+        return await read_websocket_frame(reader)
+
+    for length in [0, 125, 126, 65535, 65536]:
+        payload = bytes(range(256)) * (length // 256) + bytes(length % 256)
+        opcode, received = asyncio.run(read(websocket_frame(payload)))
+        assert (opcode, bytes(received)) == (2, payload)
+
+    # frames of clients are masked
+    mask = bytes([1, 2, 3, 4])
+    payload = b"ping"
+    masked = bytes(byte ^ mask[i % 4] for i, byte in enumerate(payload))
+    opcode, received = asyncio.run(read(bytes([0x89, 0x80 | len(payload)]) + mask + masked))
+    assert (opcode, bytes(received)) == (9, payload)
+
+
+def test_clients_see_the_grids_of_the_model():
+    async def stream():
+        model = build_model(30, (3, 3), 5, 120, seed=1)
+        server = FrameServer(model)
+        broadcaster = FrameBroadcaster(model.size)
+        fast, slow = Client(), Client()
+        slow_writer = Writer(slow)
+        tasks = [asyncio.create_task(broadcaster.stream(Writer(fast))),
+                 asyncio.create_task(broadcaster.stream(slow_writer))]
+        for tick in range(200):
+            if tick == 50:
+                slow_writer.ready.clear()
+            if tick == 80:
+                slow_writer.ready.set()
+            broadcaster.publish(*server.tick_model())
+            await asyncio.sleep(0)
+            assert fast.tick == model.tick
+            assert (fast.grid, fast.border_grid) == (model.grid, model.border_grid)
+        await asyncio.sleep(0)
+        for task in tasks:
+            task.cancel()
+        return model, broadcaster, fast, slow
+
+    model, broadcaster, fast, slow = asyncio.run(stream())
+    # the fast client got one keyframe, the slow one skipped frames and got a keyframe again
+    assert fast.kinds.count(KEYFRAME) == 1
+    assert slow.kinds.count(KEYFRAME) == 2
+    assert broadcaster.frames_skipped > 0
+    assert slow.tick == model.tick
+    assert (slow.grid, slow.border_grid) == (model.grid, model.border_grid)
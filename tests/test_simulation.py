@@ -0,0 +1,145 @@
+"""
+Description: A simulation environment for car traffic with cellular automata
+The program encapsules four files: main.py, controller.py, model.py, view.py
+Author: Christian Tognazza
+Datum: 13.04.2023
+"""
+
+import time
+
+from headless import build_model
+from simulation import *
+
+# the simulation thread ticks like a model ticked directly and hands over the newest frame only
+
+
+def new_model():
+    return build_model(40, (3, 3), 5, 120, seed=6)
+
+
+def reference_grids(ticks):
+    # grids of a model that renders every tick
+    model = build_model(40, (3, 3), 5, 120, render_grid=True, seed=6)
+    grids = {}
+    for _ in range(ticks):
+        model.do_tick()
+        grids[model.tick] = (bytes(model.grid), bytes(model.border_grid))
+    return grids
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        assert time.perf_counter() < deadline
+        time.sleep(0.001)
+
+
+def test_frames_are_rendered_only_when_the_view_asks():
+    grids = reference_grids(60)
+    simulation = SimulationThread(new_model())
+
+    # the first tick renders a frame, the ticks after it wait for the view
+    for _ in range(10):
+        simulation.step()
+    tick, grid, border_grid = simulation.take_frame()
+    assert tick == 1
+    assert (bytes(grid), bytes(border_grid)) == grids[1]
+    assert simulation.take_frame() is None
+
+    # the frame taken last stays untouched while the worker renders the next one
+    simulation.step()
+    for _ in range(20):
+        simulation.step()
+    assert (tick, bytes(grid), bytes(border_grid)) == (1, *grids[1])
+    tick, grid, border_grid = simulation.take_frame()
+    assert tick == 11
+    assert (bytes(grid), bytes(border_grid)) == grids[11]
+
+
+def test_the_thread_ticks_until_it_is_stopped():
+    grids = reference_grids(400)
+    simulation = SimulationThread(new_model())
+    simulation.start_simulation()
+    try:
+        frames = 0
+        while simulation.model.tick < 300:
+            frame = simulation.take_frame()
+            if frame is not None:
+                tick, grid, border_grid = frame
+                assert (bytes(grid), bytes(border_grid)) == grids[tick]
+                frames += 1
+            time.sleep(0.001)
+        simulation.stop_simulation()
+        # the tick in progress finishes, then the model stays
+        with simulation.lock:
+            tick = simulation.model.tick
+        time.sleep(0.05)
+        assert simulation.model.tick <= tick + 1
+        assert frames > 0
+    finally:
+        simulation.close()
+        simulation.join(5)
+    assert not simulation.is_alive()
+
+
+def test_ticks_per_second_paces_the_thread():
+    simulation = SimulationThread(new_model(), ticks_per_second=200)
+    start = time.perf_counter()
+    simulation.start_simulation()
+    try:
+        wait_for(lambda: simulation.model.tick >= 40)
+    finally:
+        simulation.close()
+        simulation.join(5)
+    # 40 ticks at 200 ticks per second take at least 0.2 s
+    assert time.perf_counter() - start >= 0.19
+
+
+def test_change_queue_applies_the_latest_change_per_key_in_first_queued_order():
+    changes = ChangeQueue()
+    applied = []
+    for value in range(5):
+        changes.put(("num_roads", "vertical"), lambda value=value: applied.append(("vertical", value)))
+        changes.put("delay", lambda value=value: applied.append(("delay", value)))
+    changes.put(("num_roads", "horizontal"), lambda: applied.append(("horizontal", 1)))
+
+    assert changes.apply() == 3
+    assert applied == [("vertical", 4), ("delay", 4), ("horizontal", 1)]
+    assert changes.apply() == 0
+
+
+def test_queued_changes_are_applied_at_the_next_tick():
+    simulation = SimulationThread(new_model())
+    model = simulation.model
+    for _ in range(50):
+        simulation.step()
+    generators = [road.generator for road in model.roads]
+    progress = [generator.progress for generator in generators]
+
+    # a dragged slider queues many values, only the last one is applied
+    for delay in range(20, 2, -1):
+        simulation.changes.put("delay", lambda delay=delay: model.update_generators_delay(delay))
+    for avg_speed in range(60, 200, 10):
+        simulation.changes.put("avg_speed", lambda avg_speed=avg_speed: model.set_generator_avg_speed(avg_speed))
+    changes = model.changes
+    assert [generator.delay for generator in generators] == [5] * len(generators)
+
+    simulation.step()
+    assert model.tick == 51
+    assert model.changes == changes + 2
+    # the generators are changed in place and keep waiting for their next car
+    assert [road.generator for road in model.roads] == generators
+    assert all(generator.delay == 3 for generator in generators)
+    assert all((generator.min_speed, generator.max_speed) == (142, 237) for generator in generators)
+    assert [generator.progress for generator in generators] == [
+        0 if old >= generator.delay else old + 1 for old, generator in zip(progress, generators)]
+
+    # while paused the changes are applied without a tick and shown in a frame
+    simulation.take_frame()
+    simulation.changes.put(("num_roads", "vertical"), lambda: model.set_num_roads(1, "vertical"))
+    assert simulation.apply_changes()
+    assert not simulation.apply_changes()
+    assert model.tick == 51
+    assert sum(road.direction == "vertical" for road in model.roads) == 1
+    tick, grid, border_grid = simulation.take_frame()
+    assert tick == 51 and bytes(grid) == bytes(model.grid)
@@ -0,0 +1,68 @@
+"""
+Description: A simulation environment for car traffic with cellular automata
+The program encapsules four files: main.py, controller.py, model.py, view.py
+Author: Christian Tognazza
+Datum: 13.04.2023
+"""
+
+import pytest
+
+from headless import build_model
+from model import Model
+from snapshot import load_snapshot, save_snapshot
+
+# a restored model continues exactly like the model of the snapshot
+
+
+def model_state(model):
+    model.store_engine_cars()
+    state = (model.tick,
+             [(road.offset, road.direction, road.spawned, road.exited, road.blocked,
+               road.generator.progress, road.generator.rng.getstate(),
+               [(car.position, car.speed, car.progress, car.max_speed, car.number) for car in road.cars],
+               [(light_signal.position, light_signal.state_at(model.tick)) for light_signal in road.light_signals])
+              for road in model.roads])
+    model.load_engine_cars()
+    return state
+
+
+def run(model, ticks):
+    for _ in range(ticks):
+        model.do_tick()
+
+
+def test_snapshot_round_trip():
+    model = build_model(50, (4, 3), 5, 120, render_grid=True, seed=4)
+    run(model, 300)
+    data = model.snapshot()
+    restored = Model.restore(data)
+    assert restored.snapshot() == data
+    assert restored.grid == model.grid
+
+
+@pytest.mark.parametrize("engine", ["object", "numpy", "event"])
+def test_restored_model_continues_like_the_original(engine):
+    if engine == "numpy":
+        pytest.importorskip("numpy")
+    model = build_model(50, (5, 5), 5, 120, render_grid=True, seed=6)
+    run(model, 200)
+    # a snapshot also holds the roads added while the model runs
+    model.set_num_roads(3, "vertical")
+    run(model, 100)
+    restored = Model.restore(model.snapshot(), engine=engine)
+    for _ in range(4):
+        run(model, 100)
+        run(restored, 100)
+        assert model_state(restored) == model_state(model)
+        assert restored.grid == model.grid
+
+
+def test_saved_snapshot_is_loaded(tmp_path):
+    model = build_model(40, (2, 2), 10, 100, render_grid=True, seed=2)
+    run(model, 150)
+    path = tmp_path / "model.snap"
+    save_snapshot(model, str(path))
+    restored = load_snapshot(str(path))
+    run(model, 200)
+    run(restored, 200)
+    assert model_state(restored) == model_state(model)
@@ -0,0 +1,39 @@
+"""
+Description: A simulation environment for car traffic with cellular automata
+The program encapsules four files: main.py, controller.py, model.py, view.py
+Author: Christian Tognazza
+Datum: 13.04.2023
+"""
+
+import pytest
+
+from headless import build_model
+
+# a sparse model renders every region like the grids of a full model
+
+# x, y, width, height
+REGIONS = [(0, 0, 60, 60), (7, 13, 20, 9), (50, 0, 10, 60), (-5, 55, 12, 12)]
+
+
+def region_of(model, x, y, width, height):
+    grid = bytearray(width * height)
+    border_grid = bytearray([5]) * (width * height)
+    for column in range(max(x, 0), min(x + width, model.size)):
+        for row in range(max(y, 0), min(y + height, model.size)):
+            cell = (column - x) * height + row - y
+            grid[cell] = model.grid[column * model.size + row]
+            border_grid[cell] = model.border_grid[column * model.size + row]
+    return grid, border_grid
+
+
+@pytest.mark.parametrize("engine", ["object", "numpy", "event"])
+def test_sparse_regions_match_the_grids(engine):
+    if engine == "numpy":
+        pytest.importorskip("numpy")
+    full = build_model(60, (6, 4), 5, 120, engine=engine, render_grid=True, seed=8)
+    sparse = build_model(60, (6, 4), 5, 120, engine=engine, render_grid=False, seed=8, sparse=True)
+    for _ in range(5):
+        full.advance(80)
+        sparse.advance(80)
+        for region in REGIONS:
+            assert sparse.render_region(*region) == region_of(full, *region)
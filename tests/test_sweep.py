@@ -0,0 +1,65 @@
+"""
+Description: A simulation environment for car traffic with cellular automata
+The program encapsules four files: main.py, controller.py, model.py, view.py
+Author: Christian Tognazza
+Datum: 13.04.2023
+"""
+
+import argparse
+import json
+
+import pytest
+
+from sweep import (SCENARIO_KEYS, build_scenarios, load_finished, parse_seeds, run_scenario, run_sweep,
+                   scenario_key)
+
+# a sweep runs every scenario once, in worker processes, with the same results as a run in this process
+
+# counts of a run that only depend on the scenario, not on the timing
+COUNTS = ["cars", "spawned", "exited", "blocked", "mean_speed"]
+
+
+def read_results(path):
+    with open(path) as results:
+        return [json.loads(line) for line in results]
+
+
+def test_parse_seeds():
+    assert parse_seeds("3") == [3]
+    assert parse_seeds("2-5") == [2, 3, 4, 5]
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse_seeds("a-b")
+
+
+def test_build_scenarios_is_the_product_of_all_parameters():
+    scenarios = build_scenarios([20, 30], ["1x1", "2x2"], [5], [80, 120], [0, 1, 2], 50, "object")
+    assert len(scenarios) == 2 * 2 * 1 * 2 * 3
+    assert len({scenario_key(scenario) for scenario in scenarios}) == len(scenarios)
+    assert all(scenario["ticks"] == 50 and scenario["engine"] == "object"
+               for scenario in scenarios)
+
+
+def test_run_sweep_stores_every_run_once_and_resumes(tmp_path, capsys):
+    path = str(tmp_path / "results.jsonl")
+    scenarios = build_scenarios([20], ["2x2"], [3, 10], [100], [0, 1], 150, "object")
+    run_sweep(scenarios[:3], path, workers=2)
+
+    results = read_results(path)
+    assert sorted(scenario_key(result) for result in results) == sorted(
+        scenario_key(scenario) for scenario in scenarios[:3])
+    # the worker processes give the same runs as this process
+    for result in results:
+        scenario = {key: result[key] for key in SCENARIO_KEYS}
+        expected = run_scenario(scenario)
+        assert [result[key] for key in COUNTS] == [expected[key] for key in COUNTS]
+    # different seeds give different runs
+    assert len({tuple(result[key] for key in COUNTS) for result in results}) == len(results)
+
+    # an interrupted sweep leaves an incomplete last line, a restart only runs the missing scenario
+    with open(path, "a") as results_file:
+        results_file.write('{"size": 20, "roads"')
+    assert load_finished(path) == {scenario_key(scenario) for scenario in scenarios[:3]}
+    capsys.readouterr()
+    run_sweep(scenarios, path, workers=2)
+    assert "3 of 4 runs already done" in capsys.readouterr().out
+    assert load_finished(path) == {scenario_key(scenario) for scenario in scenarios}
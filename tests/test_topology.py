@@ -0,0 +1,151 @@
+"""
+Description: A simulation environment for car traffic with cellular automata
+The program encapsules four files: main.py, controller.py, model.py, view.py
+Author: Christian Tognazza
+Datum: 13.04.2023
+"""
+
+import random
+
+import pytest
+
+from events import EventLog
+from headless import build_model
+from metrics import RoadMetrics, TrafficMetrics
+from model import Model
+
+# roads added and removed one by one give the intersections of a full recalculation,
+# the roads that stay keep their cars and light signal phases
+
+
+def topology(model):
+    return (sorted(model.intersections),
+            {(road.direction, road.offset): (dict(road.crossings),
+                                             [light_signal.position for light_signal in road.light_signals])
+             for road in model.roads})
+
+
+def live_state(model, roads):
+    model.store_engine_cars()
+    state = {(road.direction, road.offset): (
+        [(car.position, car.speed, car.progress, car.number) for car in road.cars],
+        {light_signal.position: (light_signal.initial_state, light_signal.start_tick)
+         for light_signal in road.light_signals})
+        for road in roads}
+    model.load_engine_cars()
+    return state
+
+
+def changes(seed):
+    # number of roads in a direction, a few ticks after every change
+    rng = random.Random(seed)
+    for _ in range(25):
+        yield rng.randint(0, 9), rng.choice(["vertical", "horizontal"])
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_incremental_topology_equals_a_full_recalculation(seed):
+    model = build_model(40, (4, 4), 5, 120, render_grid=True, block_intersections=True, seed=seed)
+    model.set_metrics(TrafficMetrics(window=20))
+    for num_roads, direction in changes(seed):
+        model.set_num_roads(num_roads, direction)
+        for _ in range(15):
+            model.do_tick()
+
+        for road in model.roads:
+            for light_signal in road.light_signals:
+                assert light_signal.state == light_signal.state_at(model.tick)
+            recount = RoadMetrics(road, 20, True)
+            assert road.metrics.cars == recount.cars == len(road.cars)
+        occupancy = dict(model.occupancy)
+        model.index_occupancy()
+        assert model.occupancy == occupancy
+
+        # a restored model renders all its roads into empty grids
+        restored = Model.restore(model.snapshot())
+        assert restored.static_grid == model.static_grid
+        assert restored.grid == model.grid
+        assert restored.border_grid == model.border_grid
+
+        incremental = topology(model)
+        model.calculate_intersection_light_signals()
+        assert topology(model) == incremental
+
+
+@pytest.mark.parametrize("engine", ["object", "numpy", "event"])
+def test_other_roads_keep_their_state(engine):
+    if engine == "numpy":
+        pytest.importorskip("numpy")
+    model = build_model(40, (4, 4), 5, 120, engine=engine, seed=4)
+    for num_roads, direction in changes(4):
+        for _ in range(15):
+            model.do_tick()
+        kept = [road for road in model.roads if road.direction != direction]
+        existing = [road for road in model.roads if road.direction == direction]
+        kept += existing[:num_roads]
+        before = live_state(model, kept)
+        model.set_num_roads(num_roads, direction)
+        after = live_state(model, kept)
+        for key, (cars, light_signals) in before.items():
+            assert after[key][0] == cars
+            # light signals of the remaining intersections keep their phase
+            for position, phase in after[key][1].items():
+                if position in light_signals:
+                    assert phase == light_signals[position]
+
+
+@pytest.mark.parametrize("engine", ["numpy", "event"])
+def test_topology_changes_are_the_same_for_every_engine(engine):
+    if engine == "numpy":
+        pytest.importorskip("numpy")
+    models = [build_model(40, (4, 4), 5, 120, engine=name, seed=7) for name in ["object", engine]]
+    for num_roads, direction in changes(7):
+        for model in models:
+            model.set_num_roads(num_roads, direction)
+            for _ in range(15):
+                model.do_tick()
+        states = [live_state(model, model.roads) for model in models]
+        assert states[1] == states[0]
+
+
+def test_more_roads_than_offsets_are_refused():
+    model = build_model(20, (2, 2), 5, 120, seed=1)
+    for num_roads in [19, 30, -1]:
+        with pytest.raises(ValueError):
+            model.set_num_roads(num_roads, "vertical")
+    assert len(model.roads) == 4
+    # every offset between the edges can be used
+    model.set_num_roads(18, "vertical")
+    assert sorted(road.offset for road in model.roads if road.direction == "vertical") == list(range(1, 19))
+
+
+def test_roads_are_removed_in_the_given_order():
+    model = build_model(40, (5, 5), 5, 120, seed=2)
+    model.set_events(EventLog())
+    for _ in range(50):
+        model.do_tick()
+    roads = [model.roads[7], model.roads[2], model.roads[9], model.roads[2], model.roads[4]]
+    model.remove_roads(roads)
+    removed = [(road.direction, road.offset) for road in [roads[0], roads[1], roads[2], roads[4]]]
+    assert [event[2:4] for event in model.events.recent("road_removed")] == removed
+    # the remaining intersections are the ones of a full recalculation
+    incremental = topology(model)
+    model.calculate_intersection_light_signals()
+    assert topology(model) == incremental
+
+
+@pytest.mark.parametrize("engine", ["numpy", "event"])
+def test_recalculated_light_signals_are_the_same_for_every_engine(engine):
+    if engine == "numpy":
+        pytest.importorskip("numpy")
+    models = [build_model(40, (4, 4), 5, 120, engine=name, seed=3) for name in ["object", engine]]
+    for _ in range(4):
+        for model in models:
+            for _ in range(70):
+                model.do_tick()
+            # light signals start again at the current tick
+            model.calculate_intersection_light_signals()
+        for _ in range(45):
+            for model in models:
+                model.do_tick()
+        assert live_state(models[1], models[1].roads) == live_state(models[0], models[0].roads)
@@ -0,0 +1,77 @@
+"""
+Description: A simulation environment for car traffic with cellular automata
+The program encapsules four files: main.py, controller.py, model.py, view.py
+Author: Christian Tognazza
+Datum: 13.04.2023
+"""
+
+import pytest
+
+from headless import build_model
+
+pytest.importorskip("tkinter")
+from view import COLOR_MAP, View
+
+# the canvas items of the View always show the grid, a frame only configures the cells that changed
+
+
+class RecordingCanvas:
+    # offscreen stand-in for the tkinter canvas, keeps the colors of its rectangles
+    def __init__(self):
+        self.items = {}
+        self.created = 0
+        self.configured = 0
+
+    def delete(self, *items):
+        self.items = {}
+
+    def create_rectangle(self, *coordinates, **options):
+        self.created += 1
+        self.items[self.created] = (options["fill"], options["outline"])
+        return self.created
+
+    def itemconfig(self, item, **options):
+        self.configured += 1
+        self.items[item] = (options["fill"], options["outline"])
+
+
+def offscreen_view(size):
+    view = View.__new__(View)
+    view.size = size
+    view.cell_size = 1
+    view.cells = None
+    view.drawn = None
+    view.raster = RecordingCanvas()
+    return view
+
+
+def grid_colors(model):
+    return [(COLOR_MAP[value], COLOR_MAP[border_value])
+            for value, border_value in zip(model.grid, model.border_grid)]
+
+
+def test_frames_only_configure_the_changed_cells():
+    size = 40
+    model = build_model(size, (3, 3), 5, 120, render_grid=True, seed=4)
+    view = offscreen_view(size)
+    view.draw_grid(model.grid, model.border_grid, model.changed_cells)
+    colors = grid_colors(model)
+    assert view.raster.created == size * size
+
+    for tick in range(300):
+        # added and removed roads change road cells, the next frame checks every cell
+        if tick == 100:
+            model.set_num_roads(4, "vertical")
+        if tick == 200:
+            model.set_num_roads(1, "horizontal")
+        model.do_tick()
+
+        configured = view.raster.configured
+        view.draw_grid(model.grid, model.border_grid, model.changed_cells)
+        previous_colors, colors = colors, grid_colors(model)
+        assert [view.raster.items[item] for item in view.cells] == colors
+        assert view.raster.configured - configured == sum(
+            previous != current for previous, current in zip(previous_colors, colors))
+
+    # the rectangles are created once
+    assert view.raster.created == size * size
@@ -7,6 +7,8 @@ Datum: 13.04.2023
 
 from tkinter import *
 
+from raster import ppm_bytes
+
 # color map for rendering
 # need to be tkinter-compatible colors.
 COLOR_MAP = {
@@ -45,6 +47,14 @@ class View:
 
         self.width = SIMULATION_SIZE
         self.height = SIMULATION_SIZE
+        self.size = size
+
+        # canvas item ids of the cells and the (color, border) codes they show,
+        # cells are created once and only reconfigured afterwards
+        self.cells = None
+        self.drawn = None
+        # canvas text item of the instrumentation overlay, created on first use
+        self.overlay = None
 
         # create the canvas for drawing
         self.raster = Canvas(self.root, width=self.width, height=self.height)
@@ -162,18 +172,101 @@ class View:
         )
         self.s_generator_delay.grid(row=5, column=1)
 
+    # the sliders change the model, a replay has none
+    def disable_model_controls(self):
+        for scale in [self.s_num_vertical_roads, self.s_num_horizontal_roads,
+                      self.s_generator_avg_speed, self.s_generator_delay]:
+            scale.configure(state=DISABLED)
+
+    # create the controls of a replay: a slider to seek, play direction and speed
+    def add_replay_controls(self, first_tick, last_tick, speeds, handle_seek, handle_reverse,
+                            handle_replay_speed):
+        self.root.minsize(SIMULATION_SIZE, SIMULATION_SIZE + 270)
+        self.b_tick.configure(text="Step Tick")
+        self.b_start.configure(text="Play")
+        self.b_stop.configure(text="Pause")
+
+        self.l_replay_tick = Label(self.root, text="Replay Tick")
+        self.l_replay_tick.grid(row=6, column=0, columnspan=3)
+        self.replay_tick = IntVar()
+        self.replay_tick.set(first_tick)
+        self.s_replay_tick = Scale(
+            self.root,
+            from_=first_tick,
+            to=last_tick,
+            length=SIMULATION_SIZE - 20,
+            relief=GROOVE,
+            orient=HORIZONTAL,
+            variable=self.replay_tick,
+            command=lambda _: handle_seek(self.replay_tick.get())
+        )
+        self.s_replay_tick.grid(row=7, column=0, columnspan=3)
+
+        self.b_reverse = Button(
+            self.root,
+            text="Play Backwards",
+            command=handle_reverse
+        )
+        self.b_reverse.grid(row=8, column=0)
+
+        self.l_replay_speed = Label(self.root, text="Replay Speed")
+        self.l_replay_speed.grid(row=8, column=1)
+        self.replay_speed = IntVar()
+        self.replay_speed.set(speeds[0])
+        self.m_replay_speed = OptionMenu(
+            self.root,
+            self.replay_speed,
+            *speeds,
+            command=lambda _: handle_replay_speed(self.replay_speed.get())
+        )
+        self.m_replay_speed.grid(row=8, column=2)
+
+    # show the tick of the replay on its slider and the direction it plays in
+    def set_replay_tick(self, tick, backwards):
+        self.replay_tick.set(tick)
+        self.b_reverse.configure(
+            text="Play Forwards" if backwards else "Play Backwards")
+
     # draw a grid on the canvas
-    def draw_grid(self, grid, border_grid):
+    # grids are flat byte arrays indexed by x * size + y,
+    # changed_cells holds the indexes that changed since the last frame, None = all cells
+    def draw_grid(self, grid, border_grid, changed_cells=None):
+        if self.cells is None:
+            self.create_cells(grid, border_grid)
+            return
+
+        if changed_cells is None:
+            changed_cells = range(len(grid))
+
+        for cell in changed_cells:
+            value = grid[cell]
+            border_value = border_grid[cell]
+            if self.drawn[cell] == (value, border_value):
+                continue
+
+            self.raster.itemconfig(
+                self.cells[cell],
+                fill=COLOR_MAP[value],
+                outline=COLOR_MAP[border_value]
+            )
+            self.drawn[cell] = (value, border_value)
+
+    # create the canvas items of all cells once
+    def create_cells(self, grid, border_grid):
         self.raster.delete(ALL)
-        for x, row in enumerate(grid):
-            for y, value in enumerate(row):
-                self.draw_cell(
-                    x, y, COLOR_MAP[value], COLOR_MAP[border_grid[x][y]])
+        self.overlay = None
+        self.cells = []
+        self.drawn = []
+        for cell, value in enumerate(grid):
+            x, y = divmod(cell, self.size)
+            self.cells.append(self.draw_cell(
+                x, y, COLOR_MAP[value], COLOR_MAP[border_grid[cell]]))
+            self.drawn.append((value, border_grid[cell]))
 
     # draw a single cell on the canvas
 
     def draw_cell(self, x, y, color, border):
-        self.raster.create_rectangle(
+        return self.raster.create_rectangle(
             x*self.cell_size,
             y*self.cell_size,
             x*self.cell_size + self.cell_size,
@@ -182,3 +275,33 @@ class View:
             outline=border,
             width=self.cell_size / 10
         )
+
+    # draw lines of text in the upper left corner above the cells
+    def draw_overlay(self, lines):
+        text = "\n".join(lines)
+        if self.overlay is None:
+            self.overlay = self.raster.create_text(
+                4, 4, anchor=NW, fill="darkorange", font=("TkFixedFont", 8), text=text)
+            return
+
+        self.raster.itemconfig(self.overlay, text=text)
+        self.raster.tag_raise(self.overlay)
+
+
+# RasterView draws the whole grid as one image instead of a canvas item per cell
+# frame time depends on the number of pixels, not on the number of cells
+
+
+class RasterView(View):
+    # draw a grid as a single image, changed_cells is not needed
+    def draw_grid(self, grid, border_grid, changed_cells=None):
+        ppm = ppm_bytes(grid, border_grid, self.size, self.cell_size)
+        if self.cells is None:
+            self.raster.delete(ALL)
+            self.overlay = None
+            self.image = PhotoImage(
+                master=self.root, width=self.size * self.cell_size, height=self.size * self.cell_size)
+            self.cells = self.raster.create_image(
+                0, 0, anchor=NW, image=self.image)
+
+        self.image.configure(data=ppm, format="PPM")